@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import Dict, List, Optional
 
 class Settings:
     PROJECT_NAME: str = "NSE Stock Analyzer"
@@ -219,6 +219,112 @@ class Settings:
     "ZYDUSLIFE.NS",
     ]
 
+    # History & Local Bar Store
+    # HISTORY_PERIOD is only downloaded once per symbol to backfill the store;
+    # later cycles fetch bars newer than what is stored. Two years give the
+    # weekly and monthly timeframes LOOKBACK_BARS and 24 bars.
+    HISTORY_PERIOD: str = os.getenv("HISTORY_PERIOD", "2y")
+    LOOKBACK_BARS: int = int(os.getenv("LOOKBACK_BARS", "63"))
+    BAR_STORE_DIR: str = os.getenv(
+        "BAR_STORE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "bars")
+    )
+    # Bar interval: "1d" (stored daily bars) or an intraday "1m", "5m" or "15m".
+    # Intraday mode keeps the latest INTRADAY_BARS bars of each symbol in
+    # memory and computes the indicators on them; INTRADAY_HISTORY_PERIOD is
+    # the backfill on startup (Yahoo serves 1m bars for the last 7 days only).
+    BAR_INTERVAL: str = os.getenv("BAR_INTERVAL", "1d")
+    INTRADAY_BARS: int = int(os.getenv("INTRADAY_BARS", "150"))
+    INTRADAY_HISTORY_PERIOD: str = os.getenv("INTRADAY_HISTORY_PERIOD", "5d")
+
+    # Market Data Provider: "yfinance", "record" (yfinance + save responses) or "replay"
+    MARKET_DATA_PROVIDER: str = os.getenv("MARKET_DATA_PROVIDER", "yfinance")
+    MARKET_DATA_RECORD_DIR: str = os.getenv(
+        "MARKET_DATA_RECORD_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "recordings")
+    )
+    # Seconds per replayed call; unset replays the recorded latency
+    MARKET_DATA_REPLAY_LATENCY: Optional[float] = (
+        float(os.environ["MARKET_DATA_REPLAY_LATENCY"]) if os.getenv("MARKET_DATA_REPLAY_LATENCY") else None
+    )
+
+    # Published snapshots kept for `since=` delta responses (one per batch).
+    # They share unchanged records, so each costs about its indexes and columns.
+    SNAPSHOT_HISTORY: int = int(os.getenv("SNAPSHOT_HISTORY", "64"))
+    # Per-sector sums are updated by each batch and rebuilt from the records
+    # every this many batches, which bounds their floating-point drift
+    SECTOR_REBUILD_EVERY: int = int(os.getenv("SECTOR_REBUILD_EVERY", "256"))
+
+    # Streaming: pending updates kept per client before it is told to resync,
+    # and seconds between keep-alive comments
+    STREAM_QUEUE_SIZE: int = int(os.getenv("STREAM_QUEUE_SIZE", "16"))
+    STREAM_HEARTBEAT_SECONDS: float = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+    # Batch processing pool: "thread" or "process". Symbols are split across
+    # PROCESS_WORKERS workers by a stable hash, so each process worker keeps
+    # the incremental indicator state of the same symbols.
+    PROCESS_POOL: str = os.getenv("PROCESS_POOL", "thread")
+    PROCESS_WORKERS: int = int(os.getenv("PROCESS_WORKERS", "1"))
+
+    # Adaptive fetching: the batch size starts at FETCH_BATCH_SIZE and grows
+    # while downloads are healthy; the pause between batches shrinks towards
+    # FETCH_MIN_DELAY. Throttling halves the batch and backs off exponentially.
+    FETCH_BATCH_SIZE: int = int(os.getenv("FETCH_BATCH_SIZE", "50"))
+    FETCH_MAX_BATCH_SIZE: int = int(os.getenv("FETCH_MAX_BATCH_SIZE", "200"))
+    FETCH_MIN_DELAY: float = float(os.getenv("FETCH_MIN_DELAY", "0.5"))
+    FETCH_MAX_DELAY: float = float(os.getenv("FETCH_MAX_DELAY", "30"))
+    FETCH_MAX_BACKOFF: float = float(os.getenv("FETCH_MAX_BACKOFF", "300"))
+    # Hard cap on download requests, and the number allowed per refresh cycle
+    FETCH_REQUESTS_PER_SECOND: float = float(os.getenv("FETCH_REQUESTS_PER_SECOND", "0.5"))
+    FETCH_BURST: float = float(os.getenv("FETCH_BURST", "2"))
+    FETCH_CYCLE_BUDGET: int = int(os.getenv("FETCH_CYCLE_BUDGET", "40"))
+    # Attempts per batch before its symbols are skipped for the cycle
+    FETCH_MAX_ATTEMPTS: int = int(os.getenv("FETCH_MAX_ATTEMPTS", "4"))
+    # Refresh pipeline: downloads in flight at once, and batches buffered
+    # between the download, processing and publish stages
+    FETCH_CONCURRENCY: int = int(os.getenv("FETCH_CONCURRENCY", "2"))
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+
+    # Refresh schedule: "nse" follows the NSE session calendar, "always"
+    # refreshes as if the market were open (development, replays)
+    MARKET_SCHEDULE: str = os.getenv("MARKET_SCHEDULE", "nse")
+    # Trading holidays (IST dates) by year, from NSE's yearly holiday circular.
+    # A year without an entry here or in NSE_HOLIDAYS is scheduled on every
+    # weekday, with a warning and the stock_calendar_unlisted_year gauge; add
+    # each new year's list when NSE publishes it (usually in December).
+    NSE_HOLIDAYS_BY_YEAR: Dict[int, List[str]] = {
+        2026: [
+            "2026-01-26",  # Republic Day
+            "2026-03-03",  # Holi
+            "2026-03-26",  # Shri Ram Navami
+            "2026-03-31",  # Shri Mahavir Jayanti
+            "2026-04-03",  # Good Friday
+            "2026-04-14",  # Dr. Baba Saheb Ambedkar Jayanti
+            "2026-05-01",  # Maharashtra Day
+            "2026-05-28",  # Bakri Id
+            "2026-06-26",  # Muharram
+            "2026-09-14",  # Ganesh Chaturthi
+            "2026-10-02",  # Mahatma Gandhi Jayanti
+            "2026-10-20",  # Dussehra
+            "2026-11-10",  # Diwali Balipratipada
+            "2026-11-24",  # Prakash Gurpurb Sri Guru Nanak Dev
+            "2026-12-25",  # Christmas
+        ],
+    }
+    # Extra holidays, comma-separated; a year listed only here counts as known
+    NSE_HOLIDAYS: List[str] = [d.strip() for d in os.getenv("NSE_HOLIDAYS", "").split(",") if d.strip()]
+    # While open: hot symbols (watchlist, recently viewed, breakouts) and the rest
+    HOT_REFRESH_SECONDS: float = float(os.getenv("HOT_REFRESH_SECONDS", "15"))
+    REFRESH_INTERVAL_SECONDS: float = float(os.getenv("REFRESH_INTERVAL_SECONDS", "60"))
+    RECENT_VIEW_SECONDS: float = float(os.getenv("RECENT_VIEW_SECONDS", "900"))
+    # After the close, one more sweep picks up the settled closing bars
+    CLOSE_SETTLE_SECONDS: float = float(os.getenv("CLOSE_SETTLE_SECONDS", "300"))
+    CLOSED_POLL_SECONDS: float = float(os.getenv("CLOSED_POLL_SECONDS", "1800"))
+
+    # Screens (filter expressions, see app/services/screener.py)
+    SCREEN_PLAN_CACHE_SIZE: int = int(os.getenv("SCREEN_PLAN_CACHE_SIZE", "1024"))
+    MAX_SAVED_SCREENS: int = int(os.getenv("MAX_SAVED_SCREENS", "500"))
+    # Screens of one backtest request evaluated in parallel
+    BACKTEST_WORKERS: int = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+
     # Sector Mapping (Simplified for F&O)
     SECTOR_MAPPING = {
         "RELIANCE.NS": "Energy",
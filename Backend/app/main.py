@@ -1,8 +1,9 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.routes import stocks, watchlist
+from app.routes import stocks, watchlist, stream, screens, backtest, sectors
 from app.services.stocks import start_background_tasks
+from app.services.metrics import REGISTRY, RequestMetricsMiddleware, monitor_event_loop_lag
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
@@ -13,11 +14,14 @@ async def lifespan(app: FastAPI):
         import asyncio
         from app.services.stocks import refresh_market_data
         asyncio.create_task(refresh_market_data())
+        asyncio.create_task(monitor_event_loop_lag())
         print("Background task started", flush=True)
     except Exception as e:
         print(f"Failed to start background task: {e}", flush=True)
     yield
-    # Shutdown (if needed)
+    # Shutdown
+    from app.services.stocks import shutdown_executors
+    shutdown_executors()
 
 app = FastAPI(title="NSE Stock Analyzer", lifespan=lifespan)
 
@@ -28,12 +32,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Snapshot-Version"],
 )
 
+app.add_middleware(RequestMetricsMiddleware)
+
 # Routes
 app.include_router(stocks.router, prefix="/api/v1")
 app.include_router(watchlist.router, prefix="/api/v1")
+app.include_router(stream.router, prefix="/api/v1")
+app.include_router(screens.router, prefix="/api/v1")
+app.include_router(backtest.router, prefix="/api/v1")
+app.include_router(sectors.router, prefix="/api/v1")
 
 @app.get("/")
 async def root():
-    return {"message": "NSE Stock Analyzer API is running"}
\ No newline at end of file
+    return {"message": "NSE Stock Analyzer API is running"}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
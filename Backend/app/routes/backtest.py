@@ -0,0 +1,44 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
+from typing import List
+from app.schemas import BacktestResult
+from app.services.backtest import DEFAULT_HORIZONS, run_backtest
+from app.services.screener import SCREENS
+from app.services.stocks import get_history_columns
+from app.routes.stocks import check_screen
+
+router = APIRouter(prefix="/backtest", tags=["backtest"])
+
+MAX_SCREENS = 50
+MAX_HORIZON = 250
+
+def parse_horizons(horizons: str) -> List[int]:
+    try:
+        values = [int(h) for h in horizons.split(",") if h.strip()]
+    except ValueError:
+        values = []
+    if not values or not all(1 <= h <= MAX_HORIZON for h in values):
+        raise HTTPException(status_code=400, detail=f"horizons must be bar counts from 1 to {MAX_HORIZON}, e.g. 1,5,20")
+    return sorted(set(values))
+
+@router.get("/", response_model=List[BacktestResult])
+async def backtest(
+    screen: List[str] = Query([], description="Screen expressions to test; each one is a parameter set"),
+    saved: List[str] = Query([], description="Names of saved screens to test"),
+    horizons: str = Query(",".join(map(str, DEFAULT_HORIZONS)), description="Forward return horizons in bars")
+):
+    """Forward returns, hit rates and turnover of each screen over the stored history."""
+    horizon_list = parse_horizons(horizons)
+    screens = [check_screen(expression) for expression in screen]
+    for name in saved:
+        entry = SCREENS.get(name)
+        if not entry:
+            raise HTTPException(status_code=404, detail=f"Screen not found: {name}")
+        screens.append(entry.screen)
+    if not screens:
+        raise HTTPException(status_code=400, detail="Pass at least one screen= or saved=")
+    if len(screens) > MAX_SCREENS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SCREENS} screens per backtest")
+
+    history = await get_history_columns()
+    return await asyncio.to_thread(run_backtest, history, screens, horizon_list)
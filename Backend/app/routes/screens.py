@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Body, HTTPException, Path, Request
+from typing import List, Optional
+from app.schemas import ScreenResponse, ScreenSave, StockResponse
+from app.services.stocks import get_snapshot
+from app.services.screener import SCREENS, SavedScreen
+from app.routes.stocks import VIEW_QUERY, FIELDS_QUERY, check_projection, versioned_response
+from app.utils.filters import apply_filters
+from app.utils.serializers import dump_stocks
+
+router = APIRouter(prefix="/screens", tags=["screens"])
+
+NAME_PATH = Path(..., pattern=r"^[\w-]{1,64}$")
+
+def screen_response(saved: SavedScreen, matches: int) -> ScreenResponse:
+    return ScreenResponse(
+        name=saved.name, expression=saved.expression, fields=sorted(saved.screen.fields), matches=matches
+    )
+
+def get_saved(name: str) -> SavedScreen:
+    saved = SCREENS.get(name)
+    if not saved:
+        raise HTTPException(status_code=404, detail="Screen not found")
+    return saved
+
+@router.get("/", response_model=List[ScreenResponse])
+async def list_screens():
+    # Every saved screen is evaluated against the current snapshot
+    snapshot = await get_snapshot()
+    counts = SCREENS.counts(snapshot.columns)
+    return [screen_response(saved, counts[saved.name]) for saved in SCREENS.all()]
+
+@router.put("/{name}", response_model=ScreenResponse)
+async def save_screen(name: str = NAME_PATH, item: ScreenSave = Body(...)):
+    try:
+        saved = SCREENS.save(name, item.expression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid screen: {e}")
+    snapshot = await get_snapshot()
+    return screen_response(saved, int(saved.screen.mask(snapshot.columns).sum()))
+
+@router.delete("/{name}")
+async def delete_screen(name: str = NAME_PATH):
+    if not SCREENS.delete(name):
+        raise HTTPException(status_code=404, detail="Screen not found")
+    return {"status": "success"}
+
+@router.get("/{name}/stocks", response_model=List[StockResponse])
+async def get_screen_stocks(
+    request: Request,
+    name: str = NAME_PATH,
+    sort_by: Optional[str] = None,
+    sort_dir: str = "asc",
+    view: str = VIEW_QUERY,
+    fields: Optional[str] = FIELDS_QUERY
+):
+    check_projection(view, fields)
+    saved = get_saved(name)
+    snapshot = await get_snapshot()
+
+    def build() -> bytes:
+        # One mask over the snapshot's columns, which carry the snapshot's ranks
+        stocks = apply_filters(
+            snapshot.records, screen=saved.screen, sort_by=sort_by, sort_dir=sort_dir,
+            columns=snapshot.columns, ranks=snapshot.ranks
+        )
+        return dump_stocks(stocks, view, fields, snapshot.ranks)
+
+    # Saving the name again changes the result without changing the URL
+    return await versioned_response(request, snapshot, build, tag=f"-s{saved.revision}")
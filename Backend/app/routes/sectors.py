@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Request
+from app.schemas import SectorsResponse
+from app.services.stocks import get_snapshot
+from app.routes.stocks import versioned_response
+from app.utils.serializers import dump_sectors
+
+router = APIRouter(prefix="/sectors", tags=["sectors"])
+
+@router.get("/", response_model=SectorsResponse)
+async def get_sectors(request: Request):
+    """Per-sector and market-wide averages and breadth, from the sums kept with each snapshot."""
+    snapshot = await get_snapshot()
+    return await versioned_response(request, snapshot, lambda: dump_sectors(snapshot.sectors))
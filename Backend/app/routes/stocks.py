@@ -1,14 +1,159 @@
-from fastapi import APIRouter, Query, HTTPException, BackgroundTasks
-from typing import List, Optional
-from app.schemas import StockResponse
-from app.services.stocks import get_fno_data, get_stock_detail
+import secrets
+from fastapi import APIRouter, Query, HTTPException, BackgroundTasks, Request, Response
+from typing import Callable, List, Optional, Sequence, Set, Union
+from urllib.parse import urlencode
+from app.schemas import StockResponse, ChartDataPoint, ChartColumns, StockDelta
+from app.services.stocks import get_snapshot, get_snapshot_at, get_changes_since, get_timeframe_snapshot
+from app.services.timeframes import timeframes_for
+from app.services.engine import MIN_BARS
+from app.services.snapshot import Snapshot
+from app.services.screener import Screen, compile_screen
+from app.services.cache import response_cache
+from app.services.schedule import record_view
+from app.services import metrics
 from app.config import settings
 from app.utils.filters import apply_filters
+from app.utils.serializers import dump_stocks, dump_stock, dump_chart, dump_delta, stock_projection
 
 router = APIRouter(prefix="/stocks", tags=["stocks"])
 
-@router.get("/fno", response_model=List[StockResponse])
+# view=summary leaves out chart_data; fields= selects top-level or dotted
+# fields (e.g. "current_price,indicators.rsi_value") and overrides view.
+VIEW_QUERY = Query("full", pattern="^(full|summary)$")
+FIELDS_QUERY = Query(None, description="Comma-separated fields to return, e.g. current_price,indicators.rsi_value")
+# since= is the X-Snapshot-Version of the client's last response
+SINCE_QUERY = Query(None, ge=0, description="Return only the records changed after this snapshot version")
+TIMEFRAME_QUERY = Query(None, description="Resample the bars to a coarser timeframe, e.g. 1w or 1mo (daily mode)")
+SCREEN_QUERY = Query(None, description="Filter expression, e.g. rsi < 30 and is_high_volume and price > ema_50")
+
+def json_response(content: bytes) -> Response:
+    return Response(content=content, media_type="application/json")
+
+# --- Versioned Responses ---
+
+# Distinguishes this process, so an ETag from before a restart never matches
+# a new snapshot that happens to reuse the same version number.
+BOOT_ID = secrets.token_hex(4)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/"x" matches "x"."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+async def versioned_response(
+    request: Request, snapshot: Snapshot, build: Callable[[], bytes], tag: str = ""
+) -> Response:
+    """
+    JSON for `snapshot`. `build` runs at most once per snapshot version and
+    URL; a client already holding this version gets a 304. `tag` tells
+    apart responses whose content also depends on state outside the URL.
+    """
+    version = snapshot.version
+    etag = f'"{BOOT_ID}-{version}{tag}"'
+    # Clients must revalidate, since a new snapshot is published every cycle
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Snapshot-Version": str(version)}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    key = f"{request.url.path}?{urlencode(sorted(request.query_params.multi_items()))}{tag}"
+    def build_and_measure() -> bytes:
+        content = build()
+        route = request.scope.get("route")
+        metrics.RESPONSE_BYTES.observe(len(content), route=getattr(route, "path", request.url.path))
+        return content
+
+    content = response_cache.get_or_set(version, key, build_and_measure)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+async def list_response(
+    request: Request,
+    snapshot: Snapshot,
+    select: Callable[[Snapshot], Sequence[StockResponse]],
+    view: str,
+    fields: Optional[str],
+    since: Optional[int],
+    track_changes: bool = True
+) -> Response:
+    """
+    The records `select` chooses from `snapshot`, or with `since` a
+    StockDelta against what it chose from the snapshot of that version:
+    records that changed or entered the selection, and the symbols that left
+    it. Selections such as top-k lists or screens with avg() move when other
+    symbols change, so both ends are selected rather than inferred from the
+    changed symbols. Falls back to the full list when `since` is no longer
+    kept, or for snapshots whose history is not kept (`track_changes=False`).
+    """
+    if since is None:
+        return await versioned_response(
+            request, snapshot, lambda: dump_stocks(select(snapshot), view, fields, snapshot.ranks)
+        )
+
+    version = snapshot.version
+    previous: Optional[Snapshot] = None
+    changed: Optional[Set[str]] = None
+    if since == version:
+        previous, changed = snapshot, set()
+    elif track_changes:
+        previous = await get_snapshot_at(since)
+        changed = await get_changes_since(since, version) if previous is not None else None
+
+    def build() -> bytes:
+        stocks = select(snapshot)
+        if changed is None:
+            delta = StockDelta.model_construct(version=version, full=True, upserts=list(stocks), removed=[])
+        else:
+            selected = {stock.symbol for stock in stocks}
+            had = selected if previous is snapshot else {stock.symbol for stock in select(previous)}
+            delta = StockDelta.model_construct(
+                version=version,
+                full=False,
+                upserts=[stock for stock in stocks if stock.symbol in changed or stock.symbol not in had],
+                removed=sorted(had - selected)
+            )
+        return dump_delta(delta, view, fields, snapshot.ranks)
+
+    return await versioned_response(request, snapshot, build)
+
+def check_projection(view: str, fields: Optional[str]):
+    try:
+        stock_projection(view, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def check_screen(screen: Optional[str]) -> Optional[Screen]:
+    try:
+        return compile_screen(screen) if screen else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid screen: {e}")
+
+def check_timeframe(timeframe: Optional[str]):
+    if timeframe is not None and timeframe != settings.BAR_INTERVAL and timeframe not in timeframes_for(settings.BAR_INTERVAL):
+        allowed = ", ".join([settings.BAR_INTERVAL] + timeframes_for(settings.BAR_INTERVAL))
+        raise HTTPException(status_code=400, detail=f"Unknown timeframe: {timeframe} (available: {allowed})")
+
+async def timeframe_snapshot(timeframe: str) -> Snapshot:
+    """
+    The snapshot resampled to `timeframe`; a 400 instead of an empty list
+    when no published symbol has MIN_BARS bars in it.
+    """
+    snapshot = await get_timeframe_snapshot(timeframe)
+    if not snapshot.records and (await get_snapshot()).records:
+        # Daily history is as long as the backfill, intraday history as the rings
+        if settings.BAR_INTERVAL == "1d":
+            history = f"HISTORY_PERIOD={settings.HISTORY_PERIOD}"
+        else:
+            history = f"INTRADAY_BARS={settings.INTRADAY_BARS}"
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insufficient history for timeframe {timeframe}: no symbol has {MIN_BARS} bars ({history})"
+        )
+    return snapshot
+
+@router.get("/fno", response_model=Union[List[StockResponse], StockDelta])
 async def get_fno_stocks(
+    request: Request,
     search: Optional[str] = None,
     sector: Optional[str] = None,
     min_price: Optional[float] = None,
@@ -29,62 +174,110 @@ async def get_fno_stocks(
     macd_status: Optional[str] = None,
     rsi_zone: Optional[str] = None,
     strength: Optional[str] = None,
+    screen: Optional[str] = SCREEN_QUERY,
     sort_by: Optional[str] = None,
-    sort_dir: str = "asc"
+    sort_dir: str = "asc",
+    view: str = VIEW_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    since: Optional[int] = SINCE_QUERY,
+    timeframe: Optional[str] = TIMEFRAME_QUERY
+):
+    check_projection(view, fields)
+    check_timeframe(timeframe)
+    # Parsed once per distinct expression, then taken from the plan cache
+    compiled = check_screen(screen)
+
+    # Instant fetch from cache; other timeframes are resampled from the stored bars
+    resampled = timeframe not in (None, settings.BAR_INTERVAL)
+    snapshot = await timeframe_snapshot(timeframe) if resampled else await get_snapshot()
+
+    # Apply filters in-memory on the columnar snapshot (fast); runs once per snapshot version and query
+    def select(snapshot: Snapshot) -> Sequence[StockResponse]:
+        # Without sort_by results keep the cache order, which is already by Rank (Stability)
+        return apply_filters(
+            snapshot.records,
+            search=search,
+            sector=sector,
+            min_price=min_price,
+            max_price=max_price,
+            min_volume=min_volume,
+            max_volume=max_volume,
+            min_change_pct=min_change_pct,
+            max_change_pct=max_change_pct,
+            min_avg_3day_pct=min_avg_3day_pct,
+            max_avg_3day_pct=max_avg_3day_pct,
+            min_volatility=min_volatility,
+            max_volatility=max_volatility,
+            max_rank=max_rank,
+            constant_only=constant_only,
+            gainers_only=gainers_only,
+            losers_only=losers_only,
+            high_volume_only=high_volume_only,
+            macd_status=macd_status,
+            rsi_zone=rsi_zone,
+            strength=strength,
+            screen=compiled,
+            sort_by=sort_by,
+            sort_dir=sort_dir,
+            columns=snapshot.columns,
+            ranks=snapshot.ranks
+        )
+
+    # Deltas are only tracked for the base timeframe
+    return await list_response(request, snapshot, select, view, fields, since, track_changes=not resampled)
+
+@router.get("/gainers-3day", response_model=Union[List[StockResponse], StockDelta])
+async def get_gainers_3day(
+    request: Request,
+    limit: int = 20,
+    view: str = VIEW_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    since: Optional[int] = SINCE_QUERY
 ):
-    # Instant fetch from cache
-    stocks = await get_fno_data()
-    
-    # Apply filters in-memory (fast)
-    filtered_stocks = apply_filters(
-        stocks,
-        search=search,
-        sector=sector,
-        min_price=min_price,
-        max_price=max_price,
-        min_volume=min_volume,
-        max_volume=max_volume,
-        min_change_pct=min_change_pct,
-        max_change_pct=max_change_pct,
-        min_avg_3day_pct=min_avg_3day_pct,
-        max_avg_3day_pct=max_avg_3day_pct,
-        min_volatility=min_volatility,
-        max_volatility=max_volatility,
-        max_rank=max_rank,
-        constant_only=constant_only,
-        gainers_only=gainers_only,
-        losers_only=losers_only,
-        high_volume_only=high_volume_only,
-        macd_status=macd_status,
-        rsi_zone=rsi_zone,
-        strength=strength,
-        sort_by=sort_by,
-        sort_dir=sort_dir
+    check_projection(view, fields)
+    snapshot = await get_snapshot()
+    # Top-k by avg_3_day_change_pct descending, from the precomputed order
+    return await list_response(
+        request, snapshot, lambda snapshot: snapshot.columns.top("avg_3day", "desc", limit), view, fields, since
     )
-    
-    # Ensure default sort is by Rank (Stability) if no sort specified
-    if not sort_by:
-        filtered_stocks.sort(key=lambda x: x.rank)
-        
-    return filtered_stocks
-
-@router.get("/gainers-3day", response_model=List[StockResponse])
-async def get_gainers_3day(limit: int = 20):
-    stocks = await get_fno_data()
-    # Sort by avg_3_day_change_pct descending
-    sorted_stocks = sorted(stocks, key=lambda x: x.history.avg_3_day_change_pct, reverse=True)
-    return sorted_stocks[:limit]
-
-@router.get("/losers-3day", response_model=List[StockResponse])
-async def get_losers_3day(limit: int = 20):
-    stocks = await get_fno_data()
-    # Sort by avg_3_day_change_pct ascending
-    sorted_stocks = sorted(stocks, key=lambda x: x.history.avg_3_day_change_pct)
-    return sorted_stocks[:limit]
+
+@router.get("/losers-3day", response_model=Union[List[StockResponse], StockDelta])
+async def get_losers_3day(
+    request: Request,
+    limit: int = 20,
+    view: str = VIEW_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    since: Optional[int] = SINCE_QUERY
+):
+    check_projection(view, fields)
+    snapshot = await get_snapshot()
+    # Top-k by avg_3_day_change_pct ascending, from the precomputed order
+    return await list_response(
+        request, snapshot, lambda snapshot: snapshot.columns.top("avg_3day", "asc", limit), view, fields, since
+    )
+
+# format=columns returns one list per field instead of one object per point
+@router.get("/{symbol}/chart", response_model=Union[List[ChartDataPoint], ChartColumns])
+async def get_stock_chart(
+    request: Request,
+    symbol: str,
+    chart_format: str = Query("points", alias="format", pattern="^(points|columns)$")
+):
+    snapshot = await get_snapshot()
+    stock = snapshot.get(symbol)
+    if not stock:
+        raise HTTPException(status_code=404, detail="Stock not found")
+    # Only symbols that exist become hot
+    record_view(symbol)
+    return await versioned_response(request, snapshot, lambda: dump_chart(stock.chart, chart_format))
 
 @router.get("/{symbol}", response_model=StockResponse)
-async def get_stock(symbol: str):
-    stock = await get_stock_detail(symbol)
+async def get_stock(request: Request, symbol: str, view: str = VIEW_QUERY, fields: Optional[str] = FIELDS_QUERY):
+    check_projection(view, fields)
+    snapshot = await get_snapshot()
+    stock = snapshot.get(symbol)
     if not stock:
         raise HTTPException(status_code=404, detail="Stock not found")
-    return stock
+    # Only symbols that exist become hot
+    record_view(symbol)
+    return await versioned_response(request, snapshot, lambda: dump_stock(stock, view, fields, snapshot.ranks))
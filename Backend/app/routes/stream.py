@@ -0,0 +1,46 @@
+import asyncio
+from fastapi import APIRouter, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.config import settings
+from app.services.stocks import get_cache_version
+from app.services.stream import Subscriber, broadcaster, format_event
+
+router = APIRouter(prefix="/stream", tags=["stream"])
+
+@router.get("")
+async def stream_updates(
+    request: Request,
+    scope: str = Query("all", pattern="^(all|sector|watchlist)$"),
+    sector: Optional[str] = None
+):
+    """
+    Server-Sent Events: "hello" with the current version, then one "update"
+    per published batch that touches the subscription. After "resync" the
+    client should reload with since=<version>.
+    """
+    try:
+        subscriber = Subscriber(scope, sector)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        broadcaster.subscribe(subscriber)
+        try:
+            version = await get_cache_version()
+            yield format_event("hello", {"version": version}, version)
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), settings.STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield b": keep-alive\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,22 +1,22 @@
 from fastapi import APIRouter, HTTPException, Body
-from typing import List
+from typing import List, Optional
 from app.schemas import StockResponse, WatchlistAdd, WatchlistResponse
-from app.services.stocks import get_stocks_by_symbols
-from app.services.cache import cache
+from app.services.stocks import get_snapshot
+from app.services.cache import cache, WATCHLIST_KEY
+from app.routes.stocks import VIEW_QUERY, FIELDS_QUERY, json_response, check_projection
+from app.utils.serializers import dump_stocks
 
 router = APIRouter(prefix="/watchlist", tags=["watchlist"])
 
-# Simple in-memory watchlist for demo (per user session ideally, but global here)
-WATCHLIST_KEY = "user_watchlist"
-
 @router.get("/", response_model=List[StockResponse])
-async def get_watchlist():
+async def get_watchlist(view: str = VIEW_QUERY, fields: Optional[str] = FIELDS_QUERY):
+    check_projection(view, fields)
     symbols = cache.get(WATCHLIST_KEY) or []
     if not symbols:
         return []
         
-    stocks = await get_stocks_by_symbols(symbols)
-    return stocks
+    snapshot = await get_snapshot()
+    return json_response(dump_stocks(snapshot.select(symbols), view, fields, snapshot.ranks))
 
 @router.post("/")
 async def update_watchlist(item: WatchlistAdd):
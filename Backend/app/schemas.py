@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr, SerializationInfo, field_serializer
 from typing import List, Optional
 from datetime import datetime
+from app.services.charts import ChartSeries
 
 class StockBase(BaseModel):
     symbol: str
@@ -63,12 +64,60 @@ class ChartDataPoint(BaseModel):
     ema_20: Optional[float] = None
     ema_50: Optional[float] = None
 
-class StockResponse(StockBase):
+class StockSummary(StockBase):
+    # Not stored per record (it stays 0): a stock's rank changes whenever
+    # others move, so it belongs to the snapshot. Serializers render it from
+    # the snapshot's `ranks` passed as serialization context, and filters and
+    # sorts read it from the same mapping or the snapshot's columns.
     rank: int
     history: StockHistory
     indicators: Indicators
     flags: StockFlags
+
+    @field_serializer("rank")
+    def serialize_rank(self, rank: int, info: SerializationInfo) -> int:
+        ranks = info.context.get("ranks") if info.context else None
+        return ranks.get(self.symbol, rank) if ranks else rank
+
+class StockResponse(StockSummary):
     chart_data: List[ChartDataPoint] = []
+    # Records built from bars keep their chart as a ChartSeries (column arrays)
+    # rather than per-point models; chart_data is rendered from it on output.
+    _chart: Optional[ChartSeries] = PrivateAttr(default=None)
+
+    @property
+    def chart(self) -> ChartSeries:
+        return self._chart if self._chart is not None else ChartSeries.empty()
+
+    def with_chart(self, chart: ChartSeries) -> "StockResponse":
+        """Attaches `chart` to a record that is being built; returns the record."""
+        self._chart = chart
+        return self
+
+    @field_serializer("chart_data")
+    def serialize_chart_data(self, chart_data: List[ChartDataPoint]):
+        return self._chart.points() if self._chart is not None else chart_data
+
+class ChartColumns(BaseModel):
+    """A chart in columnar form: one list per field, index k is the k-th bar."""
+    date: List[str]
+    open: List[float]
+    high: List[float]
+    low: List[float]
+    close: List[float]
+    volume: List[int]
+    macd: List[Optional[float]]
+    signal: List[Optional[float]]
+    hist: List[Optional[float]]
+    rsi: List[Optional[float]]
+    ema_20: List[Optional[float]]
+    ema_50: List[Optional[float]]
+
+class StockDelta(BaseModel):
+    version: int
+    full: bool  # True when `upserts` is the complete list (client too far behind)
+    upserts: List[StockResponse]
+    removed: List[str]
 
 class WatchlistAdd(BaseModel):
     symbol: str
@@ -76,3 +125,46 @@ class WatchlistAdd(BaseModel):
 
 class WatchlistResponse(BaseModel):
     watchlist: List[StockResponse]
+
+class ScreenSave(BaseModel):
+    expression: str
+
+class ScreenResponse(BaseModel):
+    name: str
+    expression: str
+    fields: List[str]  # Record fields the expression reads
+    matches: int  # Matching stocks in the current snapshot
+
+class BacktestHorizon(BaseModel):
+    horizon: int  # Bars after the selection date
+    observations: int  # Selections (date, stock) whose forward return is known
+    # Equal-weight forward return of the selection, averaged over the dates with one
+    mean_return_pct: Optional[float] = None
+    # The same for every eligible stock, over the same dates
+    benchmark_return_pct: Optional[float] = None
+    excess_return_pct: Optional[float] = None
+    hit_rate: Optional[float] = None  # Share of selections with a positive forward return
+
+class BacktestResult(BaseModel):
+    screen: str
+    start: Optional[str] = None
+    end: Optional[str] = None
+    dates: int  # Dates with at least one eligible stock
+    avg_selected: float  # Stocks selected per date
+    turnover: Optional[float] = None  # Share of the portfolio replaced per date, 0 to 1
+    horizons: List[BacktestHorizon]
+
+class SectorSummary(BaseModel):
+    sector: str
+    stocks: int
+    avg_change_pct: Optional[float] = None
+    avg_3_day_change_pct: Optional[float] = None
+    # Breadth: % of the sector's stocks up today, in an uptrend, on high volume
+    gainers_pct: Optional[float] = None
+    uptrend_pct: Optional[float] = None
+    high_volume_pct: Optional[float] = None
+    avg_buyer_strength: Optional[float] = None
+
+class SectorsResponse(BaseModel):
+    market: SectorSummary  # Every stock, as sector "All"
+    sectors: List[SectorSummary]
@@ -0,0 +1,287 @@
+"""
+Historical backtest of screens on a dates x symbols grid.
+
+`HistoryColumns` lines the stored bars of every symbol up on one calendar
+and computes, for every date at once, what each record's fields would have
+been after that bar: the engine's indicator kernels run over the whole
+history, and statuses, strength scores, flags and the stability rank are
+derived with the same rules as the live records. It offers the `field` and
+`size` of StockColumns, so a compiled screen evaluates into one
+(dates, symbols) mask instead of one mask per day.
+
+Forward returns of the selection are then compared with the eligible
+universe on the same dates. Differences from the live records: indicators
+are not re-seeded on a LOOKBACK_BARS window at each date (EMAs run from the
+first stored bar), values are not rounded, market_cap is unknown (NaN), and
+a symbol missing a date has NaN changes around it.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Mapping, NamedTuple, Sequence, Tuple
+import numpy as np
+from app.config import settings
+from app.schemas import BacktestHorizon, BacktestResult
+from app.services.columns import RECORD_FIELDS, Categorical
+from app.services.engine import (
+    MIN_BARS, OHLCV_FIELDS, compute_indicators, macd_status_vector, rsi_status_vector, strength_vector, trend_vector
+)
+from app.services.screener import Screen
+
+# Bars ahead for which forward returns are reported by default
+DEFAULT_HORIZONS = (1, 5, 20)
+
+def _shift(matrix: np.ndarray, bars: int) -> np.ndarray:
+    """Each row replaced by the row `bars` earlier; NaN at the top."""
+    out = np.full_like(matrix, np.nan)
+    if bars < len(matrix):
+        out[bars:] = matrix[:len(matrix) - bars]
+    return out
+
+def _rolling_nanmean(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean of the present values among each row and the `window - 1` before it."""
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0.0), axis=0)
+    counts = np.cumsum(present, axis=0)
+    sums[window:] -= sums[:-window].copy()
+    counts[window:] -= counts[:-window].copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def _rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """Max of the present values among each row and the `window - 1` before it."""
+    padded = np.vstack([np.full((window - 1, values.shape[1]), np.nan), values])
+    return np.fmax.reduce(np.lib.stride_tricks.sliding_window_view(padded, window, axis=0), axis=-1)
+
+def _labels(values: np.ndarray, labels: Sequence[str]) -> Categorical:
+    """A Categorical with 2-D codes for a string matrix whose values are among `labels`."""
+    column = Categorical(labels)
+    column.codes = np.full(values.shape, -1, dtype=np.int32)
+    for code, label in enumerate(labels):
+        column.codes[values == label] = code
+    return column
+
+class Forward(NamedTuple):
+    # Eligible (date, symbol) cells whose forward return is known
+    known: np.ndarray
+    # % returns, 0 where not known
+    returns: np.ndarray
+    positive: np.ndarray
+    # Equal-weight return of every known cell per date (NaN for none)
+    benchmark: np.ndarray
+
+class HistoryColumns:
+    """
+    Every RECORD_FIELDS field at every date as a (dates, symbols) matrix;
+    row t holds what the symbols' records would have held after bar t.
+    """
+
+    def __init__(self, bars: Mapping[str, np.ndarray]):
+        """`bars` maps each symbol to its date-sorted BAR_DTYPE records."""
+        self.symbols = [symbol for symbol, records in bars.items() if len(records)]
+        self.dates = (
+            np.unique(np.concatenate([bars[symbol]["date"] for symbol in self.symbols])) if self.symbols
+            else np.empty(0, dtype="datetime64[ns]")
+        )
+        # The shape of a mask, where StockColumns has its length
+        self.size = (len(self.dates), len(self.symbols))
+
+        self.matrices = {field: np.full(self.size, np.nan) for field in OHLCV_FIELDS}
+        for j, symbol in enumerate(self.symbols):
+            records = bars[symbol]
+            rows = np.searchsorted(self.dates, records["date"])
+            for field in OHLCV_FIELDS:
+                self.matrices[field][rows, j] = records[field]
+        self.indicators = compute_indicators(self.matrices)
+
+        # A symbol counts from its MIN_BARS-th bar on, like the live records
+        present = ~np.isnan(self.matrices["Close"])
+        self.eligible = present & (np.cumsum(present, axis=0) >= MIN_BARS)
+        self.fields: Dict[str, object] = {}
+        self._forward: Dict[int, Forward] = {}
+
+    def field(self, path: str):
+        """Matrix of a RECORD_FIELDS path, built on first use; strings are Categoricals with 2-D codes."""
+        column = self.fields.get(path)
+        if column is None:
+            column = self.fields[path] = FIELD_BUILDERS[path](self)
+        return column
+
+    def forward(self, horizon: int) -> "Forward":
+        """Forward returns `horizon` bars (rows) ahead, with what every screen shares of them."""
+        forward = self._forward.get(horizon)
+        if forward is None:
+            closes = self.matrices["Close"]
+            returns = np.full_like(closes, np.nan)
+            if horizon < len(closes):
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    returns[:-horizon] = (closes[horizon:] / closes[:-horizon] - 1) * 100
+            known = self.eligible & ~np.isnan(returns)
+            filled = np.where(known, returns, 0.0)
+            n_known = known.sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                benchmark = filled.sum(axis=1) / n_known
+            forward = self._forward[horizon] = Forward(known, filled, filled > 0, benchmark)
+        return forward
+
+    # --- Derived Fields ---
+
+    def closes(self, bars_ago: int) -> np.ndarray:
+        return _shift(self.matrices["Close"], bars_ago)
+
+    def day_change(self, day: int) -> np.ndarray:
+        """Change % of the `day`-th latest bar (1 is the current one)."""
+        newer, older = self.closes(day - 1), self.closes(day)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (newer - older) / older * 100
+
+    def avg_volume(self) -> np.ndarray:
+        # Live records average the volume over their LOOKBACK_BARS window
+        return self.field("_avg_volume")
+
+    def strength(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.field("_strength")
+
+    def per_symbol(self, values: List[str]) -> Categorical:
+        column = Categorical(values)
+        column.codes = np.broadcast_to(column.codes, self.size)
+        return column
+
+def _rank(columns: HistoryColumns) -> np.ndarray:
+    # Stability rank among the eligible symbols of each date, on the rounded
+    # 3-day average like the live ranking; ties keep symbol order
+    score = np.abs(np.round(columns.field("history.avg_3_day_change_pct"), 2))
+    score = np.where(np.isnan(score), np.inf, score)
+    order = np.lexsort((np.broadcast_to(np.arange(columns.size[1]), columns.size), score, ~columns.eligible), axis=-1)
+    ranks = np.empty(columns.size)
+    np.put_along_axis(ranks, order, np.arange(1, columns.size[1] + 1, dtype=np.float64)[None, :], axis=-1)
+    return np.where(columns.eligible, ranks, np.nan)
+
+def _strength(columns: HistoryColumns) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    m, ind = columns.matrices, columns.indicators
+    with np.errstate(invalid="ignore"):
+        return strength_vector(
+            ind["hist"], ind["rsi"], m["Volume"], columns.avg_volume(), m["Close"],
+            ind["ema_20"], m["Close"], m["High"], m["Low"]
+        )
+
+def _volatility(columns: HistoryColumns) -> np.ndarray:
+    days = np.stack([columns.field(f"history.day_{k}_change_pct") for k in (1, 2, 3)])
+    return np.std(days, axis=0)
+
+def _high_volume(columns: HistoryColumns) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        return columns.matrices["Volume"] > columns.avg_volume() * 1.5
+
+FIELD_BUILDERS: Dict[str, Callable[[HistoryColumns], object]] = {
+    "symbol": lambda c: c.per_symbol(c.symbols),
+    "name": lambda c: c.per_symbol(c.symbols),
+    "sector": lambda c: c.per_symbol([settings.SECTOR_MAPPING.get(s, "Unknown") for s in c.symbols]),
+    "current_price": lambda c: c.matrices["Close"],
+    "previous_close": lambda c: c.closes(1),
+    "current_change_abs": lambda c: c.matrices["Close"] - c.closes(1),
+    "current_change_pct": lambda c: c.day_change(1),
+    "day_high": lambda c: c.matrices["High"],
+    "day_low": lambda c: c.matrices["Low"],
+    "volume": lambda c: c.matrices["Volume"],
+    "market_cap": lambda c: np.full(c.size, np.nan),
+    "rank": _rank,
+    "history.day_1_change_pct": lambda c: c.day_change(1),
+    "history.day_2_change_pct": lambda c: c.day_change(2),
+    "history.day_3_change_pct": lambda c: c.day_change(3),
+    "history.avg_3_day_change_pct": lambda c: sum(c.field(f"history.day_{k}_change_pct") for k in (1, 2, 3)) / 3,
+    "history.volatility_3_day": _volatility,
+    "indicators.macd_line": lambda c: c.indicators["macd"],
+    "indicators.signal_line": lambda c: c.indicators["signal"],
+    "indicators.macd_histogram": lambda c: c.indicators["hist"],
+    "indicators.macd_status": lambda c: _labels(
+        macd_status_vector(c.indicators["macd"], c.indicators["signal"]), ("above_zero", "below_zero", "near_zero")
+    ),
+    "indicators.rsi_value": lambda c: c.indicators["rsi"],
+    "indicators.rsi_status": lambda c: _labels(rsi_status_vector(c.indicators["rsi"]), ("overbought", "oversold", "neutral")),
+    "indicators.sma_20": lambda c: c.indicators["sma_20"],
+    "indicators.sma_50": lambda c: c.indicators["sma_50"],
+    "indicators.ema_20": lambda c: c.indicators["ema_20"],
+    "indicators.ema_50": lambda c: c.indicators["ema_50"],
+    "indicators.trend": lambda c: _labels(
+        trend_vector(c.matrices["Close"], c.indicators["ema_20"], c.indicators["ema_50"]), ("uptrend", "downtrend", "sideways")
+    ),
+    "indicators.buyer_strength_score": lambda c: c.strength()[0],
+    "indicators.seller_strength_score": lambda c: c.strength()[1],
+    "indicators.strength_label": lambda c: _labels(c.strength()[2], ("buyers", "sellers", "balanced")),
+    "flags.is_constant_price": lambda c: np.abs(c.field("history.avg_3_day_change_pct")) < 0.0001,
+    "flags.is_gainer_today": lambda c: c.day_change(1) > 0,
+    "flags.is_loser_today": lambda c: c.day_change(1) < 0,
+    "flags.is_high_volume": _high_volume,
+    "flags.is_breakout_candidate": lambda c: (c.matrices["Close"] > _rolling_max(c.matrices["High"], 20)) & c.field("flags.is_high_volume"),
+    # Intermediates shared by several fields
+    "_avg_volume": lambda c: _rolling_nanmean(c.matrices["Volume"], settings.LOOKBACK_BARS),
+    "_strength": _strength,
+}
+assert set(RECORD_FIELDS) <= set(FIELD_BUILDERS), "Every record field needs a history"
+
+# --- Evaluation ---
+
+def _date_label(date: np.datetime64) -> str:
+    # Daily bars as dates, intraday bars with their time
+    day = date.astype("datetime64[D]")
+    return str(day) if date == day else np.datetime_as_string(date, unit="m")
+
+def _mean(values: np.ndarray):
+    return float(np.mean(values)) if len(values) else None
+
+def evaluate(columns: HistoryColumns, screen: Screen, horizons: Sequence[int]) -> BacktestResult:
+    """Forward returns, hit rates and turnover of an equal-weight portfolio of the stocks `screen` selects each date."""
+    selected = screen.mask(columns) & columns.eligible
+    counts = selected.sum(axis=1)
+    active = np.flatnonzero(columns.eligible.any(axis=1))
+
+    results = []
+    for horizon in horizons:
+        forward = columns.forward(horizon)
+        picked = selected & forward.known
+        n_picked = picked.sum(axis=1)
+        days = n_picked > 0
+        portfolio = (forward.returns * picked).sum(axis=1)[days] / n_picked[days]
+        mean, base = _mean(portfolio), _mean(forward.benchmark[days])
+        observations = int(n_picked.sum())
+        results.append(BacktestHorizon(
+            horizon=horizon,
+            observations=observations,
+            mean_return_pct=mean,
+            benchmark_return_pct=base,
+            excess_return_pct=None if mean is None else mean - base,
+            hit_rate=int((forward.positive & picked).sum()) / observations if observations else None
+        ))
+
+    # Share of the equal-weight portfolio replaced from one date to the next,
+    # while it holds stocks on both: half the summed weight changes
+    before, after = counts[:-1], counts[1:]
+    held = (before > 0) & (after > 0)
+    kept = (selected[1:] & selected[:-1]).sum(axis=1)[held]
+    before, after = before[held], after[held]
+    turnover = 0.5 * (kept * np.abs(1 / after - 1 / before) + (after - kept) / after + (before - kept) / before)
+
+    return BacktestResult(
+        screen=screen.expression,
+        start=_date_label(columns.dates[active[0]]) if len(active) else None,
+        end=_date_label(columns.dates[active[-1]]) if len(active) else None,
+        dates=len(active),
+        avg_selected=float(counts[active].mean()) if len(active) else 0.0,
+        turnover=_mean(turnover),
+        horizons=results
+    )
+
+def run_backtest(
+    columns: HistoryColumns, screens: Sequence[Screen], horizons: Sequence[int] = DEFAULT_HORIZONS
+) -> List[BacktestResult]:
+    """Evaluates each screen (one parameter set each) on BACKTEST_WORKERS threads."""
+    # Shared matrices are built once up front rather than raced for by the workers
+    for path in sorted(set().union(*(screen.fields for screen in screens))):
+        columns.field(path)
+    for horizon in horizons:
+        columns.forward(horizon)
+
+    workers = max(1, min(settings.BACKTEST_WORKERS, len(screens)))
+    if workers == 1:
+        return [evaluate(columns, screen, horizons) for screen in screens]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backtest") as pool:
+        return list(pool.map(lambda screen: evaluate(columns, screen, horizons), screens))
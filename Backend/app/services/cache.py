@@ -1,5 +1,5 @@
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional
 
 class InMemoryCache:
     def __init__(self):
@@ -23,4 +23,33 @@ class InMemoryCache:
     def clear(self):
         self._cache.clear()
 
-cache = InMemoryCache()
\ No newline at end of file
+cache = InMemoryCache()
+
+# Simple in-memory watchlist for demo (per user session ideally, but global here)
+WATCHLIST_KEY = "user_watchlist"
+
+class VersionedCache:
+    """
+    Values derived from one published snapshot version (e.g. serialized
+    responses). Everything is dropped as soon as a newer version is seen.
+    """
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._version: Optional[int] = None
+        self._cache: Dict[str, Any] = {}
+
+    def get_or_set(self, version: int, key: str, factory: Callable[[], Any]) -> Any:
+        if version != self._version:
+            self._version = version
+            self._cache = {}
+        if key in self._cache:
+            return self._cache[key]
+
+        value = factory()
+        if len(self._cache) >= self.max_entries:
+            # Evict the oldest entry (dicts keep insertion order)
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = value
+        return value
+
+response_cache = VersionedCache()
@@ -0,0 +1,120 @@
+"""
+Compact chart history of one symbol.
+
+A record's last CHART_POINTS bars and their indicators are kept as a few
+contiguous arrays (dates, OHLC, volume, indicators) instead of one pydantic
+object per point. That is a few KB per symbol instead of tens of KB, and
+building it is array slicing. JSON is rendered on demand, either as the
+usual list of points or in columnar form (one list per field).
+
+Prices stay float64 so the 2-decimal values round-trip exactly even for
+six-digit share prices; indicators are float32 and rendered to 4 decimals.
+"""
+from typing import Any, Dict, List, Mapping, Optional
+import numpy as np
+import pandas as pd
+
+CHART_POINTS = 60
+
+PRICE_FIELDS = ("open", "high", "low", "close")
+INDICATOR_FIELDS = ("macd", "signal", "hist", "rsi", "ema_20", "ema_50")
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+def _dates(index) -> np.ndarray:
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        # Keep the exchange's wall-clock dates
+        index = index.tz_localize(None)
+    return index.to_numpy().astype("datetime64[s]")
+
+def _date(value) -> np.datetime64:
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_localize(None)
+    return np.datetime64(value, "s")
+
+class ChartSeries:
+    """Read-only column arrays of the latest bars, oldest first."""
+
+    __slots__ = ("dates", "prices", "volume", "indicators")
+
+    def __init__(self, dates: np.ndarray, prices: np.ndarray, volume: np.ndarray, indicators: np.ndarray):
+        self.dates = _frozen(np.array(dates, dtype="datetime64[s]"))
+        # (n, 4) in PRICE_FIELDS order
+        self.prices = _frozen(np.array(prices, dtype=np.float64).reshape(-1, len(PRICE_FIELDS)))
+        self.volume = _frozen(np.array(volume, dtype=np.int64))
+        # (n, 6) in INDICATOR_FIELDS order; NaN where not defined yet
+        self.indicators = _frozen(np.array(indicators, dtype=np.float32).reshape(-1, len(INDICATOR_FIELDS)))
+
+    def __reduce__(self):
+        # Through __init__, so copies from worker processes are read-only too
+        return (ChartSeries, (self.dates, self.prices, self.volume, self.indicators))
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @classmethod
+    def empty(cls) -> "ChartSeries":
+        return cls(np.empty(0), np.empty((0, 4)), np.empty(0), np.empty((0, 6)))
+
+    @classmethod
+    def from_columns(cls, index, columns: Mapping[str, np.ndarray]) -> "ChartSeries":
+        """
+        The last CHART_POINTS bars of a symbol. `columns` maps "open", "high",
+        "low", "close", "volume" and the INDICATOR_FIELDS to arrays that end
+        with the same bar as `index`.
+        """
+        n = min(CHART_POINTS, len(index))
+        if n == 0:
+            return cls.empty()
+        return cls(
+            _dates(index[-n:]),
+            np.column_stack([np.asarray(columns[key], dtype=np.float64)[-n:] for key in PRICE_FIELDS]),
+            np.nan_to_num(np.asarray(columns["volume"], dtype=np.float64)[-n:]),
+            np.column_stack([np.asarray(columns[key], dtype=np.float64)[-n:] for key in INDICATOR_FIELDS])
+        )
+
+    def with_bar(
+        self, date, bar: Mapping[str, float], values: Optional[Mapping[str, Any]] = None, append: bool = False
+    ) -> "ChartSeries":
+        """
+        A copy with the last bar replaced, or with a bar appended (dropping the
+        oldest past CHART_POINTS). `bar` holds Open/High/Low/Close/Volume;
+        `values` the indicators, or None to keep those of the replaced bar.
+        """
+        if values is None:
+            indicators = self.indicators[-1] if len(self) else np.full(len(INDICATOR_FIELDS), np.nan)
+        else:
+            indicators = [np.nan if values.get(key) is None else values[key] for key in INDICATOR_FIELDS]
+        prices = [bar["Open"], bar["High"], bar["Low"], bar["Close"]]
+        volume = 0 if pd.isna(bar["Volume"]) else bar["Volume"]
+
+        keep = slice(-(CHART_POINTS - 1), None) if append else slice(None, -1)
+        return ChartSeries(
+            np.append(self.dates[keep], _date(date)),
+            np.vstack([self.prices[keep], prices]),
+            np.append(self.volume[keep], volume),
+            np.vstack([self.indicators[keep], np.asarray(indicators, dtype=np.float32)])
+        )
+
+    # --- Rendering ---
+
+    def columns(self) -> Dict[str, List[Any]]:
+        """One list per field (date, OHLC, volume, indicators), ready for JSON."""
+        # Daily bars render as dates, intraday bars with their time
+        intraday = bool((self.dates != self.dates.astype("datetime64[D]")).any())
+        dates = np.datetime_as_string(self.dates, unit="m" if intraday else "D")
+        columns: Dict[str, List[Any]] = {"date": dates.tolist()}
+        columns.update(zip(PRICE_FIELDS, np.round(self.prices, 2).T.tolist()))
+        columns["volume"] = self.volume.tolist()
+        indicators = np.round(self.indicators.astype(np.float64), 4)
+        columns.update(zip(INDICATOR_FIELDS, np.where(np.isnan(indicators), None, indicators).T.tolist()))
+        return columns
+
+    def points(self) -> List[Dict[str, Any]]:
+        """One dict per bar, shaped like ChartDataPoint."""
+        columns = self.columns()
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
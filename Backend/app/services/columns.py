@@ -0,0 +1,307 @@
+"""
+Struct-of-arrays view of a published stock list.
+
+Row i of every column describes `stocks[i]`, so a filter can be evaluated as
+one boolean mask over NumPy arrays and mapped back to records by index.
+"""
+import itertools
+import operator
+import typing
+import numpy as np
+from pydantic import BaseModel
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Type, Union
+from app.schemas import StockResponse
+
+class Categorical:
+    """Integer codes for a string column; None is stored as -1."""
+
+    def __init__(self, values: Iterable[Optional[str]]):
+        self.categories: Dict[str, int] = {}
+        codes = []
+        for value in values:
+            if value is None:
+                codes.append(-1)
+            else:
+                codes.append(self.categories.setdefault(value, len(self.categories)))
+        self.codes = np.array(codes, dtype=np.int32)
+
+    def updated(self, source: np.ndarray, rows: np.ndarray, part: "Categorical") -> "Categorical":
+        """Codes gathered from rows `source` of this column, with `rows` taken from `part`."""
+        merged = Categorical(())
+        merged.categories = dict(self.categories)
+        # part.categories is in code order
+        remap = np.array([merged.categories.setdefault(v, len(merged.categories)) for v in part.categories] + [-1],
+                         dtype=np.int32)
+        merged.codes = self.codes[source]
+        merged.codes[rows] = remap[part.codes]
+        return merged
+
+    def isin(self, values: Iterable[str]) -> np.ndarray:
+        """Mask of rows whose value is one of `values`; unknown values match nothing."""
+        table = np.zeros(len(self.categories) + 1, dtype=bool)
+        table[[self.categories[v] for v in values if v in self.categories]] = True
+        # Code -1 (None) picks the last entry, which is always False
+        return table[self.codes]
+
+def _record_fields(model: Type[BaseModel], prefix: str = "") -> Dict[str, type]:
+    """Scalar fields of `model` and its nested models by dotted path, with their type (Optional[int] as float)."""
+    fields: Dict[str, type] = {}
+    for name, info in model.model_fields.items():
+        annotation, args = info.annotation, typing.get_args(info.annotation)
+        optional = type(None) in args
+        if optional:
+            annotation = next(arg for arg in args if arg is not type(None))
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            fields.update(_record_fields(annotation, f"{prefix}{name}."))
+        elif annotation in (bool, int, float, str):
+            # A missing int is stored as NaN
+            fields[prefix + name] = float if optional and annotation is int else annotation
+    return fields
+
+# Every scalar record field that `StockColumns.field` can build a column for
+RECORD_FIELDS = _record_fields(StockResponse)
+
+def _field_column(stocks: List[StockResponse], path: str) -> Union[np.ndarray, Categorical]:
+    values = list(map(operator.attrgetter(path), stocks))
+    kind = RECORD_FIELDS[path]
+    if kind is str:
+        return Categorical(values)
+    # None becomes NaN in float columns
+    return np.array(values, dtype={bool: bool, int: np.int64, float: np.float64}[kind])
+
+# Fixed slot of every symbol ever put in columns. Entries are only added, never
+# changed, so columns of any age look symbols up in the same table.
+SYMBOL_SLOTS: Dict[str, int] = {}
+
+def _stable_orders(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Ascending and descending row orders for `values`. Ties keep row order in
+    both directions, like Python's stable `sort(reverse=True)`.
+    """
+    _, dense = np.unique(values, return_inverse=True)
+    return {
+        "asc": np.argsort(dense, kind="stable"),
+        "desc": np.argsort(-dense, kind="stable"),
+    }
+
+def _merged_order(order: np.ndarray, new_rows: np.ndarray, values: np.ndarray, added: np.ndarray,
+                  descending: bool) -> np.ndarray:
+    """
+    The order `_stable_orders` would give for `values`, built from the
+    previous `order` instead of a sort: `new_rows` maps each previous row to
+    its new row (-1 if it was dropped), and the `added` rows are placed by
+    binary search. Kept rows must keep their relative order.
+    """
+    kept = new_rows[order]
+    kept = kept[kept >= 0]
+    if not len(added):
+        return kept
+    size = len(values)
+    if descending:
+        # Ascending values with ties in descending row order, so the same keys apply
+        kept = kept[::-1]
+    kept_values, added_values = values[kept], values[added]
+
+    # Ranks of the distinct kept values (even), and of the added values: an
+    # equal kept value's rank, or odd between two of them. NaNs are equal and last.
+    differs = kept_values[1:] != kept_values[:-1]
+    if kept_values.dtype.kind == "f":
+        differs &= ~(np.isnan(kept_values[1:]) & np.isnan(kept_values[:-1]))
+    codes = np.concatenate([[0], np.cumsum(differs)]) * 2
+    left = np.searchsorted(kept_values, added_values, side="left")
+    right = np.searchsorted(kept_values, added_values, side="right")
+    added_codes = np.where(right > left, codes[np.minimum(left, len(kept) - 1)],
+                           np.where(left > 0, codes[left - 1], -2) + 1)
+
+    # One integer key per row: value rank, then row (reversed for "desc")
+    ties = (size - 1 - kept, size - 1 - added) if descending else (kept, added)
+    kept_keys = codes * size + ties[0]
+    added_keys = added_codes * size + ties[1]
+    before = np.searchsorted(kept_keys, added_keys)
+    if descending:
+        kept, before = kept[::-1], len(kept) - before
+    # Added rows that land between the same kept rows go in their own sort
+    # order; `added` is ascending, so a stable sort keeps their ties in row order
+    if descending:
+        placed = (len(added) - 1 - np.argsort(added_values[::-1], kind="stable"))[::-1]
+    else:
+        placed = np.argsort(added_values, kind="stable")
+    return np.insert(kept, before[placed], added[placed])
+
+class StockColumns:
+    # Sortable keys accepted by the API and the column each one sorts on
+    SORT_KEYS = {
+        "rank": "rank",
+        "symbol": "symbol",
+        "price": "price",
+        "change": "change_pct",
+        "volume": "volume",
+        "avg_3day": "avg_3day",
+        "volatility": "volatility",
+        "rsi": "rsi_sort",
+        "strength": "strength",
+    }
+
+    # Columns built from the records, besides the Categoricals and "rank"
+    ARRAYS = (
+        "symbol", "slot", "symbol_lower", "name_lower", "price", "volume", "change_pct", "avg_3day", "volatility",
+        "rsi", "strength", "rsi_sort", "is_constant_price", "is_gainer_today", "is_loser_today",
+        "is_high_volume", "is_breakout_candidate",
+    )
+    CATEGORICALS = ("sector", "macd_status", "rsi_status", "strength_label")
+
+    def __init__(self, stocks: Sequence[StockResponse], ranks: Optional[Mapping[str, int]] = None):
+        """
+        Columns of `stocks`. Ranks are looked up in `ranks` when given;
+        otherwise `stocks` is taken to be in rank order, as snapshots are.
+        """
+        # The sequence these columns were built from (kept, not copied); row i is stocks[i]
+        self.stocks = stocks
+        self.size = len(stocks)
+
+        self.symbol = np.array([s.symbol for s in stocks], dtype=str)
+        self.slot = np.array([SYMBOL_SLOTS.setdefault(s.symbol, len(SYMBOL_SLOTS)) for s in stocks], dtype=np.intp)
+        self.symbol_lower = np.array([s.symbol.lower() for s in stocks], dtype=str)
+        self.name_lower = np.array([(s.name or "").lower() for s in stocks], dtype=str)
+
+        self.price = np.array([s.current_price for s in stocks], dtype=np.float64)
+        self.volume = np.array([s.volume for s in stocks], dtype=np.int64)
+        self.change_pct = np.array([s.current_change_pct for s in stocks], dtype=np.float64)
+        self.avg_3day = np.array([s.history.avg_3_day_change_pct for s in stocks], dtype=np.float64)
+        self.volatility = np.array([s.history.volatility_3_day for s in stocks], dtype=np.float64)
+        # Records do not hold their rank; it belongs to the snapshot
+        self.rank = (
+            np.array([ranks[s.symbol] for s in stocks], dtype=np.int64) if ranks is not None
+            else np.arange(1, self.size + 1, dtype=np.int64)
+        )
+        self.rsi = np.array(
+            [np.nan if s.indicators.rsi_value is None else s.indicators.rsi_value for s in stocks],
+            dtype=np.float64
+        )
+        self.strength = np.array([s.indicators.buyer_strength_score for s in stocks], dtype=np.int64)
+        # Sorting treats a missing RSI as 0
+        self.rsi_sort = np.nan_to_num(self.rsi, nan=0.0)
+
+        self.sector = Categorical(s.sector for s in stocks)
+        self.macd_status = Categorical(s.indicators.macd_status for s in stocks)
+        self.rsi_status = Categorical(s.indicators.rsi_status for s in stocks)
+        # Labels like "Buyers Dominating" are matched on their first word
+        self.strength_label = Categorical(s.indicators.strength_label.lower().split(' ')[0] for s in stocks)
+
+        self.is_constant_price = np.array([s.flags.is_constant_price for s in stocks], dtype=bool)
+        self.is_gainer_today = np.array([s.flags.is_gainer_today for s in stocks], dtype=bool)
+        self.is_loser_today = np.array([s.flags.is_loser_today for s in stocks], dtype=bool)
+        self.is_high_volume = np.array([s.flags.is_high_volume for s in stocks], dtype=bool)
+        self.is_breakout_candidate = np.array([s.flags.is_breakout_candidate for s in stocks], dtype=bool)
+
+        # Sort orders, computed on first use; `updated` merges them into the next snapshot's columns
+        self._orders: Optional[Dict[str, Dict[str, np.ndarray]]] = None
+        # Columns of other RECORD_FIELDS, built by `field` on first use
+        self.fields: Dict[str, Union[np.ndarray, Categorical]] = {}
+        # Row of each SYMBOL_SLOTS slot (-1 if absent), built by `row` on first use
+        self._rows: Optional[List[int]] = None
+
+    def updated(self, stocks: Sequence[StockResponse], source: np.ndarray) -> "StockColumns":
+        """
+        Columns for `stocks`, in rank order, where `source[i]` is the row of
+        these columns that stocks[i] keeps, or -1 for a new record. Kept rows
+        are copied instead of being read from the records again, and when
+        they keep their relative order (as in a ranking update) every sort
+        order is merged from the previous one: O(n) copies plus a binary
+        search per new record, instead of a sort per key.
+        """
+        rows = np.flatnonzero(source < 0)
+        if len(rows) == len(stocks):
+            return StockColumns(stocks)
+
+        part = StockColumns([stocks[i] for i in rows.tolist()])
+
+        columns = StockColumns.__new__(StockColumns)
+        columns.stocks = stocks
+        columns.size = len(stocks)
+        for name in self.ARRAYS:
+            previous, new = getattr(self, name), getattr(part, name)
+            # Widens string columns if a new value is longer
+            values = previous[source].astype(np.result_type(previous, new)) if len(new) else previous[source]
+            values[rows] = new
+            setattr(columns, name, values)
+        for name in self.CATEGORICALS:
+            setattr(columns, name, getattr(self, name).updated(source, rows, getattr(part, name)))
+        columns.rank = np.arange(1, columns.size + 1, dtype=np.int64)
+        columns._rows = None
+
+        kept = source[source >= 0]
+        if np.all(kept[1:] > kept[:-1]):
+            new_rows = np.full(self.size, -1, dtype=np.intp)
+            new_rows[kept] = np.flatnonzero(source >= 0)
+            rank_order = np.arange(columns.size)
+            columns._orders = {"rank": {"asc": rank_order, "desc": rank_order[::-1]}}
+            for key, orders in self.orders.items():
+                if key != "rank":
+                    values = getattr(columns, self.SORT_KEYS[key])
+                    columns._orders[key] = {
+                        direction: _merged_order(order, new_rows, values, rows, direction == "desc")
+                        for direction, order in orders.items()
+                    }
+        else:
+            columns._orders = None
+        # Field columns built so far are carried over the same way
+        columns.fields = {}
+        for path, previous in self.fields.items():
+            new = part.field(path)
+            if isinstance(previous, Categorical):
+                columns.fields[path] = previous.updated(source, rows, new)
+            else:
+                values = previous[source]
+                values[rows] = new
+                columns.fields[path] = values
+        return columns
+
+    @property
+    def orders(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """Ascending and descending row order of each SORT_KEYS column."""
+        if self._orders is None:
+            self._orders = {key: _stable_orders(getattr(self, column)) for key, column in self.SORT_KEYS.items()}
+        return self._orders
+
+    def row(self, symbol: str) -> Optional[int]:
+        """Row of `symbol`, or None; the index is built once, with array operations."""
+        rows = self._rows
+        if rows is None:
+            index = np.full(len(SYMBOL_SLOTS), -1, dtype=np.intp)
+            index[self.slot] = np.arange(self.size)
+            rows = self._rows = index.tolist()
+        slot = SYMBOL_SLOTS.get(symbol)
+        if slot is None or slot >= len(rows) or rows[slot] < 0:
+            return None
+        return rows[slot]
+
+    def field(self, path: str) -> Union[np.ndarray, Categorical]:
+        """
+        Column of a RECORD_FIELDS path (e.g. "indicators.rsi_value"), built on
+        first use; strings are Categoricals. "rank" is the current rank.
+        """
+        if path == "rank":
+            return self.rank
+        column = self.fields.get(path)
+        if column is None:
+            column = self.fields[path] = _field_column(self.stocks, path)
+        return column
+
+    def order(self, sort_by: str, sort_dir: str = "asc") -> np.ndarray:
+        """Row order for `sort_by` (unknown keys sort by rank)."""
+        orders = self.orders.get(sort_by, self.orders["rank"])
+        return orders["desc" if sort_dir == "desc" else "asc"]
+
+    def sorted_indices(self, mask: np.ndarray, sort_by: str, sort_dir: str = "asc") -> np.ndarray:
+        """Rows selected by `mask`, in precomputed sort order."""
+        order = self.order(sort_by, sort_dir)
+        return order[mask[order]]
+
+    def top(self, sort_by: str, sort_dir: str, limit: int) -> List[StockResponse]:
+        """First `limit` records in sort order."""
+        return self.take(self.order(sort_by, sort_dir)[:limit])
+
+    def take(self, indices: np.ndarray) -> List[StockResponse]:
+        stocks = self.stocks
+        return [stocks[i] for i in indices.tolist()]
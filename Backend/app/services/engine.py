@@ -0,0 +1,326 @@
+"""
+Vectorized cross-sectional indicator engine.
+
+Aligns every symbol of a batch into one bars x symbols NumPy matrix and
+computes indicators, statuses and strength scores for the whole universe
+with array operations instead of one pandas pass per symbol.
+
+Rows are aligned on each symbol's most recent bar (row -1 is the latest bar
+of every column), and shorter histories are NaN-padded at the top. This keeps
+the numbers identical to `process_stock_data`, which works on each symbol's
+own bar sequence.
+"""
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.config import settings
+from app.schemas import StockResponse, StockHistory, Indicators, StockFlags
+from app.services.charts import ChartSeries, INDICATOR_FIELDS
+
+OHLCV_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+MIN_BARS = 5
+
+# --- Matrix Construction ---
+
+def build_matrices(frames: Dict[str, pd.DataFrame]) -> Dict[str, np.ndarray]:
+    """
+    Stacks per-symbol OHLCV frames into (bars, symbols) float matrices.
+    Column j holds the bars of the j-th symbol in `frames`, bottom-aligned.
+    """
+    lengths = np.array([len(df) for df in frames.values()], dtype=np.int64)
+    n_bars = int(lengths.max()) if len(lengths) else 0
+    n_symbols = len(frames)
+
+    block = np.full((len(OHLCV_FIELDS), n_bars, n_symbols), np.nan)
+    for j, df in enumerate(frames.values()):
+        if len(df):
+            block[:, n_bars - len(df):, j] = df[OHLCV_FIELDS].to_numpy(dtype=np.float64).T
+
+    # Fortran order keeps each symbol contiguous for the per-column reductions
+    matrices = {field: np.asfortranarray(block[k]) for k, field in enumerate(OHLCV_FIELDS)}
+    return matrices
+
+# --- Indicator Kernels ---
+
+def ema_matrix(values: np.ndarray, span: int) -> np.ndarray:
+    """Column-wise `Series.ewm(span=span, adjust=False).mean()`."""
+    alpha = 1.0 / (1.0 + (span - 1) / 2.0)
+    old_wt = 1.0 - alpha
+    norm = old_wt + alpha
+
+    out = np.full_like(values, np.nan)
+    weighted = np.full(values.shape[1], np.nan)
+    for t in range(values.shape[0]):
+        cur = values[t]
+        updated = (old_wt * weighted + alpha * cur) / norm
+        # Same rules as pandas: seed on the first observation, keep the
+        # previous value over gaps and on exact repeats of a constant series.
+        weighted = np.where(
+            np.isnan(weighted), cur,
+            np.where(np.isnan(cur) | (weighted == cur), weighted, updated)
+        )
+        out[t] = weighted
+    return out
+
+def rolling_mean_matrix(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Column-wise `Series.rolling(window).mean()`, NaN meaning "no bar".
+    Replays pandas' compensated running sum so results match to the last bit.
+    """
+    n_bars, n_symbols = values.shape
+    out = np.full((n_bars, n_symbols), np.nan)
+
+    sum_x = np.zeros(n_symbols)
+    comp_add = np.zeros(n_symbols)
+    comp_remove = np.zeros(n_symbols)
+    nobs = np.zeros(n_symbols, dtype=np.int64)
+    neg_ct = np.zeros(n_symbols, dtype=np.int64)
+    same_ct = np.zeros(n_symbols, dtype=np.int64)
+    prev_value = values[0].copy() if n_bars else np.zeros(n_symbols)
+
+    for t in range(n_bars):
+        if t >= window:
+            old = values[t - window]
+            present = ~np.isnan(old)
+            y = -old - comp_remove
+            total = sum_x + y
+            comp_remove = np.where(present, total - sum_x - y, comp_remove)
+            sum_x = np.where(present, total, sum_x)
+            nobs -= present
+            neg_ct -= present & np.signbit(old)
+
+        cur = values[t]
+        present = ~np.isnan(cur)
+        y = cur - comp_add
+        total = sum_x + y
+        comp_add = np.where(present, total - sum_x - y, comp_add)
+        sum_x = np.where(present, total, sum_x)
+        nobs += present
+        neg_ct += present & np.signbit(cur)
+        same_ct = np.where(present, np.where(cur == prev_value, same_ct + 1, 1), same_ct)
+        prev_value = np.where(present, cur, prev_value)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = sum_x / nobs
+        result = np.where(same_ct >= nobs, prev_value, result)
+        result = np.where((neg_ct == 0) & (result < 0), 0.0, result)
+        result = np.where((neg_ct == nobs) & (result > 0), 0.0, result)
+        out[t] = np.where(nobs >= window, result, np.nan)
+    return out
+
+def rsi_matrix(closes: np.ndarray, period: int = 14) -> np.ndarray:
+    """Column-wise `calculate_rsi`."""
+    delta = np.diff(closes, axis=0, prepend=np.nan)
+    # pandas' `where` turns a symbol's leading NaN delta into 0, so it counts
+    # toward the window; rows before the symbol's first bar stay missing.
+    missing = np.isnan(closes)
+    gain = np.where(missing, np.nan, np.where(delta > 0, delta, 0.0))
+    loss = np.where(missing, np.nan, np.where(delta < 0, -delta, 0.0))
+
+    avg_gain = rolling_mean_matrix(gain, period)
+    avg_loss = rolling_mean_matrix(loss, period)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+def compute_indicators(matrices: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Full indicator series for every symbol, each shaped (bars, symbols)."""
+    closes = matrices["Close"]
+
+    exp1 = ema_matrix(closes, 12)
+    exp2 = ema_matrix(closes, 26)
+    macd = exp1 - exp2
+    signal = ema_matrix(macd, 9)
+
+    return {
+        "macd": macd,
+        "signal": signal,
+        "hist": macd - signal,
+        "rsi": rsi_matrix(closes),
+        "sma_20": rolling_mean_matrix(closes, 20),
+        "sma_50": rolling_mean_matrix(closes, 50),
+        "ema_20": ema_matrix(closes, 20),
+        "ema_50": ema_matrix(closes, 50),
+    }
+
+# --- Vectorized Status & Strength ---
+
+def macd_status_vector(macd: np.ndarray, signal: np.ndarray) -> np.ndarray:
+    """Vector form of `get_macd_status`."""
+    diff = macd - signal
+    return np.select(
+        [np.abs(diff) < 0.05, diff > 0],
+        ["near_zero", "above_zero"],
+        default="below_zero"
+    )
+
+def rsi_status_vector(rsi: np.ndarray) -> np.ndarray:
+    """Vector form of `get_rsi_status`."""
+    return np.select([rsi > 70, rsi < 30], ["overbought", "oversold"], default="neutral")
+
+def trend_vector(price: np.ndarray, ema_20: np.ndarray, ema_50: np.ndarray) -> np.ndarray:
+    """Vector form of `get_trend`."""
+    return np.select(
+        [(price > ema_20) & (ema_20 > ema_50), (price < ema_20) & (ema_20 < ema_50)],
+        ["uptrend", "downtrend"],
+        default="sideways"
+    )
+
+def strength_vector(
+    macd_hist: np.ndarray, rsi: np.ndarray, volume: np.ndarray, avg_volume: np.ndarray,
+    price: np.ndarray, ema_20: np.ndarray, close: np.ndarray, high: np.ndarray, low: np.ndarray
+):
+    """Vector form of `calculate_strength`; returns (buyer, seller, label) arrays."""
+    above_ema = price > ema_20
+    volume_confirms = volume > avg_volume
+    above_mid = close > (high + low) / 2
+
+    buyer = (30 * above_ema + 20 * (macd_hist > 0) + 10 * (rsi > 50)
+             + 20 * (volume_confirms & above_ema) + 20 * above_mid)
+    seller = (30 * ~above_ema + 20 * ~(macd_hist > 0) + 10 * ~(rsi > 50)
+              + 20 * (volume_confirms & ~above_ema) + 20 * ~above_mid)
+
+    # Every symbol scores at least 80 points in total, so no zero-total branch
+    total = buyer + seller
+    buyer_score = (buyer / total * 100).astype(np.int64)
+    seller_score = (seller / total * 100).astype(np.int64)
+
+    label = np.select(
+        [buyer_score >= 60, seller_score >= 60], ["buyers", "sellers"], default="balanced"
+    )
+    return buyer_score, seller_score, label
+
+# --- Universe Processing ---
+
+def _last(matrix: np.ndarray, offset: int = 1) -> np.ndarray:
+    return matrix[-offset]
+
+def _chart(df: pd.DataFrame, j: int, matrices, indicators) -> ChartSeries:
+    columns = {key.lower(): matrices[key][:, j] for key in OHLCV_FIELDS}
+    columns.update((key, indicators[key][:, j]) for key in INDICATOR_FIELDS)
+    return ChartSeries.from_columns(df.index, columns)
+
+def process_universe(
+    frames: Dict[str, pd.DataFrame], infos: Optional[Dict[str, Dict]] = None
+) -> List[StockResponse]:
+    """
+    Vectorized equivalent of calling `process_stock_data` for every symbol.
+    Returns records in the order of `frames`; symbols with too little history
+    fall back to a fast-info record exactly like the per-symbol path.
+    """
+    # Imported here to avoid a circular import with app.services.stocks
+    from app.services.stocks import create_stock_response_from_fast_info
+
+    infos = infos or {}
+    usable = {s: df for s, df in frames.items() if not df.empty and len(df) >= MIN_BARS}
+    results: Dict[str, StockResponse] = {}
+
+    if usable:
+        matrices = build_matrices(usable)
+        ind = compute_indicators(matrices)
+
+        closes, highs, lows, volumes = (
+            matrices["Close"], matrices["High"], matrices["Low"], matrices["Volume"]
+        )
+        c1, c2, c3, c4 = (_last(closes, k) for k in (1, 2, 3, 4))
+
+        current_price = c1
+        prev_close = c2
+        current_change_abs = current_price - prev_close
+        current_change_pct = (current_change_abs / prev_close) * 100
+
+        day_1_change = ((c1 - c2) / c2) * 100
+        day_2_change = ((c2 - c3) / c3) * 100
+        day_3_change = ((c3 - c4) / c4) * 100
+        avg_3_day_change_pct = (day_1_change + day_2_change + day_3_change) / 3
+        volatility_3_day = np.std(np.vstack([day_1_change, day_2_change, day_3_change]), axis=0)
+
+        last = {key: _last(series) for key, series in ind.items()}
+        avg_volume = np.nanmean(volumes, axis=0)
+
+        macd_status = macd_status_vector(last["macd"], last["signal"])
+        rsi_status = rsi_status_vector(last["rsi"])
+        trend = trend_vector(current_price, last["ema_20"], last["ema_50"])
+        buyer_score, seller_score, strength_label = strength_vector(
+            last["hist"], last["rsi"], _last(volumes), avg_volume, current_price,
+            last["ema_20"], c1, _last(highs), _last(lows)
+        )
+
+        is_constant = np.abs(avg_3_day_change_pct) < 0.0001
+        is_gainer = current_change_pct > 0
+        is_loser = current_change_pct < 0
+        is_high_vol = _last(volumes) > (avg_volume * 1.5)
+        is_breakout = (current_price > np.nanmax(highs[-20:], axis=0)) & is_high_vol
+
+        rounded = {
+            key: np.round(values, 2) for key, values in {
+                "current_price": current_price, "prev_close": prev_close,
+                "change_abs": current_change_abs, "change_pct": current_change_pct,
+                "day_1": day_1_change, "day_2": day_2_change, "day_3": day_3_change,
+                "avg_3": avg_3_day_change_pct, "vol_3": volatility_3_day,
+                "high": _last(highs), "low": _last(lows),
+                **last,
+            }.items()
+        }
+        now = datetime.now()
+
+        for j, (symbol, df) in enumerate(usable.items()):
+            info = infos.get(symbol, {})
+
+            def get_last(key):
+                value = rounded[key][j]
+                return None if np.isnan(value) else float(value)
+
+            results[symbol] = StockResponse(
+                symbol=symbol,
+                name=symbol,
+                sector=settings.SECTOR_MAPPING.get(symbol, "Unknown"),
+                current_price=rounded["current_price"][j],
+                previous_close=rounded["prev_close"][j],
+                current_change_abs=rounded["change_abs"][j],
+                current_change_pct=rounded["change_pct"][j],
+                day_high=round(info["dayHigh"], 2) if "dayHigh" in info else rounded["high"][j],
+                day_low=round(info["dayLow"], 2) if "dayLow" in info else rounded["low"][j],
+                volume=int(info.get("volume", volumes[-1, j])),
+                market_cap=info.get("marketCap"),
+                last_updated=now,
+                rank=0,  # Ranks belong to the snapshot; see StockSummary.rank
+                history=StockHistory(
+                    day_1_change_pct=rounded["day_1"][j],
+                    day_2_change_pct=rounded["day_2"][j],
+                    day_3_change_pct=rounded["day_3"][j],
+                    avg_3_day_change_pct=rounded["avg_3"][j],
+                    volatility_3_day=rounded["vol_3"][j]
+                ),
+                indicators=Indicators(
+                    macd_line=get_last("macd"),
+                    signal_line=get_last("signal"),
+                    macd_histogram=get_last("hist"),
+                    macd_status=str(macd_status[j]),
+                    rsi_value=get_last("rsi"),
+                    rsi_status=str(rsi_status[j]),
+                    sma_20=get_last("sma_20"),
+                    sma_50=get_last("sma_50"),
+                    ema_20=get_last("ema_20"),
+                    ema_50=get_last("ema_50"),
+                    trend=str(trend[j]),
+                    buyer_strength_score=int(buyer_score[j]),
+                    seller_strength_score=int(seller_score[j]),
+                    strength_label=str(strength_label[j])
+                ),
+                flags=StockFlags(
+                    is_constant_price=bool(is_constant[j]),
+                    is_gainer_today=bool(is_gainer[j]),
+                    is_loser_today=bool(is_loser[j]),
+                    is_high_volume=bool(is_high_vol[j]),
+                    is_breakout_candidate=bool(is_breakout[j])
+                )
+            ).with_chart(_chart(df, j, matrices, ind))
+
+    ordered = []
+    for symbol in frames:
+        stock = results.get(symbol) or create_stock_response_from_fast_info(symbol, infos.get(symbol, {}))
+        ordered.append(stock)
+    return ordered
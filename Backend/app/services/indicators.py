@@ -1,6 +1,7 @@
+import math
 import pandas as pd
 import numpy as np
-from typing import Tuple
+from typing import Dict, Iterable, Tuple
 
 def calculate_rsi(series: pd.Series, period: int = 14) -> pd.Series:
     delta = series.diff()
@@ -121,3 +122,190 @@ def calculate_strength(
         label = "balanced"
     
     return buyer_score, seller_score, label
+
+# --- Incremental Indicator State ---
+# Each state consumes one bar at a time: `update` appends a new bar and
+# `revise` replaces the most recent one (e.g. the still-forming session bar).
+# Both are O(1) and reproduce the pandas calculations above exactly.
+
+class EMAState:
+    """Running `ewm(span=span, adjust=False).mean()`."""
+
+    def __init__(self, span: int):
+        self.alpha = 1.0 / (1.0 + (span - 1) / 2.0)
+        self.old_wt = 1.0 - self.alpha
+        self.norm = self.old_wt + self.alpha
+        self.value = math.nan
+        self._prev = math.nan
+
+    def _step(self, weighted: float, cur: float) -> float:
+        if weighted != weighted:
+            return cur
+        if cur != cur or weighted == cur:
+            return weighted
+        return (self.old_wt * weighted + self.alpha * cur) / self.norm
+
+    def update(self, value: float) -> float:
+        self._prev = self.value
+        self.value = self._step(self._prev, value)
+        return self.value
+
+    def revise(self, value: float) -> float:
+        self.value = self._step(self._prev, value)
+        return self.value
+
+class SMAState:
+    """
+    Running `rolling(window).mean()` over a ring buffer.
+    Keeps the same compensated running sum as pandas so values match bit for bit.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.value = math.nan
+        self._buffer = [math.nan] * window
+        self._head = 0
+        self._count = 0
+        # sum, add compensation, remove compensation, nobs, negatives, repeats, previous value
+        self._sums = (0.0, 0.0, 0.0, 0, 0, 0, math.nan)
+        self._undo = None
+
+    def update(self, value: float) -> float:
+        self._undo = (self._sums, self._head, self._buffer[self._head], self._count)
+        return self._push(value)
+
+    def revise(self, value: float) -> float:
+        if self._undo is None:
+            return self.update(value)
+        self._sums, self._head, evicted, self._count = self._undo
+        self._buffer[self._head] = evicted
+        return self._push(value)
+
+    def _push(self, value: float) -> float:
+        sum_x, comp_add, comp_remove, nobs, neg_ct, same_ct, prev = self._sums
+
+        if self._count >= self.window:
+            old = self._buffer[self._head]
+            if old == old:
+                y = -old - comp_remove
+                t = sum_x + y
+                comp_remove = t - sum_x - y
+                sum_x = t
+                nobs -= 1
+                neg_ct -= math.copysign(1.0, old) < 0
+
+        if value == value:
+            y = value - comp_add
+            t = sum_x + y
+            comp_add = t - sum_x - y
+            sum_x = t
+            nobs += 1
+            neg_ct += math.copysign(1.0, value) < 0
+            same_ct = same_ct + 1 if value == prev else 1
+            prev = value
+
+        self._buffer[self._head] = value
+        self._head = (self._head + 1) % self.window
+        self._count += 1
+        self._sums = (sum_x, comp_add, comp_remove, nobs, neg_ct, same_ct, prev)
+
+        if nobs < self.window:
+            self.value = math.nan
+        elif same_ct >= nobs:
+            self.value = prev
+        else:
+            result = sum_x / nobs
+            if neg_ct == 0 and result < 0:
+                result = 0.0
+            elif neg_ct == nobs and result > 0:
+                result = 0.0
+            self.value = result
+        return self.value
+
+class RSIState:
+    """Running `calculate_rsi` with gain/loss windows."""
+
+    def __init__(self, period: int = 14):
+        self.gains = SMAState(period)
+        self.losses = SMAState(period)
+        self.value = math.nan
+        self._close = math.nan
+        self._prev_close = math.nan
+
+    def update(self, close: float) -> float:
+        self._prev_close = self._close
+        self._close = close
+        gain, loss = self._split(close - self._prev_close)
+        return self._finish(self.gains.update(gain), self.losses.update(loss))
+
+    def revise(self, close: float) -> float:
+        self._close = close
+        gain, loss = self._split(close - self._prev_close)
+        return self._finish(self.gains.revise(gain), self.losses.revise(loss))
+
+    @staticmethod
+    def _split(delta: float) -> Tuple[float, float]:
+        # Like `Series.where`, the first (NaN) delta counts as zero
+        return (delta if delta > 0 else 0.0), (-delta if delta < 0 else 0.0)
+
+    def _finish(self, gain: float, loss: float) -> float:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rs = np.float64(gain) / np.float64(loss)
+            self.value = float(100 - (100 / (1 + rs)))
+        return self.value
+
+class MACDState:
+    """Running `calculate_macd`."""
+
+    def __init__(self):
+        self.fast = EMAState(12)
+        self.slow = EMAState(26)
+        self.signal = EMAState(9)
+
+    def update(self, close: float) -> Tuple[float, float, float]:
+        macd = self.fast.update(close) - self.slow.update(close)
+        signal = self.signal.update(macd)
+        return macd, signal, macd - signal
+
+    def revise(self, close: float) -> Tuple[float, float, float]:
+        macd = self.fast.revise(close) - self.slow.revise(close)
+        signal = self.signal.revise(macd)
+        return macd, signal, macd - signal
+
+class IndicatorState:
+    """All indicators used for a stock, advanced one close at a time."""
+
+    def __init__(self):
+        self.macd = MACDState()
+        self.rsi = RSIState()
+        self.sma_20 = SMAState(20)
+        self.sma_50 = SMAState(50)
+        self.ema_20 = EMAState(20)
+        self.ema_50 = EMAState(50)
+        self.values: Dict[str, float] = {}
+
+    @classmethod
+    def from_closes(cls, closes: Iterable[float]) -> "IndicatorState":
+        state = cls()
+        for close in closes:
+            state.update(float(close))
+        return state
+
+    def update(self, close: float) -> Dict[str, float]:
+        return self._collect(
+            self.macd.update(close), self.rsi.update(close), self.sma_20.update(close),
+            self.sma_50.update(close), self.ema_20.update(close), self.ema_50.update(close)
+        )
+
+    def revise(self, close: float) -> Dict[str, float]:
+        return self._collect(
+            self.macd.revise(close), self.rsi.revise(close), self.sma_20.revise(close),
+            self.sma_50.revise(close), self.ema_20.revise(close), self.ema_50.revise(close)
+        )
+
+    def _collect(self, macd, rsi, sma_20, sma_50, ema_20, ema_50) -> Dict[str, float]:
+        self.values = {
+            "macd": macd[0], "signal": macd[1], "hist": macd[2], "rsi": rsi,
+            "sma_20": sma_20, "sma_50": sma_50, "ema_20": ema_20, "ema_50": ema_50,
+        }
+        return self.values
@@ -0,0 +1,251 @@
+"""
+Process metrics in the Prometheus text exposition format (served at /metrics).
+
+Counters, gauges and histograms are kept in memory and rendered on scrape.
+Gauges may be backed by a function that is evaluated at scrape time, e.g.
+the age of the published cache.
+"""
+import asyncio
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Sample lines of the exposition format, one per label set."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Evaluates `function` on every scrape instead of storing a value (unlabelled gauges only)."""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, count: int = 1, **labels):
+        """Records `value` `count` times (e.g. a per-symbol average for a whole batch)."""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += count
+                    break
+            state[-2] += value * count
+            state[-1] += count
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, state in values:
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+REGISTRY = Registry()
+
+# --- Refresh Pipeline ---
+
+BATCH_DOWNLOAD_SECONDS = Histogram(
+    "stock_batch_download_seconds", "Duration of one bulk history download."
+)
+SYMBOL_PROCESSING_SECONDS = Histogram(
+    "stock_symbol_processing_seconds", "Batch processing time per symbol.",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+FAILED_SYMBOLS = Counter(
+    "stock_failed_symbols_total", "Symbols missing from a batch's results, by reason.", ("reason",)
+)
+REFRESH_CYCLE_SECONDS = Histogram(
+    "stock_refresh_cycle_seconds", "Duration of a full refresh cycle over all symbols.",
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+)
+FETCH_THROTTLED = Counter(
+    "stock_fetch_throttled_total", "Downloads rejected or answered mostly empty by the upstream."
+)
+HISTORY_REFETCHES = Counter(
+    "stock_history_refetches_total", "Stored histories downloaded again after an upstream split or dividend adjustment."
+)
+FETCH_BATCH_SIZE = Gauge("stock_fetch_batch_size", "Current adaptive download batch size.")
+FETCH_DELAY_SECONDS = Gauge("stock_fetch_delay_seconds", "Current pause between download batches.")
+PUBLISH_SECONDS = Histogram(
+    "stock_publish_seconds", "Duration of publishing a snapshot (update_cache)."
+)
+CALENDAR_UNLISTED_YEAR = Gauge(
+    "stock_calendar_unlisted_year", "Latest year scheduled without an NSE holiday list (weekdays only); 0 if none."
+)
+CALENDAR_UNLISTED_YEAR.set(0)
+
+# --- Snapshot ---
+
+CACHE_VERSION = Gauge("stock_cache_version", "Version of the published snapshot.")
+CACHE_AGE_SECONDS = Gauge("stock_cache_age_seconds", "Seconds since the snapshot was last published.")
+SNAPSHOT_RECORDS = Gauge("stock_snapshot_records", "Records in the published snapshot.")
+SNAPSHOT_BYTES = Gauge(
+    "stock_snapshot_bytes", "JSON size of the published snapshot's records in the summary view, computed at scrape time."
+)
+RESPONSE_BYTES = Histogram(
+    "stock_response_bytes", "Size of serialized snapshot responses, recorded once per version and URL.", ("route",),
+    buckets=tuple(1024 * 4 ** i for i in range(9))
+)
+STREAM_SUBSCRIBERS = Gauge("stock_stream_subscribers", "Connected streaming clients.")
+
+# --- API ---
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time until the response starts, per route.", ("method", "route", "status")
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "Delay of a periodic timer on the event loop beyond its due time.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording REQUEST_SECONDS by route template (e.g. /api/v1/stocks/{symbol})."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            nonlocal observed
+            observed = True
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status)
+            )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not observed:
+                observe(500)
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Background task: sleeps `interval` and records how late it wakes up."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.perf_counter() - started - interval))
@@ -0,0 +1,196 @@
+"""
+Market data providers.
+
+Everything that talks to an upstream data source goes through a
+MarketDataProvider, so the refresh pipeline can run against Yahoo Finance,
+record its responses, or replay them offline.
+"""
+import hashlib
+import json
+import os
+import pickle
+import time
+import threading
+from abc import ABC, abstractmethod
+import pandas as pd
+import yfinance as yf
+from typing import Any, Dict, List, Optional
+from yfinance.exceptions import YFRateLimitError
+from app.config import settings
+from app.services.ratelimit import RateLimited
+
+class MarketDataProvider(ABC):
+    """Source of OHLCV history and quotes."""
+
+    @abstractmethod
+    def download(self, symbols: List[str], **window) -> pd.DataFrame:
+        """
+        Bulk history for `symbols`, shaped like `yf.download(group_by='ticker')`.
+        `window` is either `period=...` or `start=...`, plus `interval=...` for
+        intraday bars (daily when left out).
+        """
+
+    @abstractmethod
+    def history(self, symbol: str, period: str = "3mo") -> pd.DataFrame:
+        """Daily history for a single symbol."""
+
+    @abstractmethod
+    def quote(self, symbol: str) -> Dict:
+        """Latest quote with lastPrice, previousClose, dayHigh, dayLow, volume and marketCap."""
+
+class YFinanceProvider(MarketDataProvider):
+    # yf.download reports per-ticker failures (429s included) as empty
+    # columns; the refresh loop detects those as a mostly empty response.
+    def download(self, symbols: List[str], **window) -> pd.DataFrame:
+        try:
+            return yf.download(
+                tickers=symbols,
+                group_by='ticker',
+                threads=True,
+                progress=False,
+                **window
+            )
+        except YFRateLimitError as e:
+            raise RateLimited(str(e)) from e
+
+    def history(self, symbol: str, period: str = "3mo") -> pd.DataFrame:
+        try:
+            return yf.Ticker(symbol).history(period=period)
+        except YFRateLimitError as e:
+            raise RateLimited(str(e)) from e
+
+    def quote(self, symbol: str) -> Dict:
+        try:
+            info = yf.Ticker(symbol).fast_info
+        except YFRateLimitError as e:
+            raise RateLimited(str(e)) from e
+        return {
+            'symbol': symbol,
+            'lastPrice': info.last_price,
+            'previousClose': info.previous_close,
+            'dayHigh': info.day_high,
+            'dayLow': info.day_low,
+            'volume': info.last_volume,
+            'marketCap': info.market_cap
+        }
+
+# --- Record / Replay ---
+
+def _call_key(method: str, args: Dict[str, Any]) -> str:
+    payload = json.dumps({"method": method, **args}, sort_keys=True, default=str)
+    return f"{method}-{hashlib.sha1(payload.encode()).hexdigest()[:16]}"
+
+class RecordingProvider(MarketDataProvider):
+    """
+    Wraps another provider and saves every response to `directory`.
+    Repeated identical calls are stored as a numbered sequence, so a replay
+    sees the same succession of responses (e.g. a session bar being revised).
+    """
+
+    def __init__(self, inner: MarketDataProvider, directory: str):
+        self.inner = inner
+        self.directory = directory
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _record(self, method: str, args: Dict[str, Any]):
+        key = _call_key(method, args)
+        started = time.perf_counter()
+        error = None
+        try:
+            result = getattr(self.inner, method)(**args)
+        except Exception as e:
+            result, error = None, e
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            seq = self._counts.get(key, 0)
+            self._counts[key] = seq + 1
+        path = os.path.join(self.directory, f"{key}.{seq}.pkl")
+        with open(path, "wb") as f:
+            pickle.dump({"method": method, "args": args, "elapsed": elapsed,
+                         "result": result, "error": repr(error) if error else None}, f)
+
+        if error:
+            raise error
+        return result
+
+    def download(self, symbols: List[str], **window) -> pd.DataFrame:
+        return self._record("download", {"symbols": list(symbols), **window})
+
+    def history(self, symbol: str, period: str = "3mo") -> pd.DataFrame:
+        return self._record("history", {"symbol": symbol, "period": period})
+
+    def quote(self, symbol: str) -> Dict:
+        return self._record("quote", {"symbol": symbol})
+
+class ReplayError(Exception):
+    """Raised when a replayed call was recorded as failing, or was never recorded."""
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serves responses captured by RecordingProvider without touching the network.
+    `latency` is a fixed delay in seconds per call; None replays the recorded durations.
+    Once a call's recorded sequence is exhausted its last response is repeated.
+    """
+
+    def __init__(self, directory: str, latency: Optional[float] = None):
+        self.directory = directory
+        self.latency = latency
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _replay(self, method: str, args: Dict[str, Any]):
+        key = _call_key(method, args)
+        with self._lock:
+            seq = self._counts.get(key, 0)
+            self._counts[key] = seq + 1
+
+        path = os.path.join(self.directory, f"{key}.{seq}.pkl")
+        while seq > 0 and not os.path.exists(path):
+            seq -= 1
+            path = os.path.join(self.directory, f"{key}.{seq}.pkl")
+        if not os.path.exists(path):
+            raise ReplayError(f"No recording for {method}({args})")
+
+        with open(path, "rb") as f:
+            recording = pickle.load(f)
+
+        time.sleep(recording["elapsed"] if self.latency is None else self.latency)
+        if recording["error"]:
+            raise ReplayError(recording["error"])
+        return recording["result"]
+
+    def download(self, symbols: List[str], **window) -> pd.DataFrame:
+        return self._replay("download", {"symbols": list(symbols), **window})
+
+    def history(self, symbol: str, period: str = "3mo") -> pd.DataFrame:
+        return self._replay("history", {"symbol": symbol, "period": period})
+
+    def quote(self, symbol: str) -> Dict:
+        return self._replay("quote", {"symbol": symbol})
+
+# --- Configured Provider ---
+
+def create_provider(kind: str) -> MarketDataProvider:
+    if kind == "yfinance":
+        return YFinanceProvider()
+    if kind == "record":
+        return RecordingProvider(YFinanceProvider(), settings.MARKET_DATA_RECORD_DIR)
+    if kind == "replay":
+        return ReplayProvider(settings.MARKET_DATA_RECORD_DIR, settings.MARKET_DATA_REPLAY_LATENCY)
+    raise ValueError(f"Unknown market data provider: {kind}")
+
+_provider: Optional[MarketDataProvider] = None
+
+def get_provider() -> MarketDataProvider:
+    global _provider
+    if _provider is None:
+        _provider = create_provider(settings.MARKET_DATA_PROVIDER)
+    return _provider
+
+def set_provider(provider: MarketDataProvider):
+    """Swaps the active provider (e.g. to replay recordings in benchmarks)."""
+    global _provider
+    _provider = provider
@@ -0,0 +1,97 @@
+"""
+Stability ranking kept in order as symbols are updated.
+
+Rank 1 is the stock whose 3-day average change is closest to 0. Scores live
+in a sorted list keyed by (score, arrival), so updating one symbol costs
+O(log n) instead of re-sorting the universe; ties keep the order in which
+symbols were first ranked, as the stable sort it replaces did.
+"""
+import contextlib
+import itertools
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sortedcontainers import SortedList
+from app.schemas import StockResponse
+
+def stability_score(stock: StockResponse) -> float:
+    score = abs(stock.history.avg_3_day_change_pct)
+    # NaN would break the ordering; such stocks rank last
+    return math.inf if math.isnan(score) else score
+
+class Ranking:
+    def __init__(self):
+        self._order = SortedList()
+        self._keys: Dict[str, Tuple[float, int, str]] = {}
+        self._arrivals = itertools.count()
+        # Key each symbol had before the open transaction first touched it (None: unranked)
+        self._journal: Optional[Dict[str, Optional[Tuple[float, int, str]]]] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._keys
+
+    def update(self, symbol: str, score: float):
+        key = self._keys.get(symbol)
+        if self._journal is not None:
+            self._journal.setdefault(symbol, key)
+        if key is not None:
+            if key[0] == score:
+                return
+            self._order.remove(key)
+            arrival = key[1]
+        else:
+            arrival = next(self._arrivals)
+        key = self._keys[symbol] = (score, arrival, symbol)
+        self._order.add(key)
+
+    def remove(self, symbol: str):
+        key = self._keys.pop(symbol, None)
+        if self._journal is not None:
+            self._journal.setdefault(symbol, key)
+        if key is not None:
+            self._order.remove(key)
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Updates and removals made in the block are undone if it raises, in
+        O(log n) per touched symbol, so the ranking stays that of the
+        snapshot that was last published.
+        """
+        self._journal = {}
+        try:
+            yield
+        except BaseException:
+            for symbol, key in self._journal.items():
+                current = self._keys.pop(symbol, None)
+                if current is not None:
+                    self._order.remove(current)
+                if key is not None:
+                    self._keys[symbol] = key
+                    self._order.add(key)
+            raise
+        finally:
+            self._journal = None
+
+    def rank(self, symbol: str) -> int:
+        """1-based rank of `symbol`, in O(log n)."""
+        return self._order.index(self._keys[symbol]) + 1
+
+    def rows(self, symbols: Iterable[str]) -> List[Tuple[int, str]]:
+        """(0-based rank, symbol) of each of `symbols`, best rank first."""
+        symbols = list(symbols)
+        if len(symbols) * 16 < len(self._keys):
+            return sorted((self._order.index(self._keys[symbol]), symbol) for symbol in symbols)
+        # A large share of the universe: one pass over the order beats a lookup each
+        wanted = set(symbols)
+        return [(row, key[2]) for row, key in enumerate(self._order) if key[2] in wanted]
+
+    def symbols(self) -> List[str]:
+        """All symbols, best rank first."""
+        return [key[2] for key in self._order]
+
+    def clear(self):
+        self._order.clear()
+        self._keys.clear()
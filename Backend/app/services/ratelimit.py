@@ -0,0 +1,132 @@
+"""
+Adaptive pacing of upstream downloads.
+
+A token bucket caps the request rate outright. Within that cap the
+FetchController grows the batch size and shortens the pause between batches
+while responses are healthy, and on throttling (a RateLimited error or a
+mostly empty download) halves the batch, doubles the pause and backs off
+exponentially with jitter. Like TCP congestion control, growth slows down
+above half the batch size that was last throttled. Every cycle also has a
+request budget.
+"""
+import asyncio
+import random
+import time
+from typing import Callable, Optional
+from app.config import settings
+
+class RateLimited(Exception):
+    """Upstream refused or silently dropped a request (HTTP 429, empty response)."""
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1.0):
+        while not self.try_acquire(tokens):
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+class FetchController:
+    MIN_BATCH_SIZE = 5
+    BATCH_STEP = 10
+    # Above the threshold the batch only grows every this many healthy batches
+    PROBE_EVERY = 4
+    # A download returning fewer symbols than this share counts as throttled
+    MIN_RETURNED_SHARE = 0.5
+    # Below this share the pace is reduced in proportion; above it a few
+    # missing symbols (e.g. delisted) just hold the current pace
+    PARTIAL_SHARE = 0.9
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        max_batch_size: Optional[int] = None,
+        min_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        requests_per_second: Optional[float] = None,
+        burst: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+        cycle_budget: Optional[int] = None,
+        rng: Callable[[float, float], float] = random.uniform
+    ):
+        self.max_batch_size = max_batch_size or settings.FETCH_MAX_BATCH_SIZE
+        self.batch_size = min(batch_size or settings.FETCH_BATCH_SIZE, self.max_batch_size)
+        self.min_delay = settings.FETCH_MIN_DELAY if min_delay is None else min_delay
+        self.max_delay = settings.FETCH_MAX_DELAY if max_delay is None else max_delay
+        self.delay = self.min_delay
+        self.max_backoff = max_backoff or settings.FETCH_MAX_BACKOFF
+        self.cycle_budget = cycle_budget or settings.FETCH_CYCLE_BUDGET
+        self.bucket = TokenBucket(
+            requests_per_second or settings.FETCH_REQUESTS_PER_SECOND,
+            burst or settings.FETCH_BURST
+        )
+        self.rng = rng
+        self.threshold = self.max_batch_size
+        self.failures = 0
+        self.successes = 0
+        self.requests = 0
+        self.paused_until = 0.0
+
+    def start_cycle(self):
+        self.requests = 0
+
+    @property
+    def budget_left(self) -> int:
+        return self.cycle_budget - self.requests
+
+    def pause(self, seconds: float):
+        """Holds back every download (not just the throttled one) for `seconds`."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Waits for a request slot; counts against the cycle budget."""
+        while (wait := self.paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+        await self.bucket.acquire()
+        self.requests += 1
+
+    def looks_throttled(self, requested: int, returned: int) -> bool:
+        return requested > 0 and returned < requested * self.MIN_RETURNED_SHARE
+
+    def on_success(self, returned_share: float = 1.0):
+        """Additive increase after a complete download; a partial one holds or reduces the pace."""
+        self.failures = 0
+        if returned_share < self.PARTIAL_SHARE:
+            self.successes = 0
+            self.batch_size = max(self.MIN_BATCH_SIZE, int(self.batch_size * returned_share))
+            self.threshold = self.batch_size
+            self.delay = min(self.max_delay, max(self.delay, self.min_delay) * 1.5)
+            return
+        if returned_share < 1.0:
+            return
+        self.successes += 1
+        if self.batch_size < self.threshold or self.successes % self.PROBE_EVERY == 0:
+            self.batch_size = min(self.max_batch_size, self.batch_size + self.BATCH_STEP)
+        self.delay = max(self.min_delay, self.delay * 0.75)
+
+    def on_throttle(self) -> float:
+        """Multiplicative decrease; returns the backoff to wait before retrying."""
+        self.failures += 1
+        self.successes = 0
+        self.batch_size = max(self.MIN_BATCH_SIZE, self.batch_size // 2)
+        self.threshold = self.batch_size
+        self.delay = min(self.max_delay, max(self.delay, self.min_delay) * 2)
+        backoff = min(self.max_backoff, self.delay * 2 ** (self.failures - 1))
+        # "Equal jitter": at least half the backoff, so retries stay spaced out
+        return backoff / 2 + self.rng(0, backoff / 2)
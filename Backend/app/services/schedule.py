@@ -0,0 +1,157 @@
+"""
+When to refresh which symbols.
+
+The NSE session calendar (IST): pre-open 09:00-09:15, continuous trading
+09:15-15:30, closed on weekends and on the year's NSE holidays. While the market is open,
+hot symbols (watchlisted, recently viewed, breakout candidates) are due every
+HOT_REFRESH_SECONDS and the rest every REFRESH_INTERVAL_SECONDS. During
+pre-open only hot symbols refresh. Once a session has closed, every symbol
+is refreshed one more time to pick up the settled closing bar, and after that
+the last snapshot is served until the next session.
+"""
+import functools
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+from app.config import settings
+from app.services import metrics
+
+IST = timezone(timedelta(hours=5, minutes=30), "IST")
+
+PRE_OPEN = (9, 0)
+OPEN = (9, 15)
+CLOSE = (15, 30)
+
+def market_now() -> datetime:
+    return datetime.now(IST)
+
+@functools.lru_cache(maxsize=None)
+def holidays(year: int) -> FrozenSet[str]:
+    """
+    NSE holidays of `year` as ISO dates. A year without a holiday list is
+    traded on every weekday, with a warning and the
+    stock_calendar_unlisted_year gauge set, so the refresh loop keeps going
+    across the new year until its list is added.
+    """
+    extra = [d for d in settings.NSE_HOLIDAYS if d.startswith(f"{year}-")]
+    listed = settings.NSE_HOLIDAYS_BY_YEAR.get(year)
+    if listed is None and not extra:
+        print(
+            f"WARNING: No NSE holiday list for {year}, treating every weekday as a trading day: "
+            "add it to NSE_HOLIDAYS_BY_YEAR or set NSE_HOLIDAYS",
+            flush=True
+        )
+        metrics.CALENDAR_UNLISTED_YEAR.set(year)
+    return frozenset(listed or ()) | frozenset(extra)
+
+def is_trading_day(day: date) -> bool:
+    return day.weekday() < 5 and day.isoformat() not in holidays(day.year)
+
+def _at(day: date, hour_minute) -> datetime:
+    return datetime(day.year, day.month, day.day, *hour_minute, tzinfo=IST)
+
+def market_phase(now: datetime) -> str:
+    """"pre_open", "open" or "closed"."""
+    if settings.MARKET_SCHEDULE == "always":
+        return "open"
+    now = now.astimezone(IST)
+    if not is_trading_day(now.date()):
+        return "closed"
+    if _at(now.date(), PRE_OPEN) <= now < _at(now.date(), OPEN):
+        return "pre_open"
+    if _at(now.date(), OPEN) <= now < _at(now.date(), CLOSE):
+        return "open"
+    return "closed"
+
+def last_settled_close(now: datetime) -> Optional[datetime]:
+    """The close of the latest session whose bars have settled (CLOSE_SETTLE_SECONDS after close)."""
+    now = now.astimezone(IST)
+    settle = timedelta(seconds=settings.CLOSE_SETTLE_SECONDS)
+    day = now.date()
+    for _ in range(15):
+        if is_trading_day(day) and _at(day, CLOSE) + settle <= now:
+            return _at(day, CLOSE)
+        day -= timedelta(days=1)
+    return None
+
+def next_session_start(now: datetime) -> datetime:
+    """Start of the next pre-open (or of today's, if still ahead)."""
+    now = now.astimezone(IST)
+    day = now.date()
+    while True:
+        if is_trading_day(day) and _at(day, PRE_OPEN) > now:
+            return _at(day, PRE_OPEN)
+        day += timedelta(days=1)
+
+# --- Recently Viewed ---
+
+RECENT_VIEWS: Dict[str, float] = {}
+
+def record_view(symbol: str):
+    RECENT_VIEWS[symbol] = time.time()
+
+def recently_viewed(now: Optional[float] = None) -> Set[str]:
+    cutoff = (now or time.time()) - settings.RECENT_VIEW_SECONDS
+    for symbol in [s for s, seen in RECENT_VIEWS.items() if seen < cutoff]:
+        del RECENT_VIEWS[symbol]
+    return set(RECENT_VIEWS)
+
+# --- Scheduler ---
+
+class RefreshScheduler:
+    """Tracks when each symbol was last refreshed and decides which are due."""
+
+    def __init__(self):
+        self.last_refreshed: Dict[str, float] = {}
+
+    def mark_refreshed(self, symbols: Iterable[str], at: Optional[float] = None):
+        at = time.time() if at is None else at
+        for symbol in symbols:
+            self.last_refreshed[symbol] = at
+
+    def _stale(self, symbols: Iterable[str], older_than: float) -> List[str]:
+        return [s for s in symbols if self.last_refreshed.get(s, 0.0) <= older_than]
+
+    def due_symbols(self, symbols: List[str], hot: Set[str], now: Optional[datetime] = None) -> List[str]:
+        """Symbols to refresh now, hot ones first."""
+        now = now or market_now()
+        ts = now.timestamp()
+        phase = market_phase(now)
+
+        # Never fetched (e.g. just started): load them whatever the session
+        due = [s for s in symbols if s not in self.last_refreshed]
+        if phase == "open":
+            due += self._stale([s for s in symbols if s in hot], ts - settings.HOT_REFRESH_SECONDS)
+            due += self._stale(symbols, ts - settings.REFRESH_INTERVAL_SECONDS)
+        elif phase == "pre_open":
+            due += self._stale([s for s in symbols if s in hot], ts - settings.HOT_REFRESH_SECONDS)
+        else:
+            close = last_settled_close(now)
+            if close is not None:
+                # Closing sweep: anything last fetched before the bars settled
+                due += self._stale(symbols, close.timestamp() + settings.CLOSE_SETTLE_SECONDS)
+
+        ordered = list(dict.fromkeys(due))
+        return [s for s in ordered if s in hot] + [s for s in ordered if s not in hot]
+
+    def seconds_until_due(self, symbols: List[str], hot: Set[str], now: Optional[datetime] = None) -> float:
+        """How long the refresh loop can sleep before something becomes due."""
+        now = now or market_now()
+        ts = now.timestamp()
+        phase = market_phase(now)
+
+        if phase in ("open", "pre_open"):
+            waits = [self.last_refreshed.get(s, 0.0) + settings.HOT_REFRESH_SECONDS - ts for s in symbols if s in hot]
+            if phase == "open":
+                waits += [self.last_refreshed.get(s, 0.0) + settings.REFRESH_INTERVAL_SECONDS - ts for s in symbols]
+            else:
+                waits.append((_at(now.date(), OPEN) - now).total_seconds())
+            # Hot symbols can change at any time (watchlist, views)
+            return max(1.0, min(waits + [settings.HOT_REFRESH_SECONDS]))
+
+        # Closed: wake for the next session or the next closing sweep
+        wake = next_session_start(now)
+        today_sweep = _at(now.date(), CLOSE) + timedelta(seconds=settings.CLOSE_SETTLE_SECONDS)
+        if is_trading_day(now.date()) and now < today_sweep:
+            wake = min(wake, today_sweep)
+        return max(1.0, min((wake - now).total_seconds(), settings.CLOSED_POLL_SECONDS))
@@ -0,0 +1,488 @@
+"""
+Screens: filter expressions over every record field.
+
+    indicators.rsi_value < 30 and is_high_volume and current_price > ema_50
+    sector in ("IT", "Pharma") and not flags.is_loser_today
+    volume > 1.5 * avg(volume) and 40 <= rsi < 60
+
+An expression is tokenized, parsed by recursive descent and compiled into a
+tree of closures over `StockColumns`, so evaluating it against a snapshot is
+a handful of NumPy operations on whole columns. Plans are cached by their
+normalized token stream, so spacing, keyword case and field aliases do not
+produce new plans.
+
+Fields are the dotted RECORD_FIELDS paths; a field's last part alone also
+works when it is unique (`rsi_value`), as do the ALIASES. Missing values
+(NaN, or None in a string field) fail every comparison, `!=` and `not in`
+included; only `not (...)` inverts them.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional
+import numpy as np
+from app.config import settings
+from app.schemas import StockResponse
+from app.services.columns import RECORD_FIELDS, Categorical, StockColumns
+
+# Short names, mostly matching the sort keys
+ALIASES = {
+    "price": "current_price",
+    "change": "current_change_pct",
+    "avg_3day": "history.avg_3_day_change_pct",
+    "volatility": "history.volatility_3_day",
+    "rsi": "indicators.rsi_value",
+    "macd": "indicators.macd_line",
+    "signal": "indicators.signal_line",
+    "hist": "indicators.macd_histogram",
+    "strength": "indicators.buyer_strength_score",
+}
+
+def _field_names() -> Dict[str, str]:
+    names = {path: path for path in RECORD_FIELDS}
+    leaves: Dict[str, List[str]] = {}
+    for path in RECORD_FIELDS:
+        leaves.setdefault(path.rsplit(".", 1)[-1], []).append(path)
+    names.update((leaf, paths[0]) for leaf, paths in leaves.items() if len(paths) == 1 and leaf not in names)
+    names.update(ALIASES)
+    return names
+
+# Every accepted field name and the RECORD_FIELDS path it stands for
+FIELD_NAMES = _field_names()
+
+# --- Tokenizer ---
+
+KEYWORDS = {"and", "or", "not", "in", "true", "false"}
+# Functions of whole columns; avg and median reduce over the stocks of a snapshot (or of a date)
+FUNCTIONS = {"abs": 1, "min": 2, "max": 2, "avg": 1, "median": 1}
+OPERATORS = {"=": "==", "<>": "!=", "×": "*", "&&": "and", "||": "or", "!": "not"}
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<string>"[^"]*"|'[^']*')
+  | (?P<name>[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)
+  | (?P<op><=|>=|==|!=|<>|&&|\|\||[-+*/<>=(),×!])
+""", re.VERBOSE)
+
+class Token(NamedTuple):
+    kind: str  # number, string, field, function, keyword, op or end
+    value: Any
+    position: int
+
+def tokenize(expression: str) -> List[Token]:
+    """Tokens of `expression`, normalized: keywords lower-cased, field names resolved to their path."""
+    tokens = []
+    position = 0
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if not match:
+            raise ValueError(f"Unexpected {expression[position]!r} at position {position}")
+        kind, text = match.lastgroup, match.group()
+        if kind == "number":
+            tokens.append(Token("number", float(text), position))
+        elif kind == "string":
+            tokens.append(Token("string", text[1:-1], position))
+        elif kind == "name":
+            name = text.lower()
+            if name in KEYWORDS:
+                tokens.append(Token("keyword", name, position))
+            elif name in FUNCTIONS:
+                tokens.append(Token("function", name, position))
+            elif name in FIELD_NAMES:
+                tokens.append(Token("field", FIELD_NAMES[name], position))
+            else:
+                raise ValueError(f"Unknown field {text!r} at position {position}")
+        elif kind == "op":
+            text = OPERATORS.get(text, text)
+            tokens.append(Token("keyword" if text in KEYWORDS else "op", text, position))
+        position = match.end()
+    tokens.append(Token("end", None, len(expression)))
+    return tokens
+
+def normalize(tokens: List[Token]) -> str:
+    """Canonical text of a token stream; equal for expressions that compile to the same plan."""
+    parts = []
+    for token in tokens[:-1]:
+        if token.kind in ("number", "string"):
+            parts.append(repr(token.value))
+        else:
+            parts.append(token.value)
+    return " ".join(parts)
+
+# --- Compiler ---
+
+class Node(NamedTuple):
+    """A compiled subexpression: its type (num, bool or str) and how to evaluate it."""
+    kind: str
+    evaluate: Callable[[StockColumns], Any]
+    # Value of constant subexpressions, which are folded at compile time
+    constant: Any = None
+    # RECORD_FIELDS path of a bare field
+    field: Optional[str] = None
+
+def _constant(kind: str, value: Any) -> Node:
+    return Node(kind, lambda columns: value, constant=value)
+
+def _combine(kind: str, function: Callable, *operands: Node) -> Node:
+    """Applies `function` to the values of `operands`, folding it when they are all constant."""
+    if all(operand.constant is not None for operand in operands):
+        return _constant(kind, function(*(operand.constant for operand in operands)))
+    evaluators = [operand.evaluate for operand in operands]
+    return Node(kind, lambda columns: function(*(evaluate(columns) for evaluate in evaluators)))
+
+def _not_equal(a, b):
+    # False where either side is NaN, like the other comparisons
+    return np.less(a, b) | np.greater(a, b)
+
+COMPARISONS = {
+    "<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal, "==": np.equal, "!=": _not_equal
+}
+ARITHMETIC = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.true_divide}
+def _average(values):
+    # Over the stocks (last axis), kept for broadcasting; NaN when none has a value
+    if np.ndim(values) == 0:
+        return values
+    present = ~np.isnan(values)
+    return np.where(present, values, 0.0).sum(axis=-1, keepdims=True) / present.sum(axis=-1, keepdims=True)
+
+def _median(values):
+    if np.ndim(values) == 0:
+        return values
+    # nanmedian warns on all-NaN rows, so they are taken as 0 and put back to NaN
+    missing = np.isnan(values).all(axis=-1, keepdims=True)
+    return np.where(missing, np.nan, np.nanmedian(np.where(missing, 0.0, values), axis=-1, keepdims=True))
+
+FUNCTION_IMPLEMENTATIONS = {"abs": np.abs, "min": np.fmin, "max": np.fmax, "avg": _average, "median": _median}
+
+def _string_equal(column: Categorical, value: str) -> np.ndarray:
+    return column.codes == column.categories.get(value, -2)
+
+def _string_not_equal(column: Categorical, value: str) -> np.ndarray:
+    # A missing value (code -1) fails `!=` too
+    return (column.codes >= 0) & ~_string_equal(column, value)
+
+def _not_in_categories(column: Categorical, values: List[str]) -> np.ndarray:
+    return (column.codes >= 0) & ~column.isin(values)
+
+def _not_in(column, values) -> np.ndarray:
+    # False for NaN, which np.isin reports as not found
+    return ~np.isin(column, values) & ~np.isnan(column)
+
+class Parser:
+    """
+    Recursive descent over the grammar:
+
+        or         := and ("or" and)*
+        and        := not ("and" not)*
+        not        := "not" not | comparison
+        comparison := sum (("<" | "<=" | ">" | ">=" | "==" | "!=") sum)*
+                    | sum ["not"] "in" "(" literal ("," literal)* ")"
+        sum        := product (("+" | "-") product)*
+        product    := unary (("*" | "/") unary)*
+        unary      := "-" unary | number | string | "true" | "false"
+                    | field | function "(" or ("," or)* ")" | "(" or ")"
+
+    Chained comparisons mean `a < b and b < c`.
+    """
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.index = 0
+        self.fields: set = set()
+
+    @property
+    def token(self) -> Token:
+        return self.tokens[self.index]
+
+    def error(self, message: str, token: Optional[Token] = None) -> ValueError:
+        token = token or self.token
+        found = "end of expression" if token.kind == "end" else repr(token.value)
+        return ValueError(f"{message} at position {token.position} (found {found})")
+
+    def accept(self, *values: str) -> Optional[Token]:
+        token = self.token
+        if token.kind in ("op", "keyword") and token.value in values:
+            self.index += 1
+            return token
+        return None
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            raise self.error(f"Expected {value!r}")
+
+    def check(self, node: Node, kind: str, token: Token) -> Node:
+        if node.kind != kind:
+            raise self.error(f"Expected a {kind} operand, not {node.kind}", token)
+        return node
+
+    def parse(self) -> Node:
+        node = self.parse_or()
+        if self.token.kind != "end":
+            raise self.error("Unexpected token")
+        if node.kind != "bool":
+            raise self.error(f"A screen must be a condition, not a {node.kind} value", self.tokens[0])
+        return node
+
+    def parse_or(self) -> Node:
+        start = self.token
+        node = self.parse_and()
+        while True:
+            token = self.accept("or")
+            if not token:
+                return node
+            node = _combine("bool", np.logical_or, self.check(node, "bool", start), self.check(self.parse_and(), "bool", token))
+
+    def parse_and(self) -> Node:
+        start = self.token
+        node = self.parse_not()
+        while True:
+            token = self.accept("and")
+            if not token:
+                return node
+            node = _combine("bool", np.logical_and, self.check(node, "bool", start), self.check(self.parse_not(), "bool", token))
+
+    def parse_not(self) -> Node:
+        token = self.accept("not")
+        if token:
+            return _combine("bool", np.logical_not, self.check(self.parse_not(), "bool", token))
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> Node:
+        start = self.token
+        left = self.parse_sum()
+        negated = self.token.value == "not" and self.tokens[self.index + 1].value == "in"
+        if negated:
+            self.index += 1
+        if self.accept("in"):
+            return self.parse_in(left, start, negated)
+
+        result = None
+        while True:
+            token = self.accept(*COMPARISONS)
+            if not token:
+                return left if result is None else result
+            right = self.parse_sum()
+            node = self.compare(token, left, right)
+            result = node if result is None else _combine("bool", np.logical_and, result, node)
+            left = right
+
+    def compare(self, token: Token, left: Node, right: Node) -> Node:
+        operator = token.value
+        if left.kind == "num" and right.kind == "num":
+            return _combine("bool", COMPARISONS[operator], left, right)
+        if left.kind == "bool" and right.kind == "bool" and operator in ("==", "!="):
+            return _combine("bool", np.equal if operator == "==" else np.not_equal, left, right)
+        if left.kind == "str" and right.kind == "str" and operator in ("==", "!="):
+            # A string field against a string literal, compared on the Categorical's codes
+            field, value = (left, right.constant) if right.constant is not None else (right, left.constant)
+            if field.field is None or value is None:
+                raise self.error("Strings can only be compared with a quoted value", token)
+            evaluate = field.evaluate
+            if operator == "==":
+                return Node("bool", lambda columns: _string_equal(evaluate(columns), value))
+            return Node("bool", lambda columns: _string_not_equal(evaluate(columns), value))
+        raise self.error(f"Cannot compare {left.kind} with {right.kind} using {operator!r}", token)
+
+    def parse_in(self, left: Node, start: Token, negated: bool = False) -> Node:
+        self.expect("(")
+        values = []
+        while True:
+            token = self.token
+            if token.kind not in ("number", "string"):
+                raise self.error("Expected a number or a quoted value")
+            kind = "num" if token.kind == "number" else "str"
+            if kind != left.kind:
+                raise self.error(f"Cannot look up a {kind} value in a {left.kind} operand")
+            values.append(token.value)
+            self.index += 1
+            if not self.accept(","):
+                break
+        self.expect(")")
+        evaluate = left.evaluate
+        if left.kind == "str":
+            if left.field is None:
+                raise self.error("Only string fields can be looked up", start)
+            if negated:
+                return Node("bool", lambda columns: _not_in_categories(evaluate(columns), values))
+            return Node("bool", lambda columns: evaluate(columns).isin(values))
+        if negated:
+            return _combine("bool", lambda column: _not_in(column, values), left)
+        return _combine("bool", lambda column: np.isin(column, values), left)
+
+    def parse_sum(self) -> Node:
+        start = self.token
+        node = self.parse_product()
+        while True:
+            token = self.accept("+", "-")
+            if not token:
+                return node
+            node = _combine("num", ARITHMETIC[token.value], self.check(node, "num", start),
+                            self.check(self.parse_product(), "num", token))
+
+    def parse_product(self) -> Node:
+        start = self.token
+        node = self.parse_unary()
+        while True:
+            token = self.accept("*", "/")
+            if not token:
+                return node
+            node = _combine("num", ARITHMETIC[token.value], self.check(node, "num", start),
+                            self.check(self.parse_unary(), "num", token))
+
+    def parse_unary(self) -> Node:
+        token = self.token
+        if self.accept("-"):
+            return _combine("num", np.negative, self.check(self.parse_unary(), "num", token))
+        if self.accept("("):
+            node = self.parse_or()
+            self.expect(")")
+            return node
+        if token.kind in ("number", "string"):
+            self.index += 1
+            return _constant("num" if token.kind == "number" else "str", token.value)
+        if token.kind == "keyword" and token.value in ("true", "false"):
+            self.index += 1
+            return _constant("bool", token.value == "true")
+        if token.kind == "field":
+            self.index += 1
+            return self.field(token.value)
+        if token.kind == "function":
+            self.index += 1
+            return self.function(token)
+        raise self.error("Expected a value")
+
+    def field(self, path: str) -> Node:
+        self.fields.add(path)
+        kind = RECORD_FIELDS[path]
+        return Node(
+            "bool" if kind is bool else "str" if kind is str else "num",
+            lambda columns: columns.field(path),
+            field=path
+        )
+
+    def function(self, token: Token) -> Node:
+        self.expect("(")
+        arguments = []
+        while True:
+            start = self.token
+            arguments.append(self.check(self.parse_or(), "num", start))
+            if not self.accept(","):
+                break
+        self.expect(")")
+        if len(arguments) != FUNCTIONS[token.value]:
+            raise self.error(f"{token.value}() takes {FUNCTIONS[token.value]} argument(s)", token)
+        return _combine("num", FUNCTION_IMPLEMENTATIONS[token.value], *arguments)
+
+class Screen:
+    """
+    A compiled expression; `mask` evaluates it against one snapshot's
+    columns, or against a backtest's HistoryColumns for every date at once.
+    """
+
+    __slots__ = ("expression", "fields", "_evaluate")
+
+    def __init__(self, expression: str, fields: FrozenSet[str], evaluate: Callable[[StockColumns], Any]):
+        # Normalized text, the plan cache key
+        self.expression = expression
+        # RECORD_FIELDS paths the expression reads
+        self.fields = fields
+        self._evaluate = evaluate
+
+    def mask(self, columns: StockColumns) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = self._evaluate(columns)
+        if np.ndim(result) == 0:
+            # Constant expressions, e.g. "true"
+            return np.full(columns.size, bool(result))
+        return result
+
+    def select(self, columns: StockColumns) -> List[StockResponse]:
+        """Matching records, in the columns' order."""
+        return columns.take(np.flatnonzero(self.mask(columns)))
+
+# --- Plan Cache ---
+
+class PlanCache:
+    """Least recently used compiled screens, by normalized expression."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._plans: "OrderedDict[str, Screen]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def compile(self, expression: str) -> Screen:
+        """The plan for `expression`; raises ValueError if it is not a valid screen."""
+        tokens = tokenize(expression)
+        key = normalize(tokens)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+
+        parser = Parser(tokens)
+        node = parser.parse()
+        plan = Screen(key, frozenset(parser.fields), node.evaluate)
+        with self._lock:
+            self._plans[key] = plan
+            if len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        return plan
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+PLANS = PlanCache(settings.SCREEN_PLAN_CACHE_SIZE)
+
+def compile_screen(expression: str) -> Screen:
+    return PLANS.compile(expression)
+
+# --- Saved Screens ---
+
+class SavedScreen(NamedTuple):
+    name: str
+    # As entered; `screen` holds the compiled plan
+    expression: str
+    screen: Screen
+    # Changes whenever the name is saved again, so responses for it can be told apart
+    revision: int
+
+class ScreenStore:
+    """Named screens, compiled when saved (in memory, like the watchlist)."""
+
+    def __init__(self, max_screens: int):
+        self.max_screens = max_screens
+        self._screens: Dict[str, SavedScreen] = {}
+        self._revision = 0
+
+    def __len__(self) -> int:
+        return len(self._screens)
+
+    def get(self, name: str) -> Optional[SavedScreen]:
+        return self._screens.get(name)
+
+    def all(self) -> List[SavedScreen]:
+        return list(self._screens.values())
+
+    def save(self, name: str, expression: str) -> SavedScreen:
+        """Saves (or replaces) `name`; raises ValueError for an invalid expression or a full store."""
+        screen = compile_screen(expression)
+        if name not in self._screens and len(self._screens) >= self.max_screens:
+            raise ValueError(f"At most {self.max_screens} screens can be saved")
+        self._revision += 1
+        saved = self._screens[name] = SavedScreen(name, expression, screen, self._revision)
+        return saved
+
+    def delete(self, name: str) -> bool:
+        return self._screens.pop(name, None) is not None
+
+    def counts(self, columns: StockColumns) -> Dict[str, int]:
+        """Number of matching records per saved screen."""
+        return {name: int(np.count_nonzero(saved.screen.mask(columns))) for name, saved in self._screens.items()}
+
+SCREENS = ScreenStore(settings.MAX_SAVED_SCREENS)
@@ -0,0 +1,122 @@
+"""
+Sector and market aggregates of a published snapshot.
+
+Each snapshot carries per-sector sums (stocks, change %, 3-day average,
+gainers, uptrends, high volume, buyer strength) as arrays indexed by
+sector code, reduced with `np.bincount`. A batch publish does not redo
+them: the contributions of the replaced and removed records are
+subtracted and those of the new records added, so the cost follows the
+batch, not the universe. Averages are derived from the sums when served.
+
+Subtracting floats leaves rounding residue behind, so sums with nothing
+left behind them are reset to exactly 0, and `updates` counts the batches
+since the last full build for the publisher to rebuild every
+SECTOR_REBUILD_EVERY of them.
+"""
+import itertools
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from app.schemas import SectorSummary, StockResponse
+
+# Summed per sector; NaN values are left out of both the sum and the count
+METRICS = ("change_pct", "avg_3day", "gainers", "uptrend", "high_volume", "strength")
+
+def _values(stocks: List[StockResponse]) -> np.ndarray:
+    """(stocks, METRICS) contributions of each record."""
+    flat = itertools.chain.from_iterable(
+        (
+            stock.current_change_pct,
+            stock.history.avg_3_day_change_pct,
+            stock.flags.is_gainer_today,
+            stock.indicators.trend == "uptrend",
+            stock.flags.is_high_volume,
+            stock.indicators.buyer_strength_score,
+        )
+        for stock in stocks
+    )
+    return np.fromiter(flat, dtype=np.float64, count=len(stocks) * len(METRICS)).reshape(-1, len(METRICS))
+
+class SectorStats:
+    """Per-sector sums over a snapshot's records; immutable, `updated` returns a copy."""
+
+    __slots__ = ("codes", "stocks", "sums", "observed", "updates")
+
+    def __init__(
+        self, codes: Dict[str, int], stocks: np.ndarray, sums: np.ndarray, observed: np.ndarray, updates: int = 0
+    ):
+        # Sector name -> row of the arrays; sectors whose stocks all left keep their row with 0 stocks
+        self.codes = codes
+        self.stocks = stocks
+        # (sectors, METRICS); `observed` counts the non-NaN values behind each sum
+        self.sums = sums
+        self.observed = observed
+        # Incremental updates since the sums were last built from scratch
+        self.updates = updates
+
+    @classmethod
+    def empty(cls) -> "SectorStats":
+        return cls({}, np.zeros(0, dtype=np.int64), np.zeros((0, len(METRICS))), np.zeros((0, len(METRICS)), dtype=np.int64))
+
+    @classmethod
+    def build(cls, stocks: Iterable[StockResponse]) -> "SectorStats":
+        built = cls.empty().updated((), stocks)
+        built.updates = 0
+        return built
+
+    def updated(self, removed: Iterable[StockResponse], added: Iterable[StockResponse]) -> "SectorStats":
+        """Sums with the `removed` records taken out and the `added` ones put in."""
+        removed, added = list(removed), list(added)
+        codes = dict(self.codes)
+        for stock in added:
+            codes.setdefault(stock.sector or "Unknown", len(codes))
+        size = len(codes)
+
+        stocks = np.zeros(size, dtype=np.int64)
+        sums = np.zeros((size, len(METRICS)))
+        observed = np.zeros((size, len(METRICS)), dtype=np.int64)
+        stocks[:len(self.codes)] = self.stocks
+        sums[:len(self.codes)] = self.sums
+        observed[:len(self.codes)] = self.observed
+
+        for records, sign in ((removed, -1), (added, 1)):
+            if not records:
+                continue
+            rows = np.array([codes[stock.sector or "Unknown"] for stock in records], dtype=np.int64)
+            values = _values(records)
+            present = ~np.isnan(values)
+            # One bincount for every (sector, metric) cell
+            cells = (rows[:, None] * len(METRICS) + np.arange(len(METRICS))).ravel()
+            shape = (size, len(METRICS))
+            stocks += sign * np.bincount(rows, minlength=size)
+            sums += sign * np.bincount(cells, weights=np.where(present, values, 0.0).ravel(), minlength=sums.size).reshape(shape)
+            observed += sign * np.bincount(cells, weights=present.ravel(), minlength=sums.size).reshape(shape).astype(np.int64)
+        # A sum over no values is 0, not what the subtractions left over
+        sums[observed == 0] = 0.0
+        return SectorStats(codes, stocks, sums, observed, self.updates + 1)
+
+    def _summary(self, sector: str, stocks: int, sums: np.ndarray, observed: np.ndarray) -> SectorSummary:
+        def mean(metric: str, scale: float = 1.0) -> Optional[float]:
+            k = METRICS.index(metric)
+            return round(float(sums[k] / observed[k] * scale), 2) if observed[k] else None
+
+        return SectorSummary(
+            sector=sector,
+            stocks=int(stocks),
+            avg_change_pct=mean("change_pct"),
+            avg_3_day_change_pct=mean("avg_3day"),
+            gainers_pct=mean("gainers", 100),
+            uptrend_pct=mean("uptrend", 100),
+            high_volume_pct=mean("high_volume", 100),
+            avg_buyer_strength=mean("strength")
+        )
+
+    def sectors(self) -> List[SectorSummary]:
+        """One summary per sector that has stocks, by sector name."""
+        return [
+            self._summary(sector, self.stocks[row], self.sums[row], self.observed[row])
+            for sector, row in sorted(self.codes.items()) if self.stocks[row] > 0
+        ]
+
+    def market(self) -> SectorSummary:
+        """All sectors together."""
+        return self._summary("All", self.stocks.sum(), self.sums.sum(axis=0), self.observed.sum(axis=0))
@@ -0,0 +1,161 @@
+"""
+Immutable snapshots of the published F&O universe.
+
+`update_cache` builds each Snapshot off to the side and publishes it by
+replacing a single reference, so a reader that takes the current snapshot
+once sees records, indexes, columns and ranks of one and the same version,
+without locks or copies. Consecutive snapshots share the records that did
+not change; only the containers are new, which keeps a history of recent
+snapshots cheap. The symbol and sector indexes are views over the columns,
+so publishing does not rebuild a dict of the whole universe.
+"""
+import time
+from collections.abc import Mapping as MappingABC
+import numpy as np
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+from app.schemas import StockResponse
+from app.services.columns import StockColumns
+from app.services.sectors import SectorStats
+
+def _group_by_sector(columns: StockColumns) -> Dict[str, Tuple[str, ...]]:
+    """Symbols of each sector (None as "Unknown") in row order, grouped on the sector codes."""
+    sectors = columns.sector
+    codes = sectors.codes.copy()
+    codes[codes < 0] = sectors.categories.get("Unknown", -1)
+    # A stable sort of small integer codes keeps row order within each sector
+    order = np.argsort(codes, kind="stable")
+    names = {code: sector for sector, code in sectors.categories.items()}
+    names[-1] = "Unknown"
+    return {
+        names[int(codes[group[0]])]: tuple(columns.symbol[group].tolist())
+        for group in np.split(order, np.flatnonzero(np.diff(codes[order])) + 1) if len(group)
+    }
+
+class _SymbolView(MappingABC):
+    """Read-only mapping keyed by the symbols of `columns`, in rank order."""
+    __slots__ = ("_columns",)
+
+    def __init__(self, columns: StockColumns):
+        self._columns = columns
+
+    def __len__(self) -> int:
+        return self._columns.size
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns.symbol.tolist())
+
+    def __contains__(self, symbol) -> bool:
+        return self._columns.row(symbol) is not None
+
+    def _value(self, row: int):
+        raise NotImplementedError
+
+    def __getitem__(self, symbol: str):
+        row = self._columns.row(symbol)
+        if row is None:
+            raise KeyError(symbol)
+        return self._value(row)
+
+    def get(self, symbol: str, default=None):
+        row = self._columns.row(symbol)
+        return default if row is None else self._value(row)
+
+class SymbolRanks(_SymbolView):
+    """1-based rank of each symbol: its row in the snapshot's columns."""
+
+    def _value(self, row: int) -> int:
+        return row + 1
+
+class SymbolRecords(_SymbolView):
+    """Record of each symbol."""
+
+    def _value(self, row: int) -> StockResponse:
+        return self._columns.stocks[row]
+
+class SectorGroups(MappingABC):
+    """`_group_by_sector` of the columns, computed on first read rather than on publish."""
+    __slots__ = ("_columns", "_groups")
+
+    def __init__(self, columns: StockColumns):
+        self._columns = columns
+        self._groups: Optional[Dict[str, Tuple[str, ...]]] = None
+
+    def _load(self) -> Dict[str, Tuple[str, ...]]:
+        groups = self._groups
+        if groups is None:
+            groups = self._groups = _group_by_sector(self._columns)
+        return groups
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __getitem__(self, sector: str) -> Tuple[str, ...]:
+        return self._load()[sector]
+
+class Snapshot(NamedTuple):
+    version: int
+    # In Rank order
+    records: Tuple[StockResponse, ...]
+    by_symbol: Mapping[str, StockResponse]
+    # Symbols of each sector, in Rank order
+    by_sector: Mapping[str, Tuple[str, ...]]
+    ranks: Mapping[str, int]
+    columns: StockColumns
+    # Per-sector sums behind /sectors
+    sectors: SectorStats
+    # Symbols added, changed (record or rank) or removed since the previous version
+    changed: FrozenSet[str]
+    # Publish time (epoch seconds); 0 for the initial empty snapshot
+    updated: float
+
+    @classmethod
+    def build(
+        cls,
+        version: int,
+        records: Tuple[StockResponse, ...],
+        columns: StockColumns,
+        changed: Iterable[str],
+        sectors: Optional[SectorStats] = None
+    ) -> "Snapshot":
+        """
+        Snapshot of `records`, which are in rank order. `columns` must have
+        been built on this `records` tuple (not a copy), which is how
+        apply_filters recognizes them as the snapshot's columns; the symbol,
+        rank and sector indexes read them. Sector sums are computed from
+        `records` unless updated ones are given.
+        """
+        if columns.stocks is not records:
+            raise ValueError("Snapshot columns must be built on the snapshot's records")
+        return cls(
+            version=version,
+            records=records,
+            by_symbol=SymbolRecords(columns),
+            by_sector=SectorGroups(columns),
+            ranks=SymbolRanks(columns),
+            columns=columns,
+            sectors=sectors if sectors is not None else SectorStats.build(records),
+            changed=frozenset(changed),
+            updated=time.time()
+        )
+
+    @classmethod
+    def empty(cls) -> "Snapshot":
+        records: Tuple[StockResponse, ...] = ()
+        columns = StockColumns(records)
+        return cls(
+            version=0, records=records, by_symbol=SymbolRecords(columns), by_sector=SectorGroups(columns),
+            ranks=SymbolRanks(columns), columns=columns, sectors=SectorStats.empty(), changed=frozenset(),
+            updated=0.0
+        )
+
+    def get(self, symbol: str) -> Optional[StockResponse]:
+        return self.by_symbol.get(symbol)
+
+    def select(self, symbols: Iterable[str]) -> List[StockResponse]:
+        """Records of `symbols` that exist, in Rank order; cost follows len(symbols)."""
+        result = [self.by_symbol[s] for s in dict.fromkeys(symbols) if s in self.by_symbol]
+        result.sort(key=lambda stock: self.ranks[stock.symbol])
+        return result
@@ -1,31 +1,82 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import asyncio
 import time
 import traceback
+import multiprocessing
+import zlib
+from collections import deque
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Dict, Any, FrozenSet, Optional, Set, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from app.config import settings
-from app.schemas import StockResponse, StockHistory, Indicators, StockFlags, ChartDataPoint
+from app.schemas import StockResponse, StockHistory, Indicators, StockFlags
 from app.services.indicators import (
     calculate_macd, calculate_rsi, calculate_ema, calculate_sma,
-    get_macd_status, get_rsi_status, get_trend, calculate_strength
+    get_macd_status, get_rsi_status, get_trend, calculate_strength, IndicatorState
 )
+from app.services.engine import process_universe
+from app.services.charts import ChartSeries
+from app.services.columns import StockColumns
+from app.services.store import HistoryAdjusted, create_bar_store
+from app.services.providers import get_provider
+from app.services.ranking import Ranking, stability_score
+from app.services.ratelimit import FetchController, RateLimited
+from app.services.schedule import RefreshScheduler, market_now, market_phase, recently_viewed
+from app.services.sectors import SectorStats
+from app.services.snapshot import Snapshot
+from app.services.timeframes import TimeframeView
+from app.services.backtest import HistoryColumns
+from app.services.stream import broadcaster, change_entry
+from app.services.cache import cache, WATCHLIST_KEY
+from app.services import metrics
+from app.utils.serializers import dump_stocks
 
-# --- Global In-Memory Cache ---
-CACHE = {
-    "fno": {"data": [], "updated": 0},
-    "last_refresh": None
-}
+# --- Published Snapshot ---
 
-# --- Helper Functions ---
+# Replaced, never modified, on every publish; readers take it once per request
+SNAPSHOT = Snapshot.empty()
+
+# Recently published snapshots, oldest first, for `since=` deltas
+SNAPSHOT_HISTORY: deque = deque(maxlen=settings.SNAPSHOT_HISTORY)
+
+# Stability order of the published records, updated per symbol
+RANKING = Ranking()
+
+metrics.CACHE_VERSION.set_function(lambda: SNAPSHOT.version)
+metrics.CACHE_AGE_SECONDS.set_function(lambda: time.time() - SNAPSHOT.updated if SNAPSHOT.updated else float("nan"))
+metrics.SNAPSHOT_RECORDS.set_function(lambda: len(SNAPSHOT.records))
+
+# (version, bytes) of the last snapshot whose size was scraped
+_SNAPSHOT_BYTES: Tuple[int, int] = (-1, 0)
+
+def snapshot_bytes() -> int:
+    """
+    Summary-view JSON size of the published records, serialized at scrape
+    time (once per version) rather than on the publish path.
+    """
+    global _SNAPSHOT_BYTES
+    snapshot = SNAPSHOT
+    version, size = _SNAPSHOT_BYTES
+    if version != snapshot.version:
+        size = len(dump_stocks(snapshot.records, "summary", None, snapshot.ranks))
+        _SNAPSHOT_BYTES = (snapshot.version, size)
+    return size
+
+metrics.SNAPSHOT_BYTES.set_function(snapshot_bytes)
+metrics.STREAM_SUBSCRIBERS.set_function(lambda: len(broadcaster.subscribers))
+
+# --- Local Bar Store ---
 
-def get_safe_value(val, default=None):
-    if pd.isna(val):
-        return default
-    return val
+# Paces downloads across refresh cycles, and decides which symbols are due
+FETCH_CONTROLLER = FetchController()
+REFRESH_SCHEDULER = RefreshScheduler()
+metrics.FETCH_BATCH_SIZE.set_function(lambda: FETCH_CONTROLLER.batch_size)
+metrics.FETCH_DELAY_SECONDS.set_function(lambda: FETCH_CONTROLLER.delay)
+
+BAR_STORE = create_bar_store(settings.BAR_INTERVAL)
+
+# --- Helper Functions ---
 
 def get_dummy_history() -> StockHistory:
     return StockHistory(
@@ -81,291 +132,664 @@ def create_stock_response_from_fast_info(symbol: str, info: Dict) -> StockRespon
         rank=0,
         history=get_dummy_history(),
         indicators=get_dummy_indicators(),
-        flags=get_dummy_flags(),
-        chart_data=[]
+        flags=get_dummy_flags()
+    )
+
+def build_stock_response(
+    symbol: str, hist_data: pd.DataFrame, latest: Dict[str, float],
+    chart: ChartSeries, info: Dict
+) -> StockResponse:
+    """
+    Builds a StockResponse from a symbol's bars and the latest indicator values
+    (keys: macd, signal, hist, rsi, sma_20, sma_50, ema_20, ema_50).
+    """
+    # Extract OHLCV
+    closes = hist_data['Close']
+    highs = hist_data['High']
+    lows = hist_data['Low']
+    volumes = hist_data['Volume']
+
+    current_price = closes.iloc[-1]
+    prev_close = closes.iloc[-2]
+    
+    # Calculate Changes
+    current_change_abs = current_price - prev_close
+    current_change_pct = (current_change_abs / prev_close) * 100
+
+    day_1_change = ((closes.iloc[-1] - closes.iloc[-2]) / closes.iloc[-2]) * 100
+    day_2_change = ((closes.iloc[-2] - closes.iloc[-3]) / closes.iloc[-3]) * 100
+    day_3_change = ((closes.iloc[-3] - closes.iloc[-4]) / closes.iloc[-4]) * 100
+    
+    avg_3_day_change_pct = (day_1_change + day_2_change + day_3_change) / 3
+    volatility_3_day = np.std([day_1_change, day_2_change, day_3_change])
+
+    # Status & Strength
+    macd_status = get_macd_status(latest["macd"], latest["signal"], latest["hist"])
+    rsi_status = get_rsi_status(latest["rsi"])
+    trend = get_trend(current_price, latest["ema_20"], latest["ema_50"])
+    
+    avg_volume = volumes.mean()
+    buyer_score, seller_score, strength_label = calculate_strength(
+        latest["hist"], latest["rsi"], volumes.iloc[-1], avg_volume, current_price, latest["ema_20"],
+        closes.iloc[-1], highs.iloc[-1], lows.iloc[-1]
     )
 
+    # Flags
+    is_constant = abs(avg_3_day_change_pct) < 0.0001
+    is_gainer = current_change_pct > 0
+    is_loser = current_change_pct < 0
+    is_high_vol = volumes.iloc[-1] > (avg_volume * 1.5)
+    is_breakout = (current_price > highs.iloc[-20:].max()) and is_high_vol
+
+    def get_last(key):
+        value = np.float64(latest[key])
+        return round(value, 2) if not pd.isna(value) else None
+
+    return StockResponse(
+        symbol=symbol,
+        name=symbol,
+        sector=settings.SECTOR_MAPPING.get(symbol, "Unknown"),
+        current_price=round(current_price, 2),
+        previous_close=round(prev_close, 2),
+        current_change_abs=round(current_change_abs, 2),
+        current_change_pct=round(current_change_pct, 2),
+        day_high=round(info.get('dayHigh', highs.iloc[-1]), 2),
+        day_low=round(info.get('dayLow', lows.iloc[-1]), 2),
+        volume=int(info.get('volume', volumes.iloc[-1])),
+        market_cap=info.get('marketCap'),
+        last_updated=datetime.now(),
+        rank=0, # Ranks belong to the snapshot; see StockSummary.rank
+        history=StockHistory(
+            day_1_change_pct=round(day_1_change, 2),
+            day_2_change_pct=round(day_2_change, 2),
+            day_3_change_pct=round(day_3_change, 2),
+            avg_3_day_change_pct=round(avg_3_day_change_pct, 2),
+            volatility_3_day=round(volatility_3_day, 2)
+        ),
+        indicators=Indicators(
+            macd_line=get_last("macd"),
+            signal_line=get_last("signal"),
+            macd_histogram=get_last("hist"),
+            macd_status=macd_status,
+            rsi_value=get_last("rsi"),
+            rsi_status=rsi_status,
+            sma_20=get_last("sma_20"),
+            sma_50=get_last("sma_50"),
+            ema_20=get_last("ema_20"),
+            ema_50=get_last("ema_50"),
+            trend=trend,
+            buyer_strength_score=buyer_score,
+            seller_strength_score=seller_score,
+            strength_label=strength_label
+        ),
+        flags=StockFlags(
+            is_constant_price=is_constant,
+            is_gainer_today=is_gainer,
+            is_loser_today=is_loser,
+            is_high_volume=is_high_vol,
+            is_breakout_candidate=is_breakout
+        )
+    ).with_chart(chart)
+
 def process_stock_data(symbol: str, hist_data: pd.DataFrame, info: Dict) -> Optional[StockResponse]:
     try:
         if hist_data.empty or len(hist_data) < 5:
             # Fallback to fast info only if history fails
             return create_stock_response_from_fast_info(symbol, info)
 
-        # Extract OHLCV
         closes = hist_data['Close']
-        highs = hist_data['High']
-        lows = hist_data['Low']
-        volumes = hist_data['Volume']
-        opens = hist_data['Open']
-
-        current_price = closes.iloc[-1]
-        prev_close = closes.iloc[-2]
-        
-        # Calculate Changes
-        current_change_abs = current_price - prev_close
-        current_change_pct = (current_change_abs / prev_close) * 100
-
-        day_1_change = ((closes.iloc[-1] - closes.iloc[-2]) / closes.iloc[-2]) * 100
-        day_2_change = ((closes.iloc[-2] - closes.iloc[-3]) / closes.iloc[-3]) * 100
-        day_3_change = ((closes.iloc[-3] - closes.iloc[-4]) / closes.iloc[-4]) * 100
-        
-        avg_3_day_change_pct = (day_1_change + day_2_change + day_3_change) / 3
-        volatility_3_day = np.std([day_1_change, day_2_change, day_3_change])
 
         # Indicators
         macd, signal, hist = calculate_macd(closes)
-        rsi = calculate_rsi(closes)
-        sma_20 = calculate_sma(closes, 20)
-        sma_50 = calculate_sma(closes, 50)
-        ema_20 = calculate_ema(closes, 20)
-        ema_50 = calculate_ema(closes, 50)
-
-        # Status & Strength
-        macd_status = get_macd_status(macd.iloc[-1], signal.iloc[-1], hist.iloc[-1])
-        rsi_status = get_rsi_status(rsi.iloc[-1])
-        trend = get_trend(current_price, ema_20.iloc[-1], ema_50.iloc[-1])
-        
-        avg_volume = volumes.mean()
-        buyer_score, seller_score, strength_label = calculate_strength(
-            hist.iloc[-1], rsi.iloc[-1], volumes.iloc[-1], avg_volume, current_price, ema_20.iloc[-1],
-            closes.iloc[-1], highs.iloc[-1], lows.iloc[-1]
-        )
+        series = {
+            "macd": macd,
+            "signal": signal,
+            "hist": hist,
+            "rsi": calculate_rsi(closes),
+            "sma_20": calculate_sma(closes, 20),
+            "sma_50": calculate_sma(closes, 50),
+            "ema_20": calculate_ema(closes, 20),
+            "ema_50": calculate_ema(closes, 50),
+        }
 
-        # Flags
-        is_constant = abs(avg_3_day_change_pct) < 0.0001
-        is_gainer = current_change_pct > 0
-        is_loser = current_change_pct < 0
-        is_high_vol = volumes.iloc[-1] > (avg_volume * 1.5)
-        is_breakout = (current_price > highs.iloc[-20:].max()) and is_high_vol
-
-        # Chart Data (Last 60 points or available)
-        chart_data = []
-        chart_slice = hist_data.tail(60)
-        
-        for idx, row in chart_slice.iterrows():
-            date_str = idx.strftime("%Y-%m-%d") if isinstance(idx, pd.Timestamp) else str(idx)
-            
-            def get_val(series, i):
-                try:
-                    val = series.loc[i]
-                    return get_safe_value(val)
-                except:
-                    return None
-
-            chart_data.append(ChartDataPoint(
-                date=date_str,
-                open=round(row['Open'], 2),
-                high=round(row['High'], 2),
-                low=round(row['Low'], 2),
-                close=round(row['Close'], 2),
-                volume=int(row['Volume']),
-                macd=get_val(macd, idx),
-                signal=get_val(signal, idx),
-                hist=get_val(hist, idx),
-                rsi=get_val(rsi, idx),
-                ema_20=get_val(ema_20, idx),
-                ema_50=get_val(ema_50, idx)
-            ))
-
-        def get_last(series):
-            return round(series.iloc[-1], 2) if not pd.isna(series.iloc[-1]) else None
-
-        return StockResponse(
-            symbol=symbol,
-            name=symbol,
-            sector=settings.SECTOR_MAPPING.get(symbol, "Unknown"),
-            current_price=round(current_price, 2),
-            previous_close=round(prev_close, 2),
-            current_change_abs=round(current_change_abs, 2),
-            current_change_pct=round(current_change_pct, 2),
-            day_high=round(info.get('dayHigh', highs.iloc[-1]), 2),
-            day_low=round(info.get('dayLow', lows.iloc[-1]), 2),
-            volume=int(info.get('volume', volumes.iloc[-1])),
-            market_cap=info.get('marketCap'),
-            last_updated=datetime.now(),
-            rank=0, # Will be set later
-            history=StockHistory(
-                day_1_change_pct=round(day_1_change, 2),
-                day_2_change_pct=round(day_2_change, 2),
-                day_3_change_pct=round(day_3_change, 2),
-                avg_3_day_change_pct=round(avg_3_day_change_pct, 2),
-                volatility_3_day=round(volatility_3_day, 2)
-            ),
-            indicators=Indicators(
-                macd_line=get_last(macd),
-                signal_line=get_last(signal),
-                macd_histogram=get_last(hist),
-                macd_status=macd_status,
-                rsi_value=get_last(rsi),
-                rsi_status=rsi_status,
-                sma_20=get_last(sma_20),
-                sma_50=get_last(sma_50),
-                ema_20=get_last(ema_20),
-                ema_50=get_last(ema_50),
-                trend=trend,
-                buyer_strength_score=buyer_score,
-                seller_strength_score=seller_score,
-                strength_label=strength_label
-            ),
-            flags=StockFlags(
-                is_constant_price=is_constant,
-                is_gainer_today=is_gainer,
-                is_loser_today=is_loser,
-                is_high_volume=is_high_vol,
-                is_breakout_candidate=is_breakout
-            ),
-            chart_data=chart_data
-        )
+        # Chart Data (last CHART_POINTS bars or available)
+        chart = ChartSeries.from_columns(hist_data.index, {
+            **{key.lower(): hist_data[key].to_numpy() for key in ("Open", "High", "Low", "Close", "Volume")},
+            **{key: s.to_numpy() for key, s in series.items()},
+        })
+
+        latest = {key: s.iloc[-1] for key, s in series.items()}
+        return build_stock_response(symbol, hist_data, latest, chart, info)
     except Exception as e:
         # traceback.print_exc()
         print(f"Error processing {symbol}: {e}")
         return None
 
+# --- Incremental Processing ---
+
+class SymbolState:
+    """
+    Indicator state for one symbol, together with the bar range it was built
+    from and the record it last produced.
+    """
+
+    def __init__(self, hist_data: pd.DataFrame, record: StockResponse):
+        closes = hist_data['Close']
+        self.indicators = IndicatorState.from_closes(closes.to_numpy())
+        self.first_date = hist_data.index[0]
+        self.first_close = closes.iloc[0]
+        self.last_date = hist_data.index[-1]
+        self.last_close = closes.iloc[-1]
+        self.n_bars = len(hist_data)
+        self.record = record
+
+    def step_for(self, hist_data: pd.DataFrame) -> Optional[str]:
+        """
+        Returns "revise" if only the last bar of `hist_data` may differ from the
+        state, "append" if it adds exactly one bar, or None if it needs a full recompute.
+        """
+        # A moved window start or an adjusted first close (splits, dividends)
+        # means the older bars changed too
+        if len(hist_data) < 5 or hist_data.index[0] != self.first_date:
+            return None
+        if hist_data['Close'].iloc[0] != self.first_close:
+            return None
+        if len(hist_data) == self.n_bars and hist_data.index[-1] == self.last_date:
+            return "revise"
+        if len(hist_data) == self.n_bars + 1 and hist_data.index[-2] == self.last_date:
+            return "append"
+        return None
+
+    def advance(self, symbol: str, hist_data: pd.DataFrame, step: str) -> StockResponse:
+        closes = hist_data['Close']
+        chart = self.record.chart
+
+        if step == "append":
+            # The previous bar may have settled at different values than we last saw
+            settled = None
+            if closes.iloc[-2] != self.last_close:
+                settled = self.indicators.revise(float(closes.iloc[-2]))
+            chart = chart.with_bar(hist_data.index[-2], hist_data.iloc[-2], settled)
+            latest = self.indicators.update(float(closes.iloc[-1]))
+        else:
+            latest = self.indicators.revise(float(closes.iloc[-1]))
+
+        # Only the newest chart point changes
+        chart = chart.with_bar(hist_data.index[-1], hist_data.iloc[-1], latest, append=step == "append")
+
+        self.last_date = hist_data.index[-1]
+        self.last_close = closes.iloc[-1]
+        self.n_bars = len(hist_data)
+        self.record = build_stock_response(symbol, hist_data, latest, chart, {})
+        return self.record
+
+INDICATOR_STATE: Dict[str, SymbolState] = {}
+
+def process_batch(frames: Dict[str, pd.DataFrame]) -> List[StockResponse]:
+    """
+    Processes a batch of symbols.
+    Symbols whose history only gained or revised its last bar are advanced
+    incrementally; the rest go through the vectorized engine (or the
+    per-symbol path if the vectorized pass fails) and get their state reseeded.
+    """
+    results: Dict[str, StockResponse] = {}
+    full_frames = {}
+
+    for symbol, stock_df in frames.items():
+        state = INDICATOR_STATE.get(symbol)
+        step = state.step_for(stock_df) if state else None
+        if step:
+            try:
+                results[symbol] = state.advance(symbol, stock_df, step)
+                continue
+            except Exception as e:
+                print(f"Incremental update failed for {symbol}: {e}", flush=True)
+        full_frames[symbol] = stock_df
+
+    if full_frames:
+        try:
+            computed = process_universe(full_frames)
+        except Exception as e:
+            traceback.print_exc()
+            print(f"Vectorized processing failed, falling back to per-symbol: {e}", flush=True)
+            computed = [process_stock_data(symbol, df, {}) for symbol, df in full_frames.items()]
+
+        for (symbol, stock_df), stock in zip(full_frames.items(), computed):
+            if not stock:
+                continue
+            results[symbol] = stock
+            if len(stock_df) >= 5:
+                INDICATOR_STATE[symbol] = SymbolState(stock_df, stock)
+            else:
+                INDICATOR_STATE.pop(symbol, None)
+
+    return [results[symbol] for symbol in frames if symbol in results]
+
+# --- Batch Processing Pool ---
+
+_EXECUTORS: List[Executor] = []
+
+def get_executors() -> List[Executor]:
+    """
+    One single-worker executor per shard. Thread workers share INDICATOR_STATE;
+    each process worker holds the state of its own shard.
+    """
+    if not _EXECUTORS:
+        workers = max(1, settings.PROCESS_WORKERS)
+        if settings.PROCESS_POOL == "process":
+            context = multiprocessing.get_context("spawn")
+            _EXECUTORS.extend(ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(workers))
+        elif settings.PROCESS_POOL == "thread":
+            _EXECUTORS.extend(ThreadPoolExecutor(max_workers=1, thread_name_prefix="process-batch") for _ in range(workers))
+        else:
+            raise ValueError(f"Unknown process pool: {settings.PROCESS_POOL}")
+    return _EXECUTORS
+
+def shutdown_executors():
+    for executor in _EXECUTORS:
+        executor.shutdown(wait=False, cancel_futures=True)
+    _EXECUTORS.clear()
+
+async def process_batch_async(frames: Dict[str, pd.DataFrame]) -> List[StockResponse]:
+    """
+    `process_batch` on the worker pool, so indicator math and record
+    construction never run on the event loop. A symbol always goes to the
+    same worker; results keep the order of `frames`.
+    """
+    executors = get_executors()
+    shards: List[Dict[str, pd.DataFrame]] = [{} for _ in executors]
+    for symbol, stock_df in frames.items():
+        shards[zlib.crc32(symbol.encode()) % len(shards)][symbol] = stock_df
+
+    loop = asyncio.get_running_loop()
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(executor, process_batch, shard)
+        for executor, shard in zip(executors, shards) if shard
+    ))
+    results = {stock.symbol: stock for part in parts for stock in part}
+    return [results[symbol] for symbol in frames if symbol in results]
+
 def fetch_fast_info(symbol: str) -> Dict:
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.fast_info
-        return {
-            'symbol': symbol,
-            'lastPrice': info.last_price,
-            'previousClose': info.previous_close,
-            'dayHigh': info.day_high,
-            'dayLow': info.day_low,
-            'volume': info.last_volume,
-            'marketCap': info.market_cap
-        }
+        return get_provider().quote(symbol)
     except Exception:
         return {'symbol': symbol}
 
-def update_cache(stock_list: List[StockResponse]):
-    """Helper to update the global cache with a list of stocks."""
-    # Sort by absolute change pct (Stability Ranking)
-    # Rank 1 = closest to 0
-    
-    # Sort
-    stock_list.sort(key=lambda x: abs(x.history.avg_3_day_change_pct))
-    
-    # Assign Ranks
-    for i, stock in enumerate(stock_list):
-        stock.rank = i + 1
-        
-    print(f"DEBUG: update_cache sorted {len(stock_list)} stocks. Top 3: {[s.symbol for s in stock_list[:3]]}")
-    CACHE["fno"] = {"data": stock_list, "updated": time.time()}
-    CACHE["last_refresh"] = datetime.now()
+def update_cache(stocks: List[StockResponse], removed: Iterable[str] = ()):
+    """
+    Publishes a new snapshot with `stocks` added or replaced and the `removed`
+    symbols dropped (removal wins over a replacement in the same call). Only
+    those symbols are re-ranked: the other records keep their relative order,
+    so the new rank order, the rank moves and the columns' sort orders are
+    derived from the previous snapshot with array copies and a binary search
+    per changed symbol. Records do not carry their rank; it is read from the
+    snapshot's `ranks` when they are filtered, sorted or serialized.
+    """
+    global SNAPSHOT
+    started = time.perf_counter()
+    previous = SNAPSHOT
+    # Records entering this snapshot; the rest are shared with `previous`
+    entering = {stock.symbol: stock for stock in stocks}
+    replaced: Set[str] = set(entering)
+    changed = set(replaced)
+    for symbol in removed:
+        if entering.pop(symbol, None) is not None or symbol in previous.by_symbol:
+            replaced.discard(symbol)
+            changed.add(symbol)
+    # Records that leave (replaced or removed), to be taken out of the sector sums
+    left = [previous.by_symbol[symbol] for symbol in changed if symbol in previous.by_symbol]
+
+    # RANKING is updated in place; if anything below fails before the swap,
+    # the transaction puts it back to the ranking of `previous`
+    with RANKING.transaction():
+        # Re-score only what changed (O(log n) each), in batch order, which breaks ties
+        for symbol, stock in entering.items():
+            RANKING.update(symbol, stability_score(stock))
+        for symbol in changed - replaced:
+            RANKING.remove(symbol)
+
+        # Rank 1 = closest to 0 (Stability Ranking). Row i of the new snapshot is
+        # rank i + 1: the re-scored symbols go where the ranking puts them and the
+        # rest fill the other rows in their previous order.
+        size = len(RANKING)
+        placed = RANKING.rows(replaced)
+        source = np.full(size, -1, dtype=np.intp)
+        free = np.ones(size, dtype=bool)
+        free[[row for row, _ in placed]] = False
+        source[free] = np.delete(
+            np.arange(previous.columns.size),
+            [previous.ranks[symbol] - 1 for symbol in changed if symbol in previous.ranks]
+        )
+        # Indices into the previous records followed by the re-scored ones
+        pick = source.copy()
+        pick[~free] = np.arange(len(previous.records), len(previous.records) + len(placed))
+        # The snapshot and its columns hold this same tuple, which apply_filters
+        # checks to take the columnar fast path
+        stock_list = tuple(map((previous.records + tuple(entering[symbol] for _, symbol in placed)).__getitem__,
+                               pick.tolist()))
+        columns = previous.columns.updated(stock_list, source)
+
+        # Symbols whose rank moved count as changed for deltas and streaming clients
+        changed.update(columns.symbol[(source >= 0) & (source != np.arange(size))].tolist())
+
+        # Sector sums move by the records that left and entered; rank moves leave them as they are.
+        # Every SECTOR_REBUILD_EVERY batches they are rebuilt, dropping the rounding drift.
+        if previous.sectors.updates + 1 >= settings.SECTOR_REBUILD_EVERY:
+            sectors = SectorStats.build(stock_list)
+        else:
+            sectors = previous.sectors.updated(left, [entering[symbol] for symbol in replaced])
+
+        # Built off to the side, then published with a single reference swap
+        snapshot = Snapshot.build(previous.version + 1, stock_list, columns, changed, sectors)
+        SNAPSHOT = snapshot
+    SNAPSHOT_HISTORY.append(snapshot)
+
+    # Push the same changes to streaming clients, in rank order
+    if broadcaster.subscribers:
+        ranks = snapshot.ranks
+        gone = [symbol for symbol in changed if symbol not in ranks]
+        moved = sorted((symbol for symbol in changed if symbol in ranks), key=ranks.__getitem__)
+        broadcaster.publish(
+            snapshot.version,
+            [
+                change_entry(snapshot.by_symbol[symbol], previous.get(symbol), ranks[symbol],
+                             previous.ranks.get(symbol))
+                for symbol in moved
+            ],
+            [{"symbol": symbol, "sector": previous.by_symbol[symbol].sector or "Unknown"} for symbol in gone],
+            set(cache.get(WATCHLIST_KEY) or [])
+        )
+    metrics.PUBLISH_SECONDS.observe(time.perf_counter() - started)
 
 async def fetch_stock_history(symbol: str) -> Optional[pd.DataFrame]:
     try:
         # Use history() for single stock to avoid bulk download issues
-        ticker = yf.Ticker(symbol)
         # Random delay to avoid 429
         await asyncio.sleep(0.1) 
-        hist = await asyncio.to_thread(ticker.history, period="3mo")
+        hist = await asyncio.to_thread(get_provider().history, symbol, period="3mo")
         return hist
     except Exception as e:
         print(f"Error fetching {symbol}: {e}")
         return None
 
+def split_batch_frame(batch_data: pd.DataFrame, batch_symbols: List[str]) -> Dict[str, pd.DataFrame]:
+    """Splits a bulk `yf.download` result into one OHLCV frame per symbol."""
+    frames = {}
+    if batch_data is None or batch_data.empty:
+        return frames
+
+    # yfinance returns different structures depending on 1 vs many tickers
+    # If multiple tickers, columns are MultiIndex: (Ticker, PriceType)
+    # If 1 ticker, columns are just PriceType
+    
+    is_multi = isinstance(batch_data.columns, pd.MultiIndex)
+    
+    for symbol in batch_symbols:
+        try:
+            stock_df = None
+            if is_multi:
+                # Extract dataframe for this symbol
+                # Check if symbol is in top level columns
+                if symbol in batch_data.columns.levels[0]:
+                    stock_df = batch_data[symbol].dropna()
+            else:
+                # Handle single ticker case if batch size was 1 or only 1 succeeded
+                if len(batch_symbols) == 1 and symbol == batch_symbols[0]:
+                    stock_df = batch_data.dropna()
+                else:
+                    # If it's not multi-index and not a single-symbol batch,
+                    # it's ambiguous, so skip.
+                    continue
+            
+            if stock_df is not None and not stock_df.empty:
+                # Ensure it's a DataFrame
+                if not isinstance(stock_df, pd.DataFrame):
+                    continue
+                frames[symbol] = stock_df
+        except Exception as e:
+            print(f"Error extracting {symbol} from batch: {e}", flush=True)
+            continue
+    return frames
+
+async def fetch_batch_frames(
+    batch_symbols: List[str],
+    controller: Optional[FetchController] = None
+) -> Tuple[Dict[str, pd.DataFrame], List[str]]:
+    """
+    Brings the bar store up to date for a batch and returns each symbol's
+    last LOOKBACK_BARS bars (in intraday mode, all bars kept), plus the
+    symbols the download left out (their frames, if any, are the previously
+    stored bars).
+    Symbols without stored history are backfilled with HISTORY_PERIOD (or
+    INTRADAY_HISTORY_PERIOD); the rest only fetch from the stored session
+    before their last onward, which also refreshes that (possibly still open)
+    last session. Daily histories that were re-adjusted upstream (splits,
+    dividends) are downloaded again in full and replaced.
+    With a `controller`, each download waits for a request slot, and a
+    download that returns too few symbols raises RateLimited (after storing
+    what did arrive).
+    """
+    last_dates = {symbol: BAR_STORE.last_date(symbol) for symbol in batch_symbols}
+    missing = [s for s, d in last_dates.items() if d is None]
+    stored = [s for s, d in last_dates.items() if d is not None]
+
+    # Daily downloads leave out `interval`, so they match existing recordings
+    if settings.BAR_INTERVAL == "1d":
+        interval, period = {}, settings.HISTORY_PERIOD
+    else:
+        interval, period = {"interval": settings.BAR_INTERVAL}, settings.INTRADAY_HISTORY_PERIOD
+
+    # (symbols, window, whether the download replaces their stored history)
+    downloads = []
+    if missing:
+        downloads.append((missing, {"period": period, **interval}, False))
+    if stored:
+        # From the bar before the last, which merge compares to detect upstream adjustments
+        start = min(BAR_STORE.check_date(s) for s in stored)
+        downloads.append((stored, {"start": start.strftime("%Y-%m-%d"), **interval}, False))
+
+    not_returned: List[str] = []
+    # Symbols whose history was re-adjusted are appended as one more download
+    for symbols, window, replace in downloads:
+        # Bulk download for the batch (MultiIndex columns: Ticker, OHLC)
+        if controller:
+            await controller.acquire()
+        started = time.perf_counter()
+        batch_data = await asyncio.to_thread(get_provider().download, symbols, **window)
+        metrics.BATCH_DOWNLOAD_SECONDS.observe(time.perf_counter() - started)
+        returned, adjusted = await asyncio.to_thread(merge_batch_frame, batch_data, symbols, replace)
+        if controller and controller.looks_throttled(len(symbols), len(returned)):
+            raise RateLimited(f"{len(returned)}/{len(symbols)} symbols returned")
+        not_returned.extend(s for s in symbols if s not in returned)
+        if adjusted:
+            print(f"History adjusted upstream (split or dividend), refetching: {adjusted}", flush=True)
+            metrics.HISTORY_REFETCHES.inc(len(adjusted))
+            downloads.append((adjusted, {"period": period, **interval}, True))
+
+    return await asyncio.to_thread(read_batch_frames, batch_symbols), not_returned
+
+def merge_batch_frame(batch_data: pd.DataFrame, symbols: List[str], replace: bool = False) -> Tuple[Set[str], List[str]]:
+    """
+    Stores a downloaded batch (with `replace`, as each symbol's whole
+    history); returns the symbols that had bars and those whose stored
+    history no longer matches the download and needs to be replaced.
+    """
+    frames = split_batch_frame(batch_data, symbols)
+    adjusted = []
+    for symbol, stock_df in frames.items():
+        if replace:
+            BAR_STORE.replace(symbol, stock_df)
+            continue
+        try:
+            BAR_STORE.merge(symbol, stock_df)
+        except HistoryAdjusted:
+            adjusted.append(symbol)
+    return set(frames), adjusted
+
+def read_batch_frames(symbols: List[str]) -> Dict[str, pd.DataFrame]:
+    # Intraday rings already hold exactly the bars to use
+    lookback = settings.LOOKBACK_BARS if settings.BAR_INTERVAL == "1d" else None
+    frames = {}
+    for symbol in symbols:
+        stock_df = BAR_STORE.read(symbol, lookback)
+        if not stock_df.empty:
+            frames[symbol] = stock_df
+    return frames
+
+async def refresh_cycle(symbols: List[str], controller: FetchController) -> List[str]:
+    """
+    Fetches, processes and publishes `symbols` in batches paced by `controller`.
+    The three stages form a pipeline: up to FETCH_CONCURRENCY downloads are in
+    flight while earlier batches are processed and published, and the bounded
+    queues between the stages hold downloads back when processing falls
+    behind, so a cycle takes about as long as its slowest stage.
+    Returns the symbols not reached before the cycle's request budget ran out.
+    """
+    controller.start_cycle()
+    pending = list(symbols)
+    retried: Set[str] = set()
+    attempts: Dict[str, int] = {}
+    processed = 0
+    to_process: asyncio.Queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+    to_publish: asyncio.Queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+
+    # --- Download Stage ---
+
+    async def download():
+        nonlocal pending
+        while pending and controller.budget_left > 0:
+            batch_symbols = pending[:controller.batch_size]
+            pending = pending[len(batch_symbols):]
+            print(f"Fetching batch of {len(batch_symbols)} symbols ({len(pending)} pending)...", flush=True)
+
+            try:
+                batch_frames, not_returned = await fetch_batch_frames(batch_symbols, controller)
+            except RateLimited as e:
+                # Every download backs off; the batch is retried (smaller) up to FETCH_MAX_ATTEMPTS
+                backoff = controller.on_throttle()
+                controller.pause(backoff)
+                metrics.FETCH_THROTTLED.inc()
+                print(f"Throttled ({e}); batch size {controller.batch_size}, backing off {backoff:.1f}s", flush=True)
+                for symbol in batch_symbols:
+                    attempts[symbol] = attempts.get(symbol, 0) + 1
+                retry = [s for s in batch_symbols if attempts[s] < settings.FETCH_MAX_ATTEMPTS]
+                metrics.FAILED_SYMBOLS.inc(len(batch_symbols) - len(retry), reason="throttled")
+                pending = retry + pending
+                continue
+            except Exception as e:
+                # Not a sign of throttling, so the batch size and the other downloads are left alone
+                print(f"Error fetching batch: {e}", flush=True)
+                metrics.FAILED_SYMBOLS.inc(len(batch_symbols), reason="batch_error")
+                await asyncio.sleep(controller.delay)
+                continue
+
+            controller.on_success(1 - len(not_returned) / len(batch_symbols))
+
+            # Symbols left out of a partial answer are retried once, at the end of the cycle
+            retry = [s for s in not_returned if s not in retried]
+            if retry:
+                retried.update(retry)
+                pending.extend(retry)
+                # Counted as failed by the batch they are retried in, if they fail again
+                later = set(retry)
+                batch_symbols = [s for s in batch_symbols if s not in later]
+                batch_frames = {s: df for s, df in batch_frames.items() if s not in later}
+
+            # Waits here while processing is behind
+            await to_process.put((batch_symbols, batch_frames))
+            await asyncio.sleep(controller.delay)
+
+    async def download_stage():
+        workers = max(1, settings.FETCH_CONCURRENCY)
+        for result in await asyncio.gather(*(download() for _ in range(workers)), return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Error in download worker: {result}", flush=True)
+        await to_process.put(None)
+
+    # --- Processing Stage ---
+
+    async def process_stage():
+        while (item := await to_process.get()) is not None:
+            batch_symbols, batch_frames = item
+            batch_results = []
+            try:
+                # CPU-bound work runs on the worker pool, keeping the API responsive
+                started = time.perf_counter()
+                batch_results = await process_batch_async(batch_frames)
+                if batch_frames:
+                    metrics.SYMBOL_PROCESSING_SECONDS.observe(
+                        (time.perf_counter() - started) / len(batch_frames), count=len(batch_frames)
+                    )
+                metrics.FAILED_SYMBOLS.inc(len(batch_symbols) - len(batch_frames), reason="no_data")
+                metrics.FAILED_SYMBOLS.inc(len(batch_frames) - len(batch_results), reason="processing")
+            except Exception as e:
+                print(f"Error processing batch: {e}", flush=True)
+                metrics.FAILED_SYMBOLS.inc(len(batch_symbols), reason="batch_error")
+            if batch_results:
+                await to_publish.put(batch_results)
+        await to_publish.put(None)
+
+    # --- Publish Stage ---
+
+    async def publish_stage():
+        nonlocal processed
+        done = False
+        while not done:
+            # Everything processed since the last publish goes out as one snapshot
+            ready = [await to_publish.get()]
+            while not to_publish.empty():
+                ready.append(to_publish.get_nowait())
+            done = None in ready
+            ready = [batch for batch in ready if batch is not None]
+            if not ready:
+                continue
+
+            try:
+                # Incremental Cache Update
+                updates = [stock for batch_results in ready for stock in batch_results]
+                processed += len(updates)
+                update_cache(updates)
+                print(f"Batch processed. Cache size: {len(SNAPSHOT.records)}", flush=True)
+            except Exception as e:
+                print(f"Error publishing batch: {e}", flush=True)
+
+    await asyncio.gather(download_stage(), process_stage(), publish_stage())
+
+    if pending:
+        print(f"Request budget exhausted; {len(pending)} symbols deferred to the next cycle", flush=True)
+    print(f"[{datetime.now()}] Refresh complete. Total: {processed}", flush=True)
+    return pending
+
+def hot_symbols() -> Set[str]:
+    """Symbols refreshed most often: watchlisted, recently viewed and breakout candidates."""
+    columns = SNAPSHOT.columns
+    breakouts = columns.symbol[columns.is_breakout_candidate].tolist()
+    return set(cache.get(WATCHLIST_KEY) or []) | recently_viewed() | set(breakouts)
+
 async def refresh_market_data():
     """
     Main background task to refresh data.
-    Uses BATCHED fetching (yf.download) for speed, but in chunks to avoid rate limits.
+    Uses BATCHED fetching (yf.download), paced by FETCH_CONTROLLER to stay
+    under the upstream rate limits. REFRESH_SCHEDULER decides which symbols
+    are due, following the NSE session; off-hours the last snapshot is served.
     """
     while True:
         try:
-            print(f"[{datetime.now()}] Starting F&O market data refresh...", flush=True)
-            
-            # 1. Define Symbols (Only F&O)
-            all_symbols_ordered = settings.FNO_SYMBOLS
-            print(f"[{datetime.now()}] Target symbols: {len(all_symbols_ordered)}", flush=True)
-            
-            processed_stocks = []
-            
-            # Process in small batches to update cache incrementally
-            BATCH_SIZE = 50 
-            
-            for i in range(0, len(all_symbols_ordered), BATCH_SIZE):
-                batch_symbols = all_symbols_ordered[i:i+BATCH_SIZE]
-                print(f"Fetching batch {i}-{i+BATCH_SIZE} ({len(batch_symbols)} symbols)...", flush=True)
-                
-                try:
-                    # Bulk download for the batch
-                    # group_by='ticker' ensures we get a DataFrame with MultiIndex columns (Ticker, OHLC)
-                    batch_data = await asyncio.to_thread(
-                        yf.download, 
-                        tickers=batch_symbols, 
-                        period="3mo", 
-                        group_by='ticker', 
-                        threads=True, 
-                        progress=False
-                    )
-                    
-                    # Process the batch
-                    batch_results = []
-                    
-                    if not batch_data.empty:
-                        # yfinance returns different structures depending on 1 vs many tickers
-                        # If multiple tickers, columns are MultiIndex: (Ticker, PriceType)
-                        # If 1 ticker, columns are just PriceType
-                        
-                        is_multi = isinstance(batch_data.columns, pd.MultiIndex)
-                        
-                        for symbol in batch_symbols:
-                            try:
-                                stock_df = None
-                                if is_multi:
-                                    # Extract dataframe for this symbol
-                                    # Check if symbol is in top level columns
-                                    if symbol in batch_data.columns.levels[0]:
-                                        stock_df = batch_data[symbol].dropna()
-                                else:
-                                    # Handle single ticker case if batch size was 1 or only 1 succeeded
-                                    if len(batch_symbols) == 1 and symbol == batch_symbols[0]:
-                                        stock_df = batch_data.dropna()
-                                    else:
-                                        # If it's not multi-index and not a single-symbol batch,
-                                        # it's ambiguous, so skip.
-                                        continue
-                                
-                                if stock_df is not None and not stock_df.empty:
-                                    # Ensure it's a DataFrame
-                                    if not isinstance(stock_df, pd.DataFrame):
-                                        # print(f"Skipping {symbol}: Expected DataFrame, got {type(stock_df)}", flush=True)
-                                        continue
-
-                                    # Try processing
-                                    try:
-                                        stock = process_stock_data(symbol, stock_df, {})
-                                        if stock:
-                                            batch_results.append(stock)
-                                    except Exception as e:
-                                        traceback.print_exc()
-                                        print(f"Error processing {symbol}: {e}", flush=True)
-                            except Exception as e:
-                                print(f"Error extracting {symbol} from batch: {e}", flush=True)
-                                continue
-                    
-                    if batch_results:
-                        processed_stocks.extend(batch_results)
-                        
-                        # Incremental Cache Update
-                        current_all = CACHE["fno"]["data"]
-                        stock_map = {s.symbol: s for s in current_all}
-                        for s in batch_results:
-                            stock_map[s.symbol] = s
-                        
-                        new_list = list(stock_map.values())
-                        update_cache(new_list)
-                        print(f"Batch {i} processed. Cache size: {len(new_list)}", flush=True)
-                    
-                    # Sleep to avoid rate limits
-                    await asyncio.sleep(2.0) 
-                    
-                except Exception as e:
-                    print(f"Error fetching batch {i}: {e}", flush=True)
-                    await asyncio.sleep(5.0) # Longer sleep on error
-            
-            print(f"[{datetime.now()}] Refresh complete. Total: {len(processed_stocks)}", flush=True)
-            await asyncio.sleep(60) # Wait longer before next full cycle
+            all_symbols = settings.FNO_SYMBOLS
+            hot = hot_symbols()
+            due = REFRESH_SCHEDULER.due_symbols(all_symbols, hot)
+
+            if due:
+                print(f"[{datetime.now()}] Starting F&O market data refresh ({market_phase(market_now())})...", flush=True)
+                print(f"[{datetime.now()}] Target symbols: {len(due)} ({len(hot & set(due))} hot)", flush=True)
+                cycle_started = time.perf_counter()
+
+                deferred = set(await refresh_cycle(due, FETCH_CONTROLLER))
+                # Deferred symbols stay due and go first next time
+                REFRESH_SCHEDULER.mark_refreshed(s for s in due if s not in deferred)
+                metrics.REFRESH_CYCLE_SECONDS.observe(time.perf_counter() - cycle_started)
+
+            await asyncio.sleep(REFRESH_SCHEDULER.seconds_until_due(all_symbols, hot_symbols()))
 
         except Exception as e:
             print(f"Error in refresh loop: {e}", flush=True)
@@ -373,23 +797,105 @@ async def refresh_market_data():
 
 # --- Public Accessors (Instant) ---
 
-async def get_fno_data() -> List[StockResponse]:
-    return CACHE["fno"]["data"]
+async def get_snapshot() -> Snapshot:
+    """The published snapshot; read everything a request needs from this one object."""
+    return SNAPSHOT
 
-async def get_stock_detail(symbol: str) -> Optional[StockResponse]:
-    # Look in "fno" cache
-    for stock in CACHE["fno"]["data"]:
-        if stock.symbol == symbol:
-            return stock
+async def get_fno_data() -> Tuple[StockResponse, ...]:
+    return SNAPSHOT.records
+
+async def get_cache_version() -> int:
+    return SNAPSHOT.version
+
+async def get_changes_since(version: int, until: Optional[int] = None) -> Optional[Set[str]]:
+    """
+    Symbols added, changed or removed after snapshot `version` up to `until`
+    (default: the published one), or None if `version` is unknown or older
+    than the kept snapshot history.
+    """
+    until = SNAPSHOT.version if until is None else until
+    if version == until:
+        return set()
+    if version > until or not SNAPSHOT_HISTORY or SNAPSHOT_HISTORY[0].version > version + 1:
+        return None
+    changed: Set[str] = set()
+    for snapshot in SNAPSHOT_HISTORY:
+        if version < snapshot.version <= until:
+            changed.update(snapshot.changed)
+    return changed
+
+async def get_snapshot_at(version: int) -> Optional[Snapshot]:
+    """The published snapshot of `version`, if it is still kept in the snapshot history."""
+    for snapshot in reversed(SNAPSHOT_HISTORY):
+        if snapshot.version == version:
+            return snapshot
     return None
 
+# --- Timeframes ---
+
+# Resampled views of the published snapshot, created on first request
+TIMEFRAME_VIEWS: Dict[str, TimeframeView] = {}
+_TIMEFRAME_LOCKS: Dict[str, asyncio.Lock] = {}
+
+async def get_timeframe_snapshot(timeframe: str) -> Snapshot:
+    """
+    The published snapshot resampled to `timeframe` (one of
+    `timeframes_for(BAR_INTERVAL)`), with the same version. Only the symbols
+    changed since the view was last updated are recomputed.
+    """
+    view = TIMEFRAME_VIEWS.get(timeframe)
+    if view is None:
+        view = TIMEFRAME_VIEWS[timeframe] = TimeframeView(timeframe, settings.LOOKBACK_BARS)
+    async with _TIMEFRAME_LOCKS.setdefault(timeframe, asyncio.Lock()):
+        snapshot = SNAPSHOT
+        if view.version >= snapshot.version:
+            return view.snapshot
+        # Resampling and indicators run off the event loop
+        return await asyncio.to_thread(view.update, snapshot, BAR_STORE.load, BAR_STORE.revision)
+
+# --- Backtest ---
+
+# Stored-bar state the cached HistoryColumns was loaded from, and the columns
+_HISTORY: Tuple[FrozenSet[Tuple[str, Optional[pd.Timestamp], int]], Optional[HistoryColumns]] = (frozenset(), None)
+_HISTORY_LOCK = asyncio.Lock()
+
+def load_history(symbols: Iterable[str]) -> HistoryColumns:
+    return HistoryColumns({symbol: BAR_STORE.load(symbol) for symbol in symbols})
+
+def history_state(symbols: Iterable[str]) -> FrozenSet[Tuple[str, Optional[pd.Timestamp], int]]:
+    """Last stored date and store revision of each symbol, which change when a session is added or rewritten."""
+    return frozenset((symbol, BAR_STORE.last_date(symbol), BAR_STORE.revision(symbol)) for symbol in symbols)
+
+async def get_history_columns() -> HistoryColumns:
+    """
+    Every stored bar of the published symbols on one date grid. Rebuilt when
+    the symbols, a last stored date or a store revision change, not on every
+    publish: updates to a session that is still open are picked up with the
+    next session or rewrite.
+    """
+    global _HISTORY
+    async with _HISTORY_LOCK:
+        symbols = list(SNAPSHOT.by_symbol)
+        state = history_state(symbols)
+        loaded, history = _HISTORY
+        if history is None or loaded != state:
+            history = await asyncio.to_thread(load_history, symbols)
+            _HISTORY = (state, history)
+        return history
+
+async def get_fno_columns() -> StockColumns:
+    return SNAPSHOT.columns
+
+async def get_stock_detail(symbol: str) -> Optional[StockResponse]:
+    return SNAPSHOT.get(symbol)
+
 async def get_stocks_by_symbols(symbols: List[str]) -> List[StockResponse]:
-    result = []
-    target_symbols = set(symbols)
-    for stock in CACHE["fno"]["data"]:
-        if stock.symbol in target_symbols:
-            result.append(stock)
-    return result
+    # Cost follows len(symbols), not the universe; results keep Rank order
+    return SNAPSHOT.select(symbols)
+
+async def get_sector_symbols(sector: str) -> Tuple[str, ...]:
+    """Symbols of a sector in Rank order."""
+    return SNAPSHOT.by_sector.get(sector, ())
 
 # --- Initialization ---
 def start_background_tasks():
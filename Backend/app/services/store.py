@@ -0,0 +1,304 @@
+"""
+Local OHLCV bar stores.
+
+Daily bars are persisted in BarStore: each symbol's bars live in one
+fixed-width NumPy record file, sorted by date and read back through a memory
+map, so a column such as `Close` is a view over the file rather than a copy.
+New bars for the latest dates are appended (or overwrite the last record in
+place) without rewriting the history. Downloads repeat the stored bar
+before the last one; prices are split- and dividend-adjusted, so when that
+bar comes back different the whole history was re-adjusted upstream and
+merge raises HistoryAdjusted for the caller to download and `replace` it.
+
+Intraday bars go to RingBarStore instead, which keeps only the latest
+INTRADAY_BARS bars of each symbol in a preallocated in-memory ring: a new
+bar overwrites the oldest in O(1), so memory stays fixed however long the
+server runs.
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional, Union
+from app.config import settings
+
+BAR_FIELDS = ("Open", "High", "Low", "Close", "Volume")
+BAR_DTYPE = np.dtype([("date", "datetime64[ns]")] + [(field, "f8") for field in BAR_FIELDS])
+
+INTRADAY_INTERVALS = ("1m", "5m", "15m")
+
+# Relative difference between a stored and a re-downloaded close that counts
+# as an upstream adjustment rather than float noise
+ADJUSTMENT_TOLERANCE = 1e-4
+
+class HistoryAdjusted(Exception):
+    """Raised by BarStore.merge when downloaded bars disagree with stored ones before the last."""
+
+def to_records(bars: pd.DataFrame) -> np.ndarray:
+    """Complete bars of an OHLCV frame as BAR_DTYPE records, sorted by date."""
+    bars = bars.dropna(subset=list(BAR_FIELDS))
+    index = pd.DatetimeIndex(bars.index)
+    if index.tz is not None:
+        # Exchange wall-clock time: 09:15 IST stays 09:15, and a daily bar
+        # stamped at IST midnight keeps its date
+        index = index.tz_localize(None)
+    records = np.empty(len(bars), dtype=BAR_DTYPE)
+    records["date"] = index.values
+    for field in BAR_FIELDS:
+        records[field] = bars[field].to_numpy(dtype=np.float64)
+    return np.sort(records, order="date")
+
+def to_frame(records: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(
+        {field: np.asarray(records[field]) for field in BAR_FIELDS},
+        index=pd.DatetimeIndex(np.asarray(records["date"]), name="Date")
+    )
+
+class BarStore:
+    def __init__(self, root: str):
+        self.root = root
+        self._last_dates: Dict[str, Optional[pd.Timestamp]] = {}
+        # Bumped whenever a symbol's history is rewritten rather than extended
+        self._revisions: Dict[str, int] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.root, f"{symbol}.bars")
+
+    def load(self, symbol: str) -> np.ndarray:
+        """Memory-mapped records for `symbol` (empty if nothing is stored)."""
+        path = self._path(symbol)
+        if not os.path.exists(path) or os.path.getsize(path) < BAR_DTYPE.itemsize:
+            return np.empty(0, dtype=BAR_DTYPE)
+        # Ignore a partially written trailing record
+        count = os.path.getsize(path) // BAR_DTYPE.itemsize
+        return np.memmap(path, dtype=BAR_DTYPE, mode="r", shape=(count,))
+
+    def read(self, symbol: str, lookback: Optional[int] = None) -> pd.DataFrame:
+        """Stored bars as an OHLCV DataFrame indexed by date, optionally only the last `lookback`."""
+        records = self.load(symbol)
+        if lookback is not None:
+            records = records[-lookback:]
+        return to_frame(records)
+
+    def last_date(self, symbol: str) -> Optional[pd.Timestamp]:
+        if symbol not in self._last_dates:
+            records = self.load(symbol)
+            self._last_dates[symbol] = pd.Timestamp(records["date"][-1]) if len(records) else None
+        return self._last_dates[symbol]
+
+    def check_date(self, symbol: str) -> Optional[pd.Timestamp]:
+        """
+        Date of the stored bar before the last (settled, unlike a still open
+        last session); downloads start there so `merge` can compare it.
+        """
+        records = self.load(symbol)
+        return pd.Timestamp(records["date"][-2]) if len(records) > 1 else self.last_date(symbol)
+
+    def revision(self, symbol: str) -> int:
+        """Changes whenever bars other than the last are rewritten, so caches of older bars can tell."""
+        return self._revisions.get(symbol, 0)
+
+    def merge(self, symbol: str, bars: pd.DataFrame) -> int:
+        """
+        Merges downloaded bars into the store, replacing stored bars with the
+        same date. Returns the number of bars written. Raises HistoryAdjusted,
+        without writing, if a bar before the last stored one came back with a
+        different close.
+        """
+        new = to_records(bars)
+        if not len(new):
+            return 0
+
+        stored = self.load(symbol)
+        path = self._path(symbol)
+
+        if len(stored):
+            older = new["date"] < stored["date"][-1]
+            if older.any():
+                positions = np.minimum(np.searchsorted(stored["date"], new["date"][older]), len(stored) - 1)
+                found = stored["date"][positions] == new["date"][older]
+                if not np.allclose(
+                    new["Close"][older][found], stored["Close"][positions[found]], rtol=ADJUSTMENT_TOLERANCE, atol=0
+                ):
+                    raise HistoryAdjusted(symbol)
+                if found.all():
+                    # Repeated bars that still match are already stored
+                    new = new[~older]
+                    if not len(new):
+                        return 0
+
+        if len(stored) and new["date"][0] >= stored["date"][-1]:
+            # Common case: only the latest session changed and/or new sessions were added
+            with open(path, "r+b") as f:
+                if new["date"][0] == stored["date"][-1]:
+                    f.seek((len(stored) - 1) * BAR_DTYPE.itemsize)
+                else:
+                    f.seek(len(stored) * BAR_DTYPE.itemsize)
+                f.write(new.tobytes())
+                f.truncate()
+        else:
+            # Backfill or a revision inside the history: rewrite the file
+            if len(stored):
+                keep = stored[~np.isin(stored["date"], new["date"])]
+                new = np.sort(np.concatenate([keep, new]), order="date")
+            self._write(symbol, new)
+            return len(bars)
+
+        self._last_dates[symbol] = pd.Timestamp(new["date"][-1])
+        return len(bars)
+
+    def replace(self, symbol: str, bars: pd.DataFrame) -> int:
+        """Replaces the stored history with `bars`, e.g. after HistoryAdjusted."""
+        records = to_records(bars)
+        if not len(records):
+            return 0
+        self._write(symbol, records)
+        return len(records)
+
+    def _write(self, symbol: str, records: np.ndarray):
+        path = self._path(symbol)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(records.tobytes())
+        os.replace(tmp_path, path)
+        self._last_dates[symbol] = pd.Timestamp(records["date"][-1])
+        self._revisions[symbol] = self._revisions.get(symbol, 0) + 1
+
+# --- Intraday Ring Buffers ---
+
+class BarRing:
+    """The latest `capacity` bars of one symbol; slot `start` holds the oldest."""
+
+    __slots__ = ("records", "start", "count")
+
+    def __init__(self, capacity: int):
+        # Allocated once at full size
+        self.records = np.zeros(capacity, dtype=BAR_DTYPE)
+        self.start = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _slot(self, i: int) -> int:
+        """Slot of the i-th oldest bar."""
+        return (self.start + i) % len(self.records)
+
+    def last_date(self) -> Optional[np.datetime64]:
+        return self.records["date"][self._slot(self.count - 1)] if self.count else None
+
+    def push(self, record: np.void):
+        """Appends a bar, overwriting the oldest one once the ring is full."""
+        if self.count < len(self.records):
+            self.records[self._slot(self.count)] = record
+            self.count += 1
+        else:
+            self.records[self.start] = record
+            self.start = self._slot(1)
+
+    def replace_last(self, record: np.void):
+        self.records[self._slot(self.count - 1)] = record
+
+    def ordered(self) -> np.ndarray:
+        """A copy of the bars, oldest first."""
+        end = self.start + self.count
+        if end <= len(self.records):
+            return self.records[self.start:end].copy()
+        return np.concatenate([self.records[self.start:], self.records[:end - len(self.records)]])
+
+    def reset(self, records: np.ndarray):
+        """Replaces the contents with the latest of `records` (sorted by date)."""
+        records = records[-len(self.records):]
+        self.records[:len(records)] = records
+        self.start = 0
+        self.count = len(records)
+
+class RingBarStore:
+    """In-memory store with the same interface as BarStore, for intraday bars."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._rings: Dict[str, BarRing] = {}
+        self._revisions: Dict[str, int] = {}
+        # Downloads and reads of different batches run in separate threads
+        self._lock = threading.Lock()
+
+    def load(self, symbol: str) -> np.ndarray:
+        """The kept records of `symbol`, oldest first (a copy)."""
+        with self._lock:
+            ring = self._rings.get(symbol)
+            return ring.ordered() if ring else np.empty(0, dtype=BAR_DTYPE)
+
+    def read(self, symbol: str, lookback: Optional[int] = None) -> pd.DataFrame:
+        records = self.load(symbol)
+        if lookback is not None:
+            records = records[-lookback:]
+        return to_frame(records)
+
+    def last_date(self, symbol: str) -> Optional[pd.Timestamp]:
+        ring = self._rings.get(symbol)
+        last = ring.last_date() if ring else None
+        return pd.Timestamp(last) if last is not None else None
+
+    def check_date(self, symbol: str) -> Optional[pd.Timestamp]:
+        """Where downloads start: the last kept bar (intraday bars are not checked for adjustments)."""
+        return self.last_date(symbol)
+
+    def revision(self, symbol: str) -> int:
+        return self._revisions.get(symbol, 0)
+
+    def replace(self, symbol: str, bars: pd.DataFrame) -> int:
+        new = to_records(bars)
+        with self._lock:
+            self._rings[symbol] = ring = BarRing(self.capacity)
+            self._reset(symbol, ring, new)
+        return len(new)
+
+    def _reset(self, symbol: str, ring: BarRing, records: np.ndarray):
+        ring.reset(records)
+        self._revisions[symbol] = self._revisions.get(symbol, 0) + 1
+
+    def merge(self, symbol: str, bars: pd.DataFrame) -> int:
+        """
+        Merges downloaded bars, replacing stored bars with the same timestamp.
+        Bars older than the oldest one kept are dropped.
+        """
+        new = to_records(bars)
+        if not len(new):
+            return 0
+
+        with self._lock:
+            ring = self._rings.get(symbol)
+            if ring is None:
+                ring = self._rings[symbol] = BarRing(self.capacity)
+            if not len(ring) or len(new) >= self.capacity:
+                self._reset(symbol, ring, new)
+                return len(new)
+
+            # Downloads start at the beginning of the last stored session, so
+            # they repeat bars that are already stored
+            stored = ring.ordered()
+            new = new[new["date"] >= stored["date"][0]]
+            last = stored["date"][-1]
+            older = new[new["date"] < last]
+            if not np.isin(older["date"], stored["date"]).all():
+                # A bar missing inside the window: rebuild in date order
+                keep = stored[~np.isin(stored["date"], new["date"])]
+                self._reset(symbol, ring, np.sort(np.concatenate([keep, new]), order="date"))
+                return len(new)
+
+            # Common case: the last bar is revised and/or new bars are added
+            for record in new[new["date"] >= last]:
+                if record["date"] == last:
+                    ring.replace_last(record)
+                else:
+                    ring.push(record)
+        return len(new)
+
+def create_bar_store(interval: str) -> Union[BarStore, RingBarStore]:
+    if interval == "1d":
+        return BarStore(settings.BAR_STORE_DIR)
+    if interval in INTRADAY_INTERVALS:
+        return RingBarStore(settings.INTRADAY_BARS)
+    raise ValueError(f"Unknown bar interval: {interval}")
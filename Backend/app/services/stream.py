@@ -0,0 +1,113 @@
+"""
+Push of published snapshot changes to streaming clients (Server-Sent Events).
+
+Every `update_cache` publishes one update: the symbols whose record or rank
+changed, with their rank move and flipped flags, and the symbols removed.
+Each update is serialized once per distinct subscription and put on every
+subscriber's bounded queue without waiting, so slow clients never hold up
+the refresh loop. A subscriber whose queue is full has its backlog replaced
+by a single "resync" event; it should then reload with `since=<version>`.
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Set
+from app.config import settings
+from app.schemas import StockResponse
+
+SCOPES = ("all", "sector", "watchlist")
+
+class Subscriber:
+    def __init__(self, scope: str = "all", sector: Optional[str] = None, queue_size: Optional[int] = None):
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown scope: {scope}")
+        if scope == "sector" and not sector:
+            raise ValueError("scope=sector requires a sector")
+        self.scope = scope
+        self.sector = sector
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or settings.STREAM_QUEUE_SIZE)
+        self.dropped = 0
+
+    @property
+    def key(self) -> str:
+        """Subscribers with the same key receive identical events."""
+        return f"sector:{self.sector}" if self.scope == "sector" else self.scope
+
+    def matches(self, entry: Dict[str, Any], watchlist: Set[str]) -> bool:
+        if self.scope == "sector":
+            return entry["sector"] == self.sector
+        if self.scope == "watchlist":
+            return entry["symbol"] in watchlist
+        return True
+
+    def offer(self, event: bytes, version: int):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Drop the backlog; the client catches up from the latest version
+            self.dropped += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(format_event("resync", {"version": version}, version))
+
+def format_event(event: str, data: Any, version: int) -> bytes:
+    payload = json.dumps(data, separators=(",", ":"))
+    return f"id: {version}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+class Broadcaster:
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+
+    def subscribe(self, subscriber: Subscriber) -> Subscriber:
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, version: int, changes: List[Dict[str, Any]], removed: List[Dict[str, Any]], watchlist: Set[str]):
+        """
+        Queues one update for every subscriber. Entries in `changes` and
+        `removed` carry at least "symbol" and "sector"; `watchlist` resolves
+        the watchlist scope.
+        """
+        if not self.subscribers or not (changes or removed):
+            return
+
+        events: Dict[str, Optional[bytes]] = {}
+        for subscriber in list(self.subscribers):
+            key = subscriber.key
+            if key not in events:
+                selected = [c for c in changes if subscriber.matches(c, watchlist)]
+                gone = [r["symbol"] for r in removed if subscriber.matches(r, watchlist)]
+                events[key] = (
+                    format_event("update", {"version": version, "changes": selected, "removed": gone}, version)
+                    if selected or gone else None
+                )
+            if events[key] is not None:
+                subscriber.offer(events[key], version)
+
+broadcaster = Broadcaster()
+
+def change_entry(
+    stock: StockResponse,
+    previous: Optional[StockResponse],
+    rank: int,
+    previous_rank: Optional[int]
+) -> Dict[str, Any]:
+    """Compact description of one symbol's change; `flags` holds only flipped flags."""
+    entry = {
+        "symbol": stock.symbol,
+        "sector": stock.sector or "Unknown",
+        "rank": rank,
+        "rank_change": None if previous_rank is None else previous_rank - rank,
+        "price": stock.current_price,
+        "change_pct": stock.current_change_pct,
+        "avg_3day": stock.history.avg_3_day_change_pct,
+    }
+    flips = {
+        name: value for name, value in stock.flags.model_dump().items()
+        if previous is None or getattr(previous.flags, name) != value
+    }
+    if flips:
+        entry["flags"] = flips
+    return entry
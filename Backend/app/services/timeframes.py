@@ -0,0 +1,169 @@
+"""
+Coarser timeframes resampled from the stored base bars.
+
+Weekly, monthly or higher intraday bars are aggregated from the bars the
+refresh loop already fetched, so a timeframe costs no extra downloads. All
+symbols of an update are aggregated in one pass: their bars are laid end to
+end, every bar gets its bucket's start time, and open/high/low/close/volume
+are reduced over the runs of equal (symbol, bucket).
+
+Each timeframe caches its resampled bars per symbol. New base bars only
+fall into the last (partial) bucket or later ones, so an update
+re-aggregates from the start of the cached last bucket and keeps the rest.
+Buckets are labelled by their start: intraday buckets are anchored at the
+09:15 open, weeks start on Monday.
+"""
+from typing import Callable, Dict, Iterable, List, Mapping
+import numpy as np
+from app.schemas import StockResponse
+from app.services.columns import StockColumns
+from app.services.engine import MIN_BARS, process_universe
+from app.services.ranking import stability_score
+from app.services.snapshot import Snapshot
+from app.services.store import BAR_DTYPE, to_frame
+
+# Finest first; a timeframe can be built from any finer interval
+TIMEFRAMES = ("1m", "5m", "15m", "30m", "1h", "1d", "1w", "1mo")
+INTRADAY_MINUTES = {"1m": 1, "5m": 5, "15m": 15, "30m": 30, "1h": 60}
+SESSION_OPEN = np.timedelta64(9 * 60 + 15, "m")
+
+def timeframes_for(interval: str) -> List[str]:
+    """Timeframes that can be resampled from `interval` bars."""
+    return list(TIMEFRAMES[TIMEFRAMES.index(interval) + 1:])
+
+def bucket_starts(dates: np.ndarray, timeframe: str) -> np.ndarray:
+    """Start of the `timeframe` bucket of each date (datetime64[ns])."""
+    if timeframe in INTRADAY_MINUTES:
+        width = np.timedelta64(INTRADAY_MINUTES[timeframe], "m")
+        anchor = dates.astype("datetime64[D]") + SESSION_OPEN
+        return (anchor + (dates - anchor) // width * width).astype("datetime64[ns]")
+    days = dates.astype("datetime64[D]")
+    if timeframe == "1d":
+        return days.astype("datetime64[ns]")
+    if timeframe == "1w":
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 is 0 on Mondays
+        return (days - (days.view(np.int64) + 3) % 7).astype("datetime64[ns]")
+    if timeframe == "1mo":
+        return days.astype("datetime64[M]").astype("datetime64[ns]")
+    raise ValueError(f"Unknown timeframe: {timeframe}")
+
+def _concat(arrays: List[np.ndarray]) -> np.ndarray:
+    """np.concatenate for BAR_DTYPE records, without its per-array field promotion."""
+    result = np.empty(sum(len(array) for array in arrays), dtype=BAR_DTYPE)
+    end = 0
+    for array in arrays:
+        result[end:end + len(array)] = array
+        end += len(array)
+    return result
+
+def aggregate(bars: Mapping[str, np.ndarray], timeframe: str) -> Dict[str, np.ndarray]:
+    """Resamples each symbol's date-sorted BAR_DTYPE records into `timeframe` buckets."""
+    symbols = [symbol for symbol, records in bars.items() if len(records)]
+    if not symbols:
+        return {}
+    records = _concat([bars[symbol] for symbol in symbols])
+    codes = np.repeat(np.arange(len(symbols)), [len(bars[symbol]) for symbol in symbols])
+    keys = bucket_starts(records["date"], timeframe)
+
+    # A bucket starts wherever the symbol or the bucket changes
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (keys[1:] != keys[:-1])])
+    ends = np.r_[starts[1:], len(records)] - 1
+    result = np.empty(len(starts), dtype=BAR_DTYPE)
+    result["date"] = keys[starts]
+    result["Open"] = records["Open"][starts]
+    result["High"] = np.maximum.reduceat(records["High"], starts)
+    result["Low"] = np.minimum.reduceat(records["Low"], starts)
+    result["Close"] = records["Close"][ends]
+    result["Volume"] = np.add.reduceat(records["Volume"], starts)
+
+    bounds = np.searchsorted(codes[starts], np.arange(len(symbols) + 1))
+    return {symbol: result[bounds[k]:bounds[k + 1]] for k, symbol in enumerate(symbols)}
+
+class ResampledBars:
+    """Cached `timeframe` bars per symbol, at most `limit` of them each."""
+
+    def __init__(self, timeframe: str, limit: int):
+        self.timeframe = timeframe
+        self.limit = limit
+        self.bars: Dict[str, np.ndarray] = {}
+
+    def update(self, base: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Brings the symbols of `base` (their date-sorted base bars) up to date; returns their bars."""
+        tails = {}
+        for symbol, records in base.items():
+            cached = self.bars.get(symbol)
+            if cached is not None and len(records) and records["date"][0] <= cached["date"][-1]:
+                # Only the last bucket can have changed, besides newer ones
+                tails[symbol] = records[np.searchsorted(records["date"], cached["date"][-1]):]
+            else:
+                # New symbol, or its base no longer reaches back to the last bucket
+                self.bars.pop(symbol, None)
+                tails[symbol] = records
+
+        for symbol, buckets in aggregate(tails, self.timeframe).items():
+            cached = self.bars.get(symbol)
+            if cached is not None:
+                buckets = _concat([cached[:-1], buckets])
+            self.bars[symbol] = buckets[-self.limit:]
+        return {symbol: self.bars[symbol] for symbol in base if symbol in self.bars}
+
+    def discard(self, symbols: Iterable[str]):
+        for symbol in symbols:
+            self.bars.pop(symbol, None)
+
+class TimeframeView:
+    """
+    Records of one timeframe with their indicators, published as a Snapshot
+    of the same version as the base snapshot it was last updated to.
+    """
+
+    def __init__(self, timeframe: str, limit: int):
+        self.bars = ResampledBars(timeframe, limit)
+        self.records: Dict[str, StockResponse] = {}
+        # Base record each symbol was last computed from
+        self.sources: Dict[str, StockResponse] = {}
+        # Store revision each symbol's resampled bars were built from
+        self.revisions: Dict[str, int] = {}
+        self.snapshot = Snapshot.empty()
+
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    def update(
+        self, base: Snapshot, load: Callable[[str], np.ndarray], revision: Callable[[str], int] = lambda symbol: 0
+    ) -> Snapshot:
+        """
+        Updates the view to the `base` snapshot. Only symbols whose base
+        record was replaced are recomputed, from the bars `load` returns;
+        rank moves alone reuse the record. A symbol whose store `revision`
+        moved (its older bars were rewritten) is resampled from scratch.
+        Symbols with fewer than MIN_BARS bars in this timeframe are left out.
+        """
+        # Unchanged base records are shared between snapshots, so identity tells
+        changed = [stock.symbol for stock in base.records if self.sources.get(stock.symbol) is not stock]
+        removed = [symbol for symbol in self.sources if symbol not in base.by_symbol]
+        self.bars.discard(removed)
+        for symbol in removed:
+            self.revisions.pop(symbol, None)
+        for symbol in changed:
+            current = revision(symbol)
+            if self.revisions.get(symbol) != current:
+                self.bars.discard([symbol])
+                self.revisions[symbol] = current
+        resampled = self.bars.update({symbol: load(symbol) for symbol in changed})
+        frames = {symbol: to_frame(bars) for symbol, bars in resampled.items() if len(bars) >= MIN_BARS}
+
+        for symbol in removed:
+            self.sources.pop(symbol)
+            self.records.pop(symbol, None)
+        for symbol in changed:
+            self.sources[symbol] = base.by_symbol[symbol]
+            if symbol not in frames:
+                self.records.pop(symbol, None)
+        if frames:
+            self.records.update((stock.symbol, stock) for stock in process_universe(frames))
+
+        records = tuple(sorted(self.records.values(), key=lambda stock: (stability_score(stock), stock.symbol)))
+        self.snapshot = Snapshot.build(base.version, records, StockColumns(records), changed + removed)
+        return self.snapshot
@@ -1,8 +1,86 @@
-from typing import List, Optional
+import numpy as np
+from typing import List, Mapping, Optional, Sequence
 from app.schemas import StockResponse
+from app.services.columns import StockColumns
+from app.services.screener import Screen
+
+def compile_mask(
+    columns: StockColumns,
+    search: Optional[str] = None,
+    sector: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_volume: Optional[int] = None,
+    max_volume: Optional[int] = None,
+    min_change_pct: Optional[float] = None,
+    max_change_pct: Optional[float] = None,
+    min_avg_3day_pct: Optional[float] = None,
+    max_avg_3day_pct: Optional[float] = None,
+    min_volatility: Optional[float] = None,
+    max_volatility: Optional[float] = None,
+    max_rank: Optional[int] = None,
+    constant_only: bool = False,
+    gainers_only: bool = False,
+    losers_only: bool = False,
+    high_volume_only: bool = False,
+    macd_status: Optional[str] = None,
+    rsi_zone: Optional[str] = None,
+    strength: Optional[str] = None,
+    screen: Optional[Screen] = None,
+) -> np.ndarray:
+    """Combines every active filter into a single boolean mask over the columns."""
+    mask = np.ones(columns.size, dtype=bool)
+    
+    # 1. Search
+    if search:
+        search_lower = search.lower()
+        mask &= (np.char.find(columns.symbol_lower, search_lower) >= 0) | (np.char.find(columns.name_lower, search_lower) >= 0)
+        
+    # 2. Sector
+    if sector:
+        mask &= columns.sector.isin([sector])
+        
+    # 3. - 8. Numeric ranges
+    ranges = [
+        (columns.price, min_price, max_price),
+        (columns.volume, min_volume, max_volume),
+        (columns.change_pct, min_change_pct, max_change_pct),
+        (columns.avg_3day, min_avg_3day_pct, max_avg_3day_pct),
+        (columns.volatility, min_volatility, max_volatility),
+        (columns.rank, None, max_rank),
+    ]
+    for values, low, high in ranges:
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        
+    # 9. Flags
+    if constant_only:
+        mask &= columns.is_constant_price
+    if gainers_only:
+        mask &= columns.is_gainer_today
+    if losers_only:
+        mask &= columns.is_loser_today
+    if high_volume_only:
+        mask &= columns.is_high_volume
+        
+    # 10. Indicators
+    if macd_status:
+        mask &= columns.macd_status.isin(macd_status.split(','))
+    if rsi_zone:
+        mask &= columns.rsi_status.isin(rsi_zone.split(','))
+    if strength:
+        mask &= columns.strength_label.isin(strength.split(','))
+
+    # 11. Screen expression
+    if screen is not None:
+        mask &= screen.mask(columns)
+        
+    return mask
 
 def apply_filters(
-    stocks: List[StockResponse],
+    stocks: Sequence[StockResponse],
     search: Optional[str] = None,
     sector: Optional[str] = None,
     min_price: Optional[float] = None,
@@ -23,11 +101,41 @@ def apply_filters(
     macd_status: Optional[str] = None,
     rsi_zone: Optional[str] = None,
     strength: Optional[str] = None,
+    screen: Optional[Screen] = None,
     sort_by: Optional[str] = None,
-    sort_dir: str = "asc"
-) -> List[StockResponse]:
-    
-    # Create a shallow copy to avoid modifying the cache in-place
+    sort_dir: str = "asc",
+    columns: Optional[StockColumns] = None,
+    ranks: Optional[Mapping[str, int]] = None
+) -> Sequence[StockResponse]:
+    """
+    Filters (and sorts) `stocks`. With the snapshot's `columns` every filter
+    is one mask over them; otherwise records are filtered one by one, with
+    ranks from `ranks` (the snapshot's) or, without it, from the order of
+    `stocks`, which snapshots list in rank order. A screen is always
+    evaluated on `columns` when they are given.
+    """
+    if columns is not None and columns.stocks is stocks:
+        # Fast path: evaluate all filters at once on the published columns
+        mask = compile_mask(
+            columns, search=search, sector=sector, min_price=min_price, max_price=max_price,
+            min_volume=min_volume, max_volume=max_volume, min_change_pct=min_change_pct,
+            max_change_pct=max_change_pct, min_avg_3day_pct=min_avg_3day_pct,
+            max_avg_3day_pct=max_avg_3day_pct, min_volatility=min_volatility,
+            max_volatility=max_volatility, max_rank=max_rank, constant_only=constant_only,
+            gainers_only=gainers_only, losers_only=losers_only, high_volume_only=high_volume_only,
+            macd_status=macd_status, rsi_zone=rsi_zone, strength=strength, screen=screen
+        )
+        if sort_by:
+            # Intersect the mask with the precomputed order instead of re-sorting
+            return columns.take(columns.sorted_indices(mask, sort_by, sort_dir))
+        if mask.all():
+            # Snapshot records are immutable, so they are returned as they are
+            return stocks
+        return columns.take(np.flatnonzero(mask))
+
+    # Filtered (and sorted) as a new list
+    if ranks is None:
+        ranks = {s.symbol: rank for rank, s in enumerate(stocks, 1)}
     filtered = list(stocks)
     
     # 1. Search
@@ -71,7 +179,7 @@ def apply_filters(
         
     # 8. Rank
     if max_rank is not None:
-        filtered = [s for s in filtered if s.rank <= max_rank]
+        filtered = [s for s in filtered if ranks[s.symbol] <= max_rank]
         
     # 9. Flags
     if constant_only:
@@ -98,12 +206,26 @@ def apply_filters(
         filtered = [s for s in filtered if s.indicators.strength_label.lower().split(' ')[0] in strengths] 
         # Note: strength_label might be "Buyers Dominating", we match "buyers"
 
-    # 11. Sorting
+    # 11. Screen expression, evaluated on the whole universe as on the fast path
+    # (so avg() and friends agree) and intersected with what is left. Columns
+    # are only built here when none are given.
+    if screen is not None:
+        if columns is None:
+            columns = StockColumns(stocks, ranks)
+        matched = frozenset(columns.symbol[screen.mask(columns)].tolist())
+        filtered = [s for s in filtered if s.symbol in matched]
+
+    return sort_stocks(filtered, sort_by, sort_dir, ranks)
+
+def sort_stocks(
+    filtered: List[StockResponse], sort_by: Optional[str], sort_dir: str, ranks: Mapping[str, int]
+) -> List[StockResponse]:
+    # 12. Sorting (records do not hold their rank, so it comes from `ranks`)
     if sort_by:
         reverse = sort_dir == "desc"
         
         def get_sort_key(s: StockResponse):
-            if sort_by == "rank": return s.rank
+            if sort_by == "rank": return ranks[s.symbol]
             if sort_by == "symbol": return s.symbol
             if sort_by == "price": return s.current_price
             if sort_by == "change": return s.current_change_pct
@@ -112,7 +234,7 @@ def apply_filters(
             if sort_by == "volatility": return s.history.volatility_3_day
             if sort_by == "rsi": return s.indicators.rsi_value or 0
             if sort_by == "strength": return s.indicators.buyer_strength_score
-            return s.rank
+            return ranks[s.symbol]
             
         filtered.sort(key=get_sort_key, reverse=reverse)
         
@@ -0,0 +1,99 @@
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+from pydantic import BaseModel, TypeAdapter
+from app.schemas import StockResponse, ChartColumns, StockDelta, SectorsResponse
+from app.services.charts import ChartSeries
+from app.services.sectors import SectorStats
+
+STOCK_LIST_ADAPTER = TypeAdapter(List[StockResponse])
+# Snapshot records are a tuple; each adapter only accepts its own type without warnings
+STOCK_TUPLE_ADAPTER = TypeAdapter(Tuple[StockResponse, ...])
+# Charts are rendered from column arrays, so their points are plain dicts
+CHART_ADAPTER = TypeAdapter(List[Dict[str, Any]])
+
+# "full" includes chart_data, "summary" leaves it out
+VIEWS = ("full", "summary")
+
+# "points" is a list of ChartDataPoint, "columns" a ChartColumns
+CHART_FORMATS = ("points", "columns")
+
+def parse_fields(fields: str) -> Dict[str, Any]:
+    """
+    Turns a `fields=` selection such as "current_price,indicators.rsi_value"
+    into a pydantic include spec. `symbol` is always included.
+    Raises ValueError for unknown fields.
+    """
+    include: Dict[str, Any] = {"symbol": True}
+    for field in filter(None, (f.strip() for f in fields.split(","))):
+        name, _, sub = field.partition(".")
+        if name not in StockResponse.model_fields:
+            raise ValueError(f"Unknown field: {field}")
+        if not sub:
+            include[name] = True
+            continue
+
+        annotation = StockResponse.model_fields[name].annotation
+        if not (isinstance(annotation, type) and issubclass(annotation, BaseModel)) or sub not in annotation.model_fields:
+            raise ValueError(f"Unknown field: {field}")
+        if include.get(name) is not True:
+            include.setdefault(name, {})[sub] = True
+    return include
+
+def stock_projection(view: str = "full", fields: Optional[str] = None) -> Dict[str, Any]:
+    """Keyword arguments for pydantic's dump methods selecting `view` / `fields`."""
+    if view not in VIEWS:
+        raise ValueError(f"Unknown view: {view}")
+    if fields:
+        return {"include": parse_fields(fields)}
+    if view == "summary":
+        return {"exclude": {"chart_data": True}}
+    return {}
+
+def rank_context(ranks: Optional[Mapping[str, int]]) -> Optional[Dict[str, Any]]:
+    """Serialization context that renders each record's rank from the snapshot's `ranks`."""
+    return {"ranks": ranks} if ranks else None
+
+def dump_stocks(
+    stocks: Sequence[StockResponse],
+    view: str = "full",
+    fields: Optional[str] = None,
+    ranks: Optional[Mapping[str, int]] = None
+) -> bytes:
+    """Serializes a list of stocks to JSON in one pass."""
+    projection = {key: {"__all__": spec} for key, spec in stock_projection(view, fields).items()}
+    adapter = STOCK_TUPLE_ADAPTER if isinstance(stocks, tuple) else STOCK_LIST_ADAPTER
+    return adapter.dump_json(stocks, context=rank_context(ranks), **projection)
+
+def dump_stock(
+    stock: StockResponse,
+    view: str = "full",
+    fields: Optional[str] = None,
+    ranks: Optional[Mapping[str, int]] = None
+) -> bytes:
+    return stock.model_dump_json(context=rank_context(ranks), **stock_projection(view, fields))
+
+def dump_chart(chart: ChartSeries, chart_format: str = "points") -> bytes:
+    if chart_format not in CHART_FORMATS:
+        raise ValueError(f"Unknown chart format: {chart_format}")
+    if chart_format == "columns":
+        return ChartColumns.model_construct(**chart.columns()).model_dump_json()
+    return CHART_ADAPTER.dump_json(chart.points())
+
+def dump_delta(
+    delta: StockDelta,
+    view: str = "full",
+    fields: Optional[str] = None,
+    ranks: Optional[Mapping[str, int]] = None
+) -> bytes:
+    """Serializes a delta response, projecting each upserted record like `dump_stocks`."""
+    projection = stock_projection(view, fields)
+    context = rank_context(ranks)
+    if "include" in projection:
+        return delta.model_dump_json(context=context, include={
+            "version": True, "full": True, "removed": True, "upserts": {"__all__": projection["include"]}
+        })
+    if "exclude" in projection:
+        return delta.model_dump_json(context=context, exclude={"upserts": {"__all__": projection["exclude"]}})
+    return delta.model_dump_json(context=context)
+
+def dump_sectors(stats: SectorStats) -> bytes:
+    return SectorsResponse(market=stats.market(), sectors=stats.sectors()).model_dump_json()
@@ -0,0 +1,60 @@
+"""
+Benchmark inputs: synthetic OHLCV frames, or frames recorded by
+RecordingProvider, scaled to any number of symbols.
+"""
+import glob
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+from app.config import settings
+
+SECTORS = sorted(set(settings.SECTOR_MAPPING.values())) + ["Unknown"]
+
+def synthetic_frames(n_symbols: int, n_bars: int = 63, seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """Random-walk daily bars for `n_symbols` made-up symbols."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_bars, name="Date")
+
+    base = rng.uniform(50, 5000, n_symbols)
+    returns = rng.normal(0, 0.015, (n_bars, n_symbols))
+    closes = np.round(base * np.exp(np.cumsum(returns, axis=0)), 2)
+    opens = closes * (1 + rng.normal(0, 0.005, closes.shape))
+    highs = np.maximum(opens, closes) * (1 + rng.uniform(0, 0.01, closes.shape))
+    lows = np.minimum(opens, closes) * (1 - rng.uniform(0, 0.01, closes.shape))
+    volumes = rng.integers(100_000, 10_000_000, closes.shape).astype(np.float64)
+
+    return {
+        f"SYN{j:05d}.NS": pd.DataFrame({
+            "Open": opens[:, j], "High": highs[:, j], "Low": lows[:, j],
+            "Close": closes[:, j], "Volume": volumes[:, j],
+        }, index=dates)
+        for j in range(n_symbols)
+    }
+
+def recorded_frames(directory: str, n_symbols: int) -> Dict[str, pd.DataFrame]:
+    """
+    Frames from `download` recordings in `directory`, repeated under suffixed
+    symbol names until there are `n_symbols` of them.
+    """
+    from app.services.stocks import split_batch_frame
+
+    recorded: Dict[str, pd.DataFrame] = {}
+    for path in sorted(glob.glob(os.path.join(directory, "download-*.pkl"))):
+        with open(path, "rb") as f:
+            recording = pickle.load(f)
+        if recording["result"] is not None:
+            recorded.update(split_batch_frame(recording["result"], recording["args"]["symbols"]))
+
+    recorded = {s: df for s, df in recorded.items() if len(df) >= 5}
+    if not recorded:
+        raise ValueError(f"No usable download recordings in {directory}")
+
+    symbols: List[str] = list(recorded)
+    frames = {}
+    for k in range(n_symbols):
+        source = symbols[k % len(symbols)]
+        copy = k // len(symbols)
+        frames[source if copy == 0 else f"{source}~{copy}"] = recorded[source]
+    return frames
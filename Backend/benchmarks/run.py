@@ -0,0 +1,274 @@
+"""
+Benchmark suite for the refresh, processing, filtering and serialization paths.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.run --sizes 208,2000,20000 --output results.json
+    python -m benchmarks.run --recorded data/recordings --compare baseline.json
+
+Results are written as JSON so runs from different releases can be compared.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.services import stocks
+from app.services.backtest import HistoryColumns, run_backtest
+from app.services.screener import PLANS, compile_screen
+from app.services.store import to_records
+from app.services.timeframes import ResampledBars, aggregate
+from app.utils.filters import apply_filters
+from benchmarks.data import SECTORS, recorded_frames, synthetic_frames
+
+# Filter combinations exercised by the dashboard
+FILTER_CASES: Dict[str, Dict] = {
+    "none": {},
+    "search": {"search": "syn001"},
+    "sector": {"sector": "IT"},
+    "price_range": {"min_price": 500, "max_price": 2500},
+    "gainers_high_volume": {"gainers_only": True, "high_volume_only": True},
+    "indicators": {"macd_status": "above_zero,near_zero", "rsi_zone": "neutral", "strength": "buyers"},
+    "numeric_ranges": {
+        "min_price": 100, "max_price": 4000, "min_volume": 500_000, "min_change_pct": -2,
+        "max_change_pct": 2, "min_avg_3day_pct": -1, "max_avg_3day_pct": 1,
+        "max_volatility": 2, "max_rank": 1000,
+    },
+    "sorted_volume_desc": {"sort_by": "volume", "sort_dir": "desc"},
+    "filtered_sorted": {"gainers_only": True, "min_volume": 1_000_000, "sort_by": "rsi", "sort_dir": "desc"},
+}
+
+# Screen expressions, from one field to a mix of numeric, flag and string tests
+SCREEN_CASES: Dict[str, str] = {
+    "single": "rsi < 30",
+    "mixed": "rsi < 50 and is_high_volume and price > ema_50 and sector in ('IT', 'Pharma')",
+    "arithmetic": "volume > 1.5 * avg(volume) and abs(change) < 2 or 40 <= rsi < 60",
+}
+
+# Largest universe for the per-symbol `process_stock_data` path; larger
+# sizes are timed on a sample and reported per symbol.
+PER_SYMBOL_SAMPLE = 500
+
+def time_call(fn: Callable, repeats: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+    }
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the debug prints of the code under test."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        "max": ordered[-1],
+    }
+
+async def latency_during_refresh(app, frames, process: Callable[[Dict], Awaitable], path: str) -> List[float]:
+    """
+    Polls `path` while a refresh cycle (batches of 50, as in
+    `refresh_market_data`) is processed with `process`; returns request latencies.
+    """
+    import httpx
+
+    reset_state()
+    latencies: List[float] = []
+    refreshing = True
+
+    async def poll(client):
+        while refreshing:
+            started = time.perf_counter()
+            (await client.get(path)).raise_for_status()
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.002)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        poller = asyncio.create_task(poll(client))
+        items = list(frames.items())
+        for i in range(0, len(items), 50):
+            stocks.update_cache(await process(dict(items[i:i + 50])))
+            await asyncio.sleep(0)
+        refreshing = False
+        await poller
+    return latencies
+
+def reset_state():
+    stocks.INDICATOR_STATE.clear()
+    stocks.update_cache([], removed=list(stocks.SNAPSHOT.by_symbol))
+
+def bench_size(frames, repeats: int) -> List[Dict]:
+    size = len(frames)
+    results = []
+
+    def record(name: str, seconds: Dict[str, float], **extra):
+        results.append({"benchmark": name, "size": size, "repeats": repeats, "seconds": seconds, **extra})
+        print(f"  {name:<48} {seconds['median'] * 1000:>10.2f} ms", file=sys.stderr)
+
+    # --- Processing ---
+    sample = dict(list(frames.items())[:PER_SYMBOL_SAMPLE])
+    with quiet():
+        seconds = time_call(lambda: [stocks.process_stock_data(s, df, {}) for s, df in sample.items()], repeats)
+    record("process_stock_data", seconds, symbols_timed=len(sample),
+           per_symbol_ms=seconds["median"] / len(sample) * 1000)
+
+    def full_batch():
+        reset_state()
+        return stocks.process_batch(frames)
+
+    with quiet():
+        record("process_batch.full", time_call(full_batch, repeats))
+        records = stocks.process_batch(frames)  # second pass revises every symbol's last bar
+        record("process_batch.incremental", time_call(lambda: stocks.process_batch(frames), repeats))
+
+    # --- Resampling ---
+    bars = {symbol: to_records(df) for symbol, df in frames.items()}
+    record("aggregate.1w", time_call(lambda: aggregate(bars, "1w"), repeats))
+    weekly = ResampledBars("1w", 63)
+    weekly.update(bars)
+    # Every symbol's last bar revised: only the last week is re-aggregated
+    record("ResampledBars.update.1w", time_call(lambda: weekly.update(bars), repeats))
+
+    for k, stock in enumerate(records):
+        stock.sector = SECTORS[k % len(SECTORS)]
+
+    # --- Cache Publish ---
+    with quiet():
+        record("update_cache", time_call(lambda: stocks.update_cache(list(records)), repeats))
+        stocks.update_cache(list(records))
+        # One refresh batch: 50 reprocessed symbols whose scores moved
+        batch = [
+            stock.model_copy(update={"history": stock.history.model_copy(
+                update={"avg_3_day_change_pct": stock.history.avg_3_day_change_pct + 0.5})})
+            for stock in stocks.SNAPSHOT.records[::max(1, size // 50)][:50]
+        ]
+        record("update_cache.batch", time_call(lambda: stocks.update_cache(batch), repeats), symbols=len(batch))
+    cached = stocks.SNAPSHOT.records
+    columns = stocks.SNAPSHOT.columns
+
+    # --- Filtering ---
+    for case, params in FILTER_CASES.items():
+        matched = len(apply_filters(cached, **params))
+        record(f"apply_filters.{case}", time_call(lambda: apply_filters(cached, **params), repeats), matched=matched)
+        record(f"apply_filters.columnar.{case}",
+               time_call(lambda: apply_filters(cached, **params, columns=columns), repeats), matched=matched)
+
+    # --- Screens ---
+    for case, expression in SCREEN_CASES.items():
+        record(f"compile_screen.{case}", time_call(lambda: (PLANS.clear(), compile_screen(expression)), repeats))
+        screen = compile_screen(expression)
+        matched = int(screen.mask(columns).sum())
+        record(f"Screen.mask.{case}", time_call(lambda: screen.mask(columns), repeats), matched=matched)
+
+    # --- Backtest ---
+    history = HistoryColumns(bars)
+    record("HistoryColumns", time_call(lambda: HistoryColumns(bars), repeats), dates=len(history.dates))
+    screens = [compile_screen(expression) for expression in SCREEN_CASES.values()]
+    record("run_backtest", time_call(lambda: run_backtest(history, screens), repeats), screens=len(screens))
+
+    # --- Serialization through the route ---
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)  # not entered, so the refresh task is not started
+    for path in ("/api/v1/stocks/fno", "/api/v1/stocks/fno?view=summary", "/api/v1/stocks/gainers-3day", "/api/v1/sectors/"):
+        response = client.get(path)
+        response.raise_for_status()
+        record(f"GET {path}", time_call(lambda: client.get(path).content, repeats),
+               response_bytes=len(response.content))
+        revalidate = {"If-None-Match": response.headers["etag"]}
+        record(f"GET {path} (304)", time_call(lambda: client.get(path, headers=revalidate), repeats))
+
+    # --- Latency During Refresh ---
+    async def inline(batch):
+        return stocks.process_batch(batch)
+
+    path = "/api/v1/stocks/fno?view=summary"
+    for mode, process in (("inline", inline), ("pool", stocks.process_batch_async)):
+        with quiet():
+            latencies = asyncio.run(latency_during_refresh(app, frames, process, path))
+        seconds = latency_stats(latencies)
+        record(f"GET {path} during refresh ({mode})", seconds, requests=len(latencies),
+               p99_ms=seconds["p99"] * 1000, max_ms=seconds["max"] * 1000)
+    stocks.shutdown_executors()
+
+    return results
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+def compare(results: List[Dict], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(r["benchmark"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\n{'benchmark':<48} {'size':>7} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}", file=sys.stderr)
+    for r in results:
+        base = baseline.get((r["benchmark"], r["size"]))
+        if not base:
+            continue
+        old, new = base["seconds"]["median"] * 1000, r["seconds"]["median"] * 1000
+        ratio = new / old if old else float("inf")
+        print(f"{r['benchmark']:<48} {r['size']:>7} {old:>12.2f} {new:>12.2f} {ratio:>7.2f}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="208,2000,20000", help="comma-separated universe sizes")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--bars", type=int, default=63, help="bars per synthetic symbol")
+    parser.add_argument("--recorded", help="use download recordings from this directory instead of synthetic data")
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        print(f"size={size}", file=sys.stderr)
+        if args.recorded:
+            frames = recorded_frames(args.recorded, size)
+        else:
+            frames = synthetic_frames(size, n_bars=args.bars)
+        results.extend(bench_size(frames, args.repeats))
+
+    report = {
+        "created": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "data": args.recorded or f"synthetic:{args.bars}bars",
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
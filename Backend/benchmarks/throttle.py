@@ -0,0 +1,140 @@
+"""
+Refresh cycles against a throttling stub of the upstream.
+
+The stub serves synthetic bars but, like Yahoo, only allows a certain number
+of symbols per second. Past that it answers with HTTP 429 (RateLimited) or,
+in "empty" mode, silently leaves the excess symbols out. The same refresh
+cycle code used in production runs once with a fixed schedule (50 symbols,
+a constant pause) and once with the adaptive FetchController.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.throttle --mode 429 --upstream-rate 60    # tight upstream
+    python -m benchmarks.throttle --mode empty --upstream-rate 400 # generous upstream
+
+Times are scaled down ~10x from production so a run takes seconds.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import pandas as pd
+
+from app.services import metrics, stocks
+from app.services.providers import MarketDataProvider, set_provider
+from app.services.ratelimit import FetchController, RateLimited, TokenBucket
+from app.services.store import BarStore
+from benchmarks.data import synthetic_frames
+
+class ThrottlingStubProvider(MarketDataProvider):
+    """Upstream stub allowing `symbols_per_second` (with `burst`) before throttling."""
+
+    def __init__(self, frames: Dict[str, pd.DataFrame], symbols_per_second: float, burst: float,
+                 mode: str = "429", latency: float = 0.02, latency_per_symbol: float = 0.0002):
+        self.frames = frames
+        self.bucket = TokenBucket(symbols_per_second, burst)
+        self.mode = mode
+        self.latency = latency
+        self.latency_per_symbol = latency_per_symbol
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def download(self, symbols: List[str], **window) -> pd.DataFrame:
+        time.sleep(self.latency + self.latency_per_symbol * len(symbols))
+        with self._lock:
+            self.requests += 1
+            allowed = [s for s in symbols if self.bucket.try_acquire()]
+            if len(allowed) < len(symbols):
+                self.throttled += 1
+                if self.mode == "429":
+                    raise RateLimited("429 Too Many Requests")
+        if not allowed:
+            return pd.DataFrame()
+        return pd.concat({s: self.frames[s] for s in allowed}, axis=1, names=["Ticker", "Price"])
+
+    def history(self, symbol: str, period: str = "3mo") -> pd.DataFrame:
+        return self.frames.get(symbol, pd.DataFrame())
+
+    def quote(self, symbol: str) -> Dict:
+        return {"symbol": symbol}
+
+class FixedController(FetchController):
+    """The previous schedule: constant batch size and pause, a constant wait after errors."""
+
+    def __init__(self, error_delay: float, **kwargs):
+        super().__init__(**kwargs)
+        self.error_delay = error_delay
+
+    def on_success(self, returned_share: float = 1.0):
+        pass
+
+    def on_throttle(self) -> float:
+        return self.error_delay
+
+def failed_symbols() -> float:
+    return sum(metrics.FAILED_SYMBOLS.value(reason=r) for r in ("no_data", "throttled", "batch_error", "processing"))
+
+async def run_cycles(controller: FetchController, symbols: List[str], cycles: int) -> List[Dict]:
+    report = []
+    deferred: List[str] = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        failed = failed_symbols()
+        skipped = set(deferred)
+        ordered = deferred + [s for s in symbols if s not in skipped]
+        with contextlib.redirect_stdout(io.StringIO()):
+            deferred = await stocks.refresh_cycle(ordered, controller)
+        report.append({
+            "seconds": round(time.perf_counter() - started, 3),
+            "requests": controller.requests,
+            "deferred": len(deferred),
+            "failed": int(failed_symbols() - failed),
+            "batch_size": controller.batch_size,
+        })
+    return report
+
+def run(name: str, controller: FetchController, frames, args) -> Dict:
+    provider = ThrottlingStubProvider(frames, args.upstream_rate, args.upstream_burst, mode=args.mode)
+    set_provider(provider)
+    with tempfile.TemporaryDirectory() as root:
+        stocks.BAR_STORE = BarStore(root)
+        stocks.INDICATOR_STATE.clear()
+        cycles = asyncio.run(run_cycles(controller, list(frames), args.cycles))
+    stocks.shutdown_executors()
+
+    result = {"schedule": name, "cycles": cycles, "upstream_requests": provider.requests,
+              "upstream_throttled": provider.throttled}
+    print(f"{name:<10} cycle seconds {[c['seconds'] for c in cycles]}  failed {[c['failed'] for c in cycles]}  "
+          f"deferred {[c['deferred'] for c in cycles]}  throttled {provider.throttled}/{provider.requests}", file=sys.stderr)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--cycles", type=int, default=4)
+    parser.add_argument("--mode", choices=("429", "empty"), default="429")
+    parser.add_argument("--upstream-rate", type=float, default=60, help="symbols per second the stub allows")
+    parser.add_argument("--upstream-burst", type=float, default=200)
+    args = parser.parse_args(argv)
+
+    frames = synthetic_frames(args.symbols)
+    # Production pacing divided by 10
+    common = dict(requests_per_second=5, burst=2, max_backoff=30, cycle_budget=200)
+    results = [
+        run("fixed", FixedController(0.5, batch_size=50, min_delay=0.2, max_delay=0.2, **common), frames, args),
+        run("adaptive", FetchController(batch_size=50, max_batch_size=200, min_delay=0.05, max_delay=3, **common),
+            frames, args),
+    ]
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import math
+import numpy as np
+import pytest
+from app.services import stocks
+from benchmarks.data import SECTORS, synthetic_frames
+
+def reset_stocks():
+    stocks.INDICATOR_STATE.clear()
+    stocks.update_cache([], removed=list(stocks.SNAPSHOT.by_symbol))
+
+def rescored(records, values):
+    """Copies of `records` with the 3-day averages `values`, which re-ranks them."""
+    return [
+        stock.model_copy(update={"history": stock.history.model_copy(update={"avg_3_day_change_pct": value})})
+        for stock, value in zip(records, values)
+    ]
+
+def differences(a, b, path=""):
+    """Paths where two dumped records differ, floats compared to 1e-9."""
+    if isinstance(a, dict) and isinstance(b, dict) and a.keys() == b.keys():
+        return [d for key in a for d in differences(a[key], b[key], f"{path}.{key}")]
+    if isinstance(a, list) and isinstance(b, list) and len(a) == len(b):
+        return [d for k, (x, y) in enumerate(zip(a, b)) for d in differences(x, y, f"{path}[{k}]")]
+    if isinstance(a, float) and isinstance(b, float):
+        same = math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9) or (math.isnan(a) and math.isnan(b))
+    else:
+        same = a == b
+    return [] if same else [(path, a, b)]
+
+def assert_same_record(stock, expected):
+    """Equal records apart from their computation time."""
+    found = differences(stock.model_dump(exclude={"last_updated"}), expected.model_dump(exclude={"last_updated"}))
+    assert not found, f"{stock.symbol}: {found[:5]}"
+
+@pytest.fixture
+def frames():
+    return synthetic_frames(200, seed=7)
+
+@pytest.fixture
+def published(frames):
+    """The stock service with `frames` processed and published; emptied again afterwards."""
+    reset_stocks()
+    records = stocks.process_batch(frames)
+    for k, stock in enumerate(records):
+        stock.sector = SECTORS[k % len(SECTORS)]
+    stocks.update_cache(records)
+    yield stocks
+    reset_stocks()
+
+@pytest.fixture
+def reranked(published):
+    """`published` after one batch that moves 20 symbols from all over the ranking to near the top."""
+    rng = np.random.default_rng(3)
+    picked = [published.SNAPSHOT.records[i] for i in rng.choice(len(published.SNAPSHOT.records), 20, replace=False)]
+    published.update_cache(rescored(picked, rng.uniform(-0.05, 0.05, len(picked))))
+    return published
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from app.services.columns import _merged_order, _stable_orders
+
+def random_values(rng, kind: str, size: int) -> np.ndarray:
+    if kind == "float":
+        values = rng.integers(0, 5, size).astype(float)
+        values[rng.random(size) < 0.2] = np.nan
+        return values
+    if kind == "int":
+        return rng.integers(0, 4, size)
+    return rng.choice(np.array(["A", "BB", "C", "DD"]), size)
+
+@pytest.mark.parametrize("kind", ["float", "int", "str"])
+def test_merged_order_matches_a_full_sort(kind):
+    rng = np.random.default_rng(5)
+    for _ in range(300):
+        previous = random_values(rng, kind, int(rng.integers(1, 40)))
+        kept = np.flatnonzero(rng.random(len(previous)) > 0.3)
+        size = len(kept) + int(rng.integers(0, 10))
+        added = np.sort(rng.choice(size, size - len(kept), replace=False)).astype(np.intp)
+        # Kept rows keep their relative order; added rows take the free ones
+        source = np.full(size, -1)
+        free = np.ones(size, dtype=bool)
+        free[added] = False
+        source[free] = kept
+        values = previous[np.maximum(source, 0)]
+        values[added] = random_values(rng, kind, len(added))
+        new_rows = np.full(len(previous), -1, dtype=np.intp)
+        new_rows[kept] = np.flatnonzero(free)
+
+        expected = _stable_orders(values)
+        for direction, order in _stable_orders(previous).items():
+            merged = _merged_order(order, new_rows, values, added, direction == "desc")
+            np.testing.assert_array_equal(merged, expected[direction])
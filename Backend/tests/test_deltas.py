@@ -0,0 +1,56 @@
+import pytest
+from tests.conftest import rescored
+
+@pytest.fixture
+def client(published):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    # Not entered, so the refresh task is not started
+    return TestClient(app)
+
+def applied(held, delta):
+    """The list a client holding `held` has after applying `delta`, by symbol."""
+    if delta["full"]:
+        return {stock["symbol"]: stock for stock in delta["upserts"]}
+    result = {stock["symbol"]: stock for stock in held}
+    for symbol in delta["removed"]:
+        assert symbol in result, f"{symbol} removed but never sent"
+        del result[symbol]
+    result.update((stock["symbol"], stock) for stock in delta["upserts"])
+    return result
+
+def catch_up(client, path, published, batch):
+    """Fetches `path`, publishes `batch`, and checks the delta since the first fetch against a fresh fetch."""
+    first = client.get(path)
+    version = int(first.headers["x-snapshot-version"])
+    published.update_cache(batch)
+    separator = "&" if "?" in path else "?"
+    delta = client.get(f"{path}{separator}since={version}").json()
+    assert not delta["full"]
+    fresh = {stock["symbol"]: stock for stock in client.get(path).json()}
+    assert applied(first.json(), delta) == fresh
+    return delta
+
+def test_top_k_entrant_is_sent(client, published):
+    top = client.get("/api/v1/stocks/gainers-3day?limit=5").json()
+    # The top gainer drops out; the sixth moves in without changing itself
+    leader = published.SNAPSHOT.get(top[0]["symbol"])
+    delta = catch_up(client, "/api/v1/stocks/gainers-3day?limit=5", published, rescored([leader], [-50.0]))
+    assert delta["removed"] == [leader.symbol]
+    assert leader.symbol not in {stock["symbol"] for stock in delta["upserts"]}
+    entrant = published.SNAPSHOT.columns.top("avg_3day", "desc", 5)[-1].symbol
+    assert entrant in {stock["symbol"] for stock in delta["upserts"]}
+
+def test_cross_sectional_screen(client, published):
+    # Raising a few averages moves avg() and with it which other stocks match
+    records = published.SNAPSHOT.records
+    batch = rescored(records[:10], [40.0] * 10)
+    path = "/api/v1/stocks/fno?view=summary&screen=avg_3day%20%3E%20avg(avg_3day)"
+    delta = catch_up(client, path, published, batch)
+    assert delta["removed"]
+    assert set(delta["removed"]).isdisjoint(stock.symbol for stock in batch)
+
+def test_unknown_version_gets_the_full_list(client):
+    delta = client.get("/api/v1/stocks/gainers-3day?limit=5&since=1000000").json()
+    assert delta["full"] and len(delta["upserts"]) == 5
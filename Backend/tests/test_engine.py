@@ -0,0 +1,18 @@
+from app.services import stocks
+from app.services.engine import MIN_BARS, process_universe
+from tests.conftest import assert_same_record
+
+def test_engine_matches_the_per_symbol_path(frames):
+    sample = dict(list(frames.items())[:40])
+    # Uneven histories, so the matrices carry leading padding for some symbols
+    sample.update({symbol: frames[symbol].iloc[-n:] for symbol, n in zip(list(frames)[40:46], (MIN_BARS, 6, 20, 26, 35, 50))})
+    computed = process_universe(sample)
+    assert [stock.symbol for stock in computed] == list(sample)
+    for stock, (symbol, df) in zip(computed, sample.items()):
+        assert_same_record(stock, stocks.process_stock_data(symbol, df, {}))
+
+def test_short_histories_get_placeholders(frames):
+    sample = {symbol: df.iloc[:MIN_BARS - 1] for symbol, df in list(frames.items())[:3]}
+    for stock, (symbol, df) in zip(process_universe(sample), sample.items()):
+        assert stock.current_price == 0.0 and stock.indicators.rsi_value is None
+        assert_same_record(stock, stocks.process_stock_data(symbol, df, {}))
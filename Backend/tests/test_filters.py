@@ -0,0 +1,70 @@
+import pytest
+from app.utils import filters
+from app.utils.filters import apply_filters
+
+@pytest.fixture
+def compiled(monkeypatch):
+    """Counts the columnar fast path's compile_mask calls."""
+    calls = []
+    compile_mask = filters.compile_mask
+    monkeypatch.setattr(filters, "compile_mask", lambda *args, **kwargs: calls.append(1) or compile_mask(*args, **kwargs))
+    return calls
+
+def true_top(snapshot, k):
+    return {symbol for symbol, rank in snapshot.ranks.items() if rank <= k}
+
+def test_snapshot_columns_take_the_fast_path(reranked, compiled):
+    snapshot = reranked.SNAPSHOT
+    assert snapshot.columns.stocks is snapshot.records
+    assert apply_filters(snapshot.records, columns=snapshot.columns) is snapshot.records
+    apply_filters(snapshot.records, max_rank=5, columns=snapshot.columns)
+    assert len(compiled) == 2
+
+def test_max_rank_after_reranking(reranked):
+    snapshot = reranked.SNAPSHOT
+    result = apply_filters(snapshot.records, max_rank=5, columns=snapshot.columns)
+    assert {stock.symbol for stock in result} == true_top(snapshot, 5)
+
+def test_sort_by_rank_after_reranking(reranked):
+    snapshot = reranked.SNAPSHOT
+    result = apply_filters(snapshot.records, sector=snapshot.records[0].sector, sort_by="rank", columns=snapshot.columns)
+    ranks = [snapshot.ranks[stock.symbol] for stock in result]
+    assert ranks == sorted(ranks)
+
+@pytest.fixture
+def client(reranked):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services.screener import SCREENS
+
+    # Not entered, so the refresh task is not started
+    yield TestClient(app)
+    SCREENS.delete("top3")
+
+@pytest.fixture
+def no_rebuilds(monkeypatch):
+    """Fails any columns built from records while filtering."""
+    def rebuild(*args, **kwargs):
+        raise AssertionError("columns rebuilt per request")
+    monkeypatch.setattr(filters, "StockColumns", rebuild)
+
+def test_rank_screen_matches_the_true_top(reranked, no_rebuilds):
+    from app.services.screener import compile_screen
+
+    snapshot = reranked.SNAPSHOT
+    screen = compile_screen("rank <= 3")
+    assert int(screen.mask(snapshot.columns).sum()) == 3
+    fast = apply_filters(snapshot.records, screen=screen, columns=snapshot.columns)
+    # Records not in the columns' own tuple take the per-record path, with the screen still on the columns
+    slow = apply_filters(list(snapshot.records), screen=screen, columns=snapshot.columns, ranks=snapshot.ranks)
+    assert {s.symbol for s in fast} == {s.symbol for s in slow} == true_top(snapshot, 3)
+
+def test_rank_screen_through_the_routes(reranked, client, no_rebuilds):
+    snapshot = reranked.SNAPSHOT
+    saved = client.put("/api/v1/screens/top3", json={"expression": "rank <= 3"})
+    assert saved.json()["matches"] == 3
+    assert client.get("/api/v1/screens/").json()[0]["matches"] == 3
+    for path in ("/api/v1/screens/top3/stocks", "/api/v1/stocks/fno?screen=rank%20%3C%3D%203"):
+        result = client.get(path).json()
+        assert {s["symbol"] for s in result} == true_top(snapshot, 3)
+        assert sorted(s["rank"] for s in result) == [1, 2, 3]
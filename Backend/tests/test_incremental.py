@@ -0,0 +1,57 @@
+import pytest
+from app.services import stocks
+from app.services.engine import process_universe
+from tests.conftest import assert_same_record, reset_stocks
+
+@pytest.fixture
+def recomputed(monkeypatch):
+    """Symbols that went through the full engine instead of their incremental state."""
+    reset_stocks()
+    symbols = []
+    engine = stocks.process_universe
+    monkeypatch.setattr(stocks, "process_universe", lambda frames: symbols.extend(frames) or engine(frames))
+    yield symbols
+    reset_stocks()
+
+def revised(df, close):
+    df = df.copy()
+    df.iloc[-1, df.columns.get_loc("Close")] = close
+    return df
+
+def assert_matches_full(result, frames):
+    for stock, expected in zip(result, process_universe(frames)):
+        assert_same_record(stock, expected)
+
+def test_appended_bar(frames, recomputed):
+    sample = dict(list(frames.items())[:20])
+    stocks.process_batch({symbol: df.iloc[:-1] for symbol, df in sample.items()})
+    recomputed.clear()
+    assert_matches_full(stocks.process_batch(sample), sample)
+    assert recomputed == []
+
+def test_revised_last_bar(frames, recomputed):
+    sample = dict(list(frames.items())[:20])
+    stocks.process_batch(sample)
+    recomputed.clear()
+    changed = {symbol: revised(df, df["Close"].iloc[-1] * 1.03) for symbol, df in sample.items()}
+    assert_matches_full(stocks.process_batch(changed), changed)
+    assert recomputed == []
+
+def test_previous_bar_settles_as_the_next_one_arrives(frames, recomputed):
+    sample = dict(list(frames.items())[:20])
+    # The last close seen was provisional; the download with the next bar has it settled
+    stocks.process_batch({symbol: revised(df.iloc[:-1], df["Close"].iloc[-2] * 0.98) for symbol, df in sample.items()})
+    recomputed.clear()
+    assert_matches_full(stocks.process_batch(sample), sample)
+    assert recomputed == []
+
+def test_older_bars_changed(frames, recomputed):
+    symbol, df = next(iter(frames.items()))
+    stocks.process_batch({symbol: df.iloc[:-1]})
+    recomputed.clear()
+    # The window moved by one bar, so its first bar is a different one
+    stocks.process_batch({symbol: df.iloc[1:]})
+    adjusted = df.copy()
+    adjusted["Close"] *= 0.5
+    stocks.process_batch({symbol: adjusted})
+    assert recomputed == [symbol, symbol]
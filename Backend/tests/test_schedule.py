@@ -0,0 +1,35 @@
+from datetime import datetime
+import pytest
+from app.config import settings
+from app.services import metrics, schedule
+from app.services.schedule import IST, RefreshScheduler, market_phase, next_session_start
+
+@pytest.fixture
+def nse(monkeypatch):
+    """The NSE calendar with only the built-in 2026 list."""
+    monkeypatch.setattr(settings, "MARKET_SCHEDULE", "nse")
+    monkeypatch.setattr(settings, "NSE_HOLIDAYS", [])
+    schedule.holidays.cache_clear()
+    yield
+    schedule.holidays.cache_clear()
+
+def test_listed_holidays(nse):
+    # Christmas 2026 is a Friday
+    assert market_phase(datetime(2026, 12, 25, 10, 0, tzinfo=IST)) == "closed"
+    assert market_phase(datetime(2026, 12, 24, 10, 0, tzinfo=IST)) == "open"
+
+def test_year_without_a_holiday_list(nse):
+    symbols = ["A.NS", "B.NS"]
+    scheduler = RefreshScheduler()
+    scheduler.mark_refreshed(symbols, datetime(2026, 12, 31, 15, 40, tzinfo=IST).timestamp())
+
+    # After the last 2026 session the next one is in 2027, which has no list: weekdays trade
+    evening = datetime(2026, 12, 31, 16, 0, tzinfo=IST)
+    assert next_session_start(evening) == datetime(2027, 1, 1, 9, 0, tzinfo=IST)
+    assert scheduler.seconds_until_due(symbols, set(), evening) > 0
+    assert metrics.CALENDAR_UNLISTED_YEAR.samples() == ["stock_calendar_unlisted_year 2027.0"]
+
+    monday = datetime(2027, 1, 4, 10, 0, tzinfo=IST)
+    assert market_phase(monday) == "open"
+    assert scheduler.due_symbols(symbols, set(), monday) == symbols
+    assert market_phase(datetime(2027, 1, 2, 10, 0, tzinfo=IST)) == "closed"
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from app.services.columns import StockColumns
+from app.services.screener import PLANS, PlanCache, compile_screen, normalize, tokenize
+
+@pytest.mark.parametrize("expression, message", [
+    ("rsi <", "Expected a value at position 5 (found end of expression)"),
+    ("foo > 1", "Unknown field 'foo' at position 0"),
+    ("rsi @ 3", "Unexpected '@' at position 4"),
+    ("rsi + 1", "A screen must be a condition, not a num value at position 0"),
+    ("(rsi < 3", "Expected ')' at position 8"),
+    ("rsi < 'a'", "Cannot compare num with str using '<' at position 4"),
+    ("abs(rsi, 2) > 1", "abs() takes 1 argument(s) at position 0"),
+    ("rsi < 30 rsi", "Unexpected token at position 9"),
+])
+def test_invalid_expressions(expression, message):
+    with pytest.raises(ValueError) as error:
+        compile_screen(expression)
+    assert str(error.value).startswith(message)
+
+@pytest.mark.parametrize("variant", [
+    "RSI<30   AND is_high_volume",
+    "indicators.rsi_value < 30 and flags.is_high_volume",
+    "rsi < 3e1 && is_high_volume",
+])
+def test_equivalent_expressions_share_a_plan(variant):
+    plan = compile_screen("rsi < 30 and is_high_volume")
+    assert compile_screen(variant) is plan
+    assert plan.expression == "indicators.rsi_value < 30.0 and flags.is_high_volume"
+    assert plan.fields == {"indicators.rsi_value", "flags.is_high_volume"}
+
+def test_normalize_keeps_string_literals():
+    assert normalize(tokenize("sector = 'IT'")) != normalize(tokenize("sector = 'it'"))
+    assert normalize(tokenize("SECTOR = 'IT'")) == normalize(tokenize("sector == \"IT\""))
+
+def test_plan_cache_evicts_least_recently_used():
+    plans = PlanCache(2)
+    first = plans.compile("rsi < 30")
+    forty = plans.compile("rsi < 40")
+    assert plans.compile("rsi  <  30") is first
+    plans.compile("rsi < 50")
+    assert len(plans) == 2
+    # "rsi < 40" was the least recently used
+    assert plans.compile("rsi < 30") is first
+    assert plans.compile("rsi < 40") is not forty
+    assert len(plans) == 2
+
+def test_mask_matches_the_records(published):
+    snapshot = published.SNAPSHOT
+    mask = compile_screen("rsi < 50 and price > 100 or sector in ('IT', 'Pharma')").mask(snapshot.columns)
+    expected = [
+        (s.indicators.rsi_value is not None and s.indicators.rsi_value < 50 and s.current_price > 100)
+        or s.sector in ("IT", "Pharma")
+        for s in snapshot.records
+    ]
+    assert np.array_equal(mask, expected)
+
+def test_missing_values_fail_negated_comparisons(published):
+    records = [
+        stock.model_copy(update={
+            "sector": None,
+            "indicators": stock.indicators.model_copy(update={"rsi_value": None})
+        }) if k % 5 == 0 else stock
+        for k, stock in enumerate(published.SNAPSHOT.records)
+    ]
+    columns = StockColumns(records)
+    cases = {
+        "sector != 'IT'": lambda s: s.sector is not None and s.sector != "IT",
+        "sector not in ('IT', 'Pharma')": lambda s: s.sector is not None and s.sector not in ("IT", "Pharma"),
+        "rsi not in (30, 70)": lambda s: s.indicators.rsi_value is not None and s.indicators.rsi_value not in (30, 70),
+        "not (sector == 'IT')": lambda s: s.sector != "IT",
+    }
+    for expression, expected in cases.items():
+        mask = compile_screen(expression).mask(columns)
+        assert mask.tolist() == [expected(s) for s in records], expression
@@ -0,0 +1,66 @@
+import numpy as np
+from app.config import settings
+from app.services.sectors import SectorStats
+from tests.conftest import rescored
+
+def by_sector(stats: SectorStats):
+    return {sector: (stats.stocks[row], stats.sums[row], stats.observed[row]) for sector, row in stats.codes.items()}
+
+def churn(published, pool, rng, batches: int, empty: str = None):
+    """Random batches of re-scored, removed and returning (from `pool`) records; the first one can `empty` a sector."""
+    for k in range(batches):
+        records = published.SNAPSHOT.records
+        picked = [records[i] for i in rng.choice(len(records), 20, replace=False)]
+        batch = rescored(picked, rng.normal(0, 3, len(picked)))
+        if k == 0 and empty:
+            removed = [stock.symbol for stock in records if stock.sector == empty]
+        else:
+            removed = [records[i].symbol for i in rng.choice(len(records), 3, replace=False)]
+        returning = [stock for stock in pool if stock.symbol not in published.SNAPSHOT.by_symbol][:3]
+        published.update_cache(batch + returning, removed=removed)
+
+def test_updates_match_a_full_build(published, monkeypatch):
+    monkeypatch.setattr(settings, "SECTOR_REBUILD_EVERY", 10_000)
+    pool = list(published.SNAPSHOT.records)
+    updates = published.SNAPSHOT.sectors.updates
+    churn(published, pool, np.random.default_rng(5), 40, empty=pool[0].sector)
+    snapshot = published.SNAPSHOT
+    assert snapshot.sectors.updates == updates + 40
+
+    built = by_sector(SectorStats.build(snapshot.records))
+    for sector, (stocks, sums, observed) in by_sector(snapshot.sectors).items():
+        expected = built.get(sector, (0, np.zeros_like(sums), np.zeros_like(observed)))
+        assert stocks == expected[0] and np.array_equal(observed, expected[2]), sector
+        np.testing.assert_allclose(sums, expected[1], rtol=1e-9, atol=1e-9, err_msg=sector)
+        # Nothing left to sum over: exactly 0, not rounding residue
+        assert np.all(sums[observed == 0] == 0.0), sector
+    assert snapshot.sectors.sectors() == SectorStats.build(snapshot.records).sectors()
+    assert snapshot.sectors.market() == SectorStats.build(snapshot.records).market()
+
+def test_emptied_sector_is_reset(published, monkeypatch):
+    monkeypatch.setattr(settings, "SECTOR_REBUILD_EVERY", 10_000)
+    pool = list(published.SNAPSHOT.records)
+    churn(published, pool, np.random.default_rng(6), 1, empty=pool[0].sector)
+    stats = published.SNAPSHOT.sectors
+    row = stats.codes[pool[0].sector]
+    assert stats.stocks[row] == 0
+    assert not stats.sums[row].any() and not stats.observed[row].any()
+    assert pool[0].sector not in {summary.sector for summary in stats.sectors()}
+
+def test_rebuilt_every_n_batches(published, monkeypatch):
+    monkeypatch.setattr(settings, "SECTOR_REBUILD_EVERY", 4)
+    pool = list(published.SNAPSHOT.records)
+    rng = np.random.default_rng(8)
+    counts = []
+    for _ in range(12):
+        churn(published, pool, rng, 1)
+        counts.append(published.SNAPSHOT.sectors.updates)
+        if counts[-1] == 0:
+            snapshot = published.SNAPSHOT
+            built = SectorStats.build(snapshot.records)
+            assert snapshot.sectors.codes == built.codes
+            assert np.array_equal(snapshot.sectors.sums, built.sums)
+    assert max(counts) == 3
+    # Counting up to 3 and back to 0 on the rebuild
+    first = counts.index(0)
+    assert counts[first:first + 8] == [0, 1, 2, 3, 0, 1, 2, 3]
@@ -0,0 +1,94 @@
+import json
+import numpy as np
+import pytest
+from app.services import metrics
+from app.services.columns import StockColumns
+from app.services.ranking import stability_score
+from app.utils.serializers import dump_stocks
+from tests.conftest import rescored
+
+def assert_same_columns(columns: StockColumns, fresh: StockColumns):
+    for name in StockColumns.ARRAYS + ("rank",):
+        np.testing.assert_array_equal(getattr(columns, name), getattr(fresh, name), err_msg=name)
+    for name in StockColumns.CATEGORICALS:
+        ours, theirs = getattr(columns, name), getattr(fresh, name)
+        labels = {code: label for label, code in ours.categories.items()}
+        fresh_labels = {code: label for label, code in theirs.categories.items()}
+        assert [labels.get(c) for c in ours.codes.tolist()] == [fresh_labels.get(c) for c in theirs.codes.tolist()]
+    for key in StockColumns.SORT_KEYS:
+        for direction in ("asc", "desc"):
+            np.testing.assert_array_equal(columns.order(key, direction), fresh.order(key, direction),
+                                          err_msg=f"{key} {direction}")
+
+def test_batches_match_a_full_rebuild(published):
+    rng = np.random.default_rng(11)
+    pool = list(published.SNAPSHOT.records)
+    for _ in range(25):
+        previous = published.SNAPSHOT
+        records = previous.records
+        picked = [records[i] for i in rng.choice(len(records), 15, replace=False)]
+        # Scores with ties, so the ranking's arrival order and the sort orders' row order both matter
+        batch = rescored(picked, rng.choice([-0.5, 0.0, 0.25, 0.5, 1.0, np.nan], len(picked)))
+        removed = [records[i].symbol for i in rng.choice(len(records), 3, replace=False)]
+        returning = [stock for stock in pool if stock.symbol not in previous.by_symbol][:3]
+        published.update_cache(batch + returning, removed=removed)
+
+        snapshot = published.SNAPSHOT
+        assert snapshot.columns.stocks is snapshot.records
+        assert [stock.symbol for stock in snapshot.records] == published.RANKING.symbols()
+        assert dict(snapshot.ranks) == {stock.symbol: rank for rank, stock in enumerate(snapshot.records, 1)}
+        assert dict(snapshot.by_symbol) == {stock.symbol: stock for stock in snapshot.records}
+        assert all(snapshot.get(symbol) is None and symbol not in snapshot.ranks for symbol in removed)
+        scores = [stability_score(stock) for stock in snapshot.records]
+        assert scores == sorted(scores)
+        assert_same_columns(snapshot.columns, StockColumns(snapshot.records))
+
+        moved = {symbol for symbol, rank in snapshot.ranks.items() if previous.ranks.get(symbol) != rank}
+        gone = set(previous.ranks) - set(snapshot.ranks)
+        replaced = {stock.symbol for stock in batch + returning} - set(removed)
+        assert snapshot.changed == moved | gone | replaced
+        for sector, symbols in snapshot.by_sector.items():
+            assert list(symbols) == [s.symbol for s in snapshot.records if (s.sector or "Unknown") == sector]
+
+def test_removal_wins_over_replacement(published):
+    stock = published.SNAPSHOT.records[0]
+    published.update_cache(rescored([stock], [0.1]), removed=[stock.symbol])
+    assert stock.symbol not in published.SNAPSHOT.ranks
+    assert stock.symbol not in published.RANKING
+
+def test_rank_is_read_from_the_snapshot(reranked):
+    snapshot = reranked.SNAPSHOT
+    dumped = json.loads(dump_stocks(snapshot.records, "summary", None, snapshot.ranks))
+    assert [item["rank"] for item in dumped] == list(range(1, len(dumped) + 1))
+
+def test_snapshot_bytes_are_measured_at_scrape_time(reranked):
+    snapshot = reranked.SNAPSHOT
+    summary = dump_stocks(snapshot.records, "summary", None, snapshot.ranks)
+    assert f"stock_snapshot_bytes {float(len(summary))}" in metrics.REGISTRY.render()
+
+    reranked.update_cache([], removed=[snapshot.records[0].symbol])
+    snapshot = reranked.SNAPSHOT
+    assert reranked.snapshot_bytes() == len(dump_stocks(snapshot.records, "summary", None, snapshot.ranks))
+
+def test_failed_publish_leaves_the_ranking_alone(published, monkeypatch):
+    previous = published.SNAPSHOT
+    records = previous.records
+    batch = rescored([records[-1], records[40]], [0.0, 5.0])
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(published.SectorStats, "build", fail)
+    monkeypatch.setattr(published.SectorStats, "updated", fail)
+    with pytest.raises(RuntimeError):
+        published.update_cache(batch, removed=[records[0].symbol])
+    monkeypatch.undo()
+
+    assert published.SNAPSHOT is previous
+    assert published.RANKING.symbols() == [stock.symbol for stock in records]
+
+    published.update_cache(batch, removed=[records[0].symbol])
+    snapshot = published.SNAPSHOT
+    assert [stock.symbol for stock in snapshot.records] == published.RANKING.symbols()
+    assert snapshot.ranks[batch[0].symbol] == 1
+    assert records[0].symbol not in snapshot.by_symbol
@@ -0,0 +1,154 @@
+import asyncio
+import numpy as np
+import pandas as pd
+import pytest
+from app.config import settings
+from app.services import providers, stocks
+from app.services.providers import MarketDataProvider
+from app.services.store import BAR_DTYPE, BarRing, BarStore, HistoryAdjusted, RingBarStore, to_frame, to_records
+
+def minute_bars(start: int, count: int, price: float = 100.0) -> np.ndarray:
+    """`count` one-minute bars from minute `start` of the 2026-10-16 session, closing at price + minute."""
+    bars = np.zeros(count, dtype=BAR_DTYPE)
+    bars["date"] = np.datetime64("2026-10-16T09:15", "ns") + np.arange(start, start + count) * np.timedelta64(1, "m")
+    bars["Close"] = price + np.arange(start, start + count)
+    return bars
+
+def test_ring_wraps_around():
+    ring = BarRing(5)
+    assert len(ring) == 0 and ring.last_date() is None
+    bars = minute_bars(0, 12)
+    for k, record in enumerate(bars):
+        ring.push(record)
+        assert ring.ordered().tolist() == bars[max(0, k - 4):k + 1].tolist()
+    assert len(ring) == 5 and ring.last_date() == bars["date"][-1]
+
+    # After wrapping, the last bar sits at the start of the slots
+    revised = bars[-1].copy()
+    revised["Close"] = 1.0
+    ring.replace_last(revised)
+    assert ring.ordered().tolist() == bars[-5:-1].tolist() + [revised.tolist()]
+
+def test_ring_reset_keeps_the_latest():
+    ring = BarRing(5)
+    for record in minute_bars(0, 7):
+        ring.push(record)
+    ring.reset(minute_bars(100, 8))
+    assert ring.ordered().tolist() == minute_bars(103, 5).tolist()
+    ring.reset(minute_bars(200, 2))
+    assert len(ring) == 2 and ring.ordered().tolist() == minute_bars(200, 2).tolist()
+
+def merged(store: RingBarStore, bars: np.ndarray) -> int:
+    return store.merge("SYM", to_frame(bars))
+
+def test_merge_revises_and_appends():
+    store = RingBarStore(10)
+    merged(store, minute_bars(0, 8))
+    # Downloads repeat the stored session: the last bar is revised, two are new
+    update = minute_bars(1, 9, price=100.5)
+    assert merged(store, update) == 9
+    expected = np.concatenate([minute_bars(0, 7), update[6:]])
+    assert store.load("SYM").tolist() == expected.tolist()
+    assert store.last_date("SYM") == pd.Timestamp(update["date"][-1])
+    # Older bars than the oldest kept are dropped, the newest ones wrap the ring
+    merged(store, minute_bars(5, 9, price=200.0))
+    assert store.load("SYM").tolist() == np.concatenate([expected[4:9], minute_bars(9, 5, price=200.0)])[-10:].tolist()
+
+def test_merge_fills_a_gap_by_rebuilding():
+    store = RingBarStore(10)
+    first = minute_bars(0, 8)
+    merged(store, np.delete(first, 3))
+    merged(store, minute_bars(2, 8, price=300.0))
+    expected = np.concatenate([first[:2], minute_bars(2, 8, price=300.0)])
+    assert store.load("SYM").tolist() == expected.tolist()
+    assert len(store.read("SYM", lookback=4)) == 4
+    # A download at least as long as the ring replaces it
+    merged(store, minute_bars(50, 12))
+    assert store.load("SYM").tolist() == minute_bars(52, 10).tolist()
+
+def test_frames_round_trip():
+    bars = minute_bars(0, 3)
+    assert to_records(to_frame(bars)).tolist() == bars.tolist()
+
+# --- Daily Store ---
+
+def test_matching_repeats_extend_the_history(tmp_path, frames):
+    store = BarStore(str(tmp_path))
+    df = next(iter(frames.values()))
+    store.merge("SYM", df.iloc[:-2])
+    # Downloads start at the bar before the last, which still matches
+    assert store.check_date("SYM") == df.index[-4]
+    assert store.merge("SYM", df.loc[store.check_date("SYM"):]) == 4
+    assert store.load("SYM").tolist() == to_records(df).tolist()
+    assert store.revision("SYM") == 1
+
+def test_adjusted_history_is_detected(tmp_path, frames):
+    store = BarStore(str(tmp_path))
+    df = next(iter(frames.values()))
+    store.merge("SYM", df.iloc[:-1])
+    # A 2:1 split: every earlier bar is re-adjusted upstream
+    adjusted = df.copy()
+    adjusted[["Open", "High", "Low", "Close"]] /= 2
+    with pytest.raises(HistoryAdjusted):
+        store.merge("SYM", adjusted.loc[store.check_date("SYM"):])
+    assert store.load("SYM").tolist() == to_records(df.iloc[:-1]).tolist()
+    store.replace("SYM", adjusted)
+    assert store.load("SYM").tolist() == to_records(adjusted).tolist()
+    assert store.revision("SYM") == 2
+
+class WindowedProvider(MarketDataProvider):
+    """Serves `frames` for the requested window, like yf.download(group_by='ticker')."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.windows = []
+
+    def download(self, symbols, **window):
+        self.windows.append(window)
+        start = window.get("start")
+        return pd.concat({s: self.frames[s].loc[start:] for s in symbols}, axis=1, names=["Ticker", "Price"])
+
+    def history(self, symbol, period="3mo"):
+        return self.frames[symbol]
+
+    def quote(self, symbol):
+        return {"symbol": symbol}
+
+def test_refresh_replaces_adjusted_histories(tmp_path, frames, monkeypatch):
+    symbols = list(frames)[:3]
+    sample = {symbol: frames[symbol] for symbol in symbols}
+    provider = WindowedProvider({symbol: df.iloc[:-1] for symbol, df in sample.items()})
+    monkeypatch.setattr(stocks, "BAR_STORE", BarStore(str(tmp_path)))
+    monkeypatch.setattr(providers, "_provider", provider)
+    asyncio.run(stocks.fetch_batch_frames(symbols))
+
+    # The next session arrives, and the first symbol went ex-dividend: its older closes moved by 1%
+    provider.frames = dict(sample)
+    provider.frames[symbols[0]] = sample[symbols[0]] * [0.99, 0.99, 0.99, 0.99, 1]
+    result, not_returned = asyncio.run(stocks.fetch_batch_frames(symbols))
+    assert not_returned == []
+    assert provider.windows[-1] == {"period": settings.HISTORY_PERIOD}
+    for symbol in symbols:
+        assert to_records(result[symbol]).tolist() == to_records(provider.frames[symbol]).tolist()
+    assert stocks.BAR_STORE.revision(symbols[0]) == 2 and stocks.BAR_STORE.revision(symbols[1]) == 1
+
+def test_history_columns_follow_the_stored_bars(tmp_path, frames, published, monkeypatch):
+    store = BarStore(str(tmp_path))
+    for symbol, df in frames.items():
+        store.merge(symbol, df.iloc[:-1])
+    monkeypatch.setattr(stocks, "BAR_STORE", store)
+    monkeypatch.setattr(stocks, "_HISTORY", (frozenset(), None))
+    history = asyncio.run(stocks.get_history_columns())
+
+    # A publish that stores no new session reuses the loaded history
+    records = published.SNAPSHOT.records
+    published.update_cache([records[0].model_copy(update={"current_price": records[0].current_price + 1})])
+    assert asyncio.run(stocks.get_history_columns()) is history
+
+    symbol, df = next(iter(frames.items()))
+    store.merge(symbol, df.iloc[-2:])
+    extended = asyncio.run(stocks.get_history_columns())
+    assert extended is not history and extended.dates[-1] == df.index[-1]
+
+    store.replace(symbol, df)
+    assert asyncio.run(stocks.get_history_columns()) is not extended
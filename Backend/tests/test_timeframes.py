@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from app.services import stocks
+from app.services.store import BAR_DTYPE, to_records
+from app.services.timeframes import ResampledBars, aggregate, bucket_starts
+
+def dates(*values):
+    return np.array(values, dtype="datetime64[ns]")
+
+@pytest.mark.parametrize("timeframe, given, expected", [
+    # Intraday buckets are anchored at the 09:15 open
+    ("15m", "2026-10-16T09:15", "2026-10-16T09:15"),
+    ("15m", "2026-10-16T09:29:59", "2026-10-16T09:15"),
+    ("15m", "2026-10-16T09:30", "2026-10-16T09:30"),
+    ("15m", "2026-10-16T09:14", "2026-10-16T09:00"),
+    ("1h", "2026-10-16T10:14", "2026-10-16T09:15"),
+    ("1h", "2026-10-16T15:29", "2026-10-16T15:15"),
+    ("1d", "2026-10-16T15:29", "2026-10-16"),
+    # Weeks start on Monday (2026-10-12)
+    ("1w", "2026-10-12", "2026-10-12"),
+    ("1w", "2026-10-18T23:59", "2026-10-12"),
+    ("1w", "2026-10-19", "2026-10-19"),
+    ("1w", "2026-01-01", "2025-12-29"),
+    ("1mo", "2026-10-31T23:59", "2026-10-01"),
+    ("1mo", "2026-11-01", "2026-11-01"),
+    ("1mo", "2024-02-29", "2024-02-01"),
+])
+def test_bucket_starts(timeframe, given, expected):
+    assert bucket_starts(dates(given), timeframe)[0] == np.datetime64(expected, "ns")
+
+def test_unknown_timeframe():
+    with pytest.raises(ValueError):
+        bucket_starts(dates("2026-10-16"), "2w")
+
+def bars(*rows):
+    return np.array([(np.datetime64(date, "ns"), *values) for date, *values in rows], dtype=BAR_DTYPE)
+
+def test_aggregate_reduces_each_symbol_and_bucket():
+    a = bars(
+        ("2026-10-15", 10, 12, 9, 11, 100),   # Thursday
+        ("2026-10-16", 11, 15, 10, 14, 200),  # Friday
+        ("2026-10-19", 14, 14, 8, 9, 50),     # Monday
+    )
+    # Same weeks as `a`: runs of equal buckets must not merge across symbols
+    b = bars(("2026-10-16", 5, 6, 4, 5, 10), ("2026-10-19", 5, 7, 5, 6, 20))
+    result = aggregate({"A": a, "EMPTY": a[:0], "B": b}, "1w")
+    assert list(result) == ["A", "B"]
+    assert result["A"].tolist() == bars(
+        ("2026-10-12", 10, 15, 9, 14, 300),
+        ("2026-10-19", 14, 14, 8, 9, 50),
+    ).tolist()
+    assert result["B"].tolist() == bars(
+        ("2026-10-12", 5, 6, 4, 5, 10),
+        ("2026-10-19", 5, 7, 5, 6, 20),
+    ).tolist()
+    assert aggregate({"EMPTY": a[:0]}, "1w") == {}
+
+def test_resampled_updates_match_a_full_aggregate(frames):
+    records = {symbol: to_records(df) for symbol, df in list(frames.items())[:10]}
+    weekly = ResampledBars("1w", 8)
+    weekly.update({symbol: history[:-20] for symbol, history in records.items()})
+    weekly.update({symbol: history[:-7] for symbol, history in records.items()})
+    result = weekly.update(records)
+    full = aggregate(records, "1w")
+    for symbol in records:
+        assert result[symbol].tolist() == full[symbol][-8:].tolist()
+
+@pytest.fixture
+def client(published, frames, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    # The stored history is the fixture's 63 sessions (4 months)
+    records = {symbol: to_records(df) for symbol, df in frames.items()}
+    monkeypatch.setattr(stocks.BAR_STORE, "load", lambda symbol: records[symbol])
+    monkeypatch.setattr(stocks, "TIMEFRAME_VIEWS", {})
+    return TestClient(app)
+
+def test_timeframe_with_enough_history(client, published):
+    response = client.get("/api/v1/stocks/fno?timeframe=1w")
+    assert response.status_code == 200
+    assert {s["symbol"] for s in response.json()} == set(published.SNAPSHOT.by_symbol)
+
+def test_timeframe_without_enough_history(client):
+    response = client.get("/api/v1/stocks/fno?timeframe=1mo")
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Insufficient history for timeframe 1mo: no symbol has 5 bars")
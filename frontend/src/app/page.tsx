@@ -3,7 +3,7 @@
 import { useState } from "react";
 import StocksTable from "@/components/StocksTable";
 import FiltersPanel from "@/components/FiltersPanel";
-import { useStocks } from "@/hooks/useStocks";
+import { useStocks, useMarketStream } from "@/hooks/useStocks";
 
 export default function Home() {
   const [filters, setFilters] = useState<any>({});
@@ -19,6 +19,7 @@ export default function Home() {
   };
 
   const { data: stocks, isLoading, error } = useStocks(queryFilters);
+  useMarketStream("all", ["stocks"]);
 
   const handleSort = (key: string) => {
     setSortConfig((current) => ({
@@ -1,11 +1,12 @@
 "use client";
 
 import StocksTable from "@/components/StocksTable";
-import { useWatchlist } from "@/hooks/useStocks";
+import { useWatchlist, useMarketStream } from "@/hooks/useStocks";
 import { useState } from "react";
 
 export default function WatchlistPage() {
     const { data: stocks, isLoading } = useWatchlist();
+    useMarketStream("watchlist", ["watchlist"]);
     const [sortConfig, setSortConfig] = useState<{ key: string; direction: "asc" | "desc" }>({ key: "avg_3_day_change_pct", direction: "desc" });
 
     const handleSort = (key: string) => {
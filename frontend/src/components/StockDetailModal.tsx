@@ -1,6 +1,6 @@
 "use client";
 
-import { Stock, useStockDetail, ChartDataPoint } from "@/hooks/useStocks";
+import { Stock, useStockDetail, useStockChart, ChartDataPoint } from "@/hooks/useStocks";
 import { X, TrendingUp, TrendingDown, Activity, BarChart2 } from "lucide-react";
 import { Line, LineChart, ResponsiveContainer, Tooltip, XAxis, YAxis, BarChart, Bar, ComposedChart, ReferenceLine, Area, AreaChart } from "recharts";
 import { format } from "date-fns";
@@ -12,15 +12,16 @@ interface StockDetailModalProps {
 }
 
 export default function StockDetailModal({ stock: initialStock, onClose }: StockDetailModalProps) {
-    // We use the hook to fetch detailed data including chart_data
-    const { data: detailedStock, isLoading } = useStockDetail(initialStock?.symbol || null);
+    // Fresh summary for the header, and the chart fetched lazily on its own endpoint
+    const { data: detailedStock } = useStockDetail(initialStock?.symbol || null);
+    const { data: chartPoints, isLoading } = useStockChart(initialStock?.symbol || null);
 
-    // Use detailed stock if available, otherwise fallback to initial stock (which has no chart data)
+    // Use detailed stock if available, otherwise fallback to initial stock
     const stock = detailedStock || initialStock;
 
     if (!stock) return null;
 
-    const chartData = stock.chart_data || [];
+    const chartData = chartPoints || [];
     const hasChartData = chartData.length > 0;
 
     // Calculate price change for header
@@ -1,3 +1,4 @@
+import { useEffect } from "react";
 import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
 import axios from "axios";
 
@@ -17,6 +18,16 @@ export interface ChartDataPoint {
     ema_50?: number;
 }
 
+// /chart?format=columns: one array per field instead of one object per point
+export type ChartColumns = { [K in keyof ChartDataPoint]-?: ChartDataPoint[K][] };
+
+function chartPoints(columns: ChartColumns): ChartDataPoint[] {
+    const fields = Object.keys(columns) as (keyof ChartDataPoint)[];
+    return columns.date.map((_, i) =>
+        Object.fromEntries(fields.map((field) => [field, columns[field][i]])) as unknown as ChartDataPoint
+    );
+}
+
 export interface Stock {
     symbol: string;
     name?: string;
@@ -77,6 +88,9 @@ export function useStocks(filters: any) {
                 }
             });
 
+            // The table never draws charts, so skip chart_data
+            params.append("view", "summary");
+
             const url = `${API_URL}/stocks/fno`;
             const { data } = await axios.get<Stock[]>(url, { params });
             return data;
@@ -91,7 +105,7 @@ export function useStockDetail(symbol: string | null) {
         queryKey: ["stock", symbol],
         queryFn: async () => {
             if (!symbol) return null;
-            const { data } = await axios.get<Stock>(`${API_URL}/stocks/${symbol}`);
+            const { data } = await axios.get<Stock>(`${API_URL}/stocks/${symbol}`, { params: { view: "summary" } });
             return data;
         },
         enabled: !!symbol,
@@ -99,11 +113,26 @@ export function useStockDetail(symbol: string | null) {
     });
 }
 
+export function useStockChart(symbol: string | null) {
+    return useQuery({
+        queryKey: ["stock-chart", symbol],
+        queryFn: async () => {
+            if (!symbol) return [];
+            const { data } = await axios.get<ChartColumns>(`${API_URL}/stocks/${symbol}/chart`, {
+                params: { format: "columns" },
+            });
+            return chartPoints(data);
+        },
+        enabled: !!symbol,
+        refetchInterval: 60000,
+    });
+}
+
 export function useWatchlist() {
     return useQuery({
         queryKey: ["watchlist"],
         queryFn: async () => {
-            const { data } = await axios.get<Stock[]>(`${API_URL}/watchlist`);
+            const { data } = await axios.get<Stock[]>(`${API_URL}/watchlist`, { params: { view: "summary" } });
             return data;
         },
         refetchInterval: 5000,
@@ -128,7 +157,7 @@ export function useGainers3Day() {
     return useQuery({
         queryKey: ["stocks", "gainers-3day"],
         queryFn: async () => {
-            const { data } = await axios.get<Stock[]>(`${API_URL}/stocks/gainers-3day`);
+            const { data } = await axios.get<Stock[]>(`${API_URL}/stocks/gainers-3day`, { params: { view: "summary" } });
             return data;
         },
         refetchInterval: 15000,
@@ -139,9 +168,49 @@ export function useLosers3Day() {
     return useQuery({
         queryKey: ["stocks", "losers-3day"],
         queryFn: async () => {
-            const { data } = await axios.get<Stock[]>(`${API_URL}/stocks/losers-3day`);
+            const { data } = await axios.get<Stock[]>(`${API_URL}/stocks/losers-3day`, { params: { view: "summary" } });
             return data;
         },
         refetchInterval: 15000,
     });
 }
+
+export interface SectorSummary {
+    sector: string;
+    stocks: number;
+    avg_change_pct?: number;
+    avg_3_day_change_pct?: number;
+    gainers_pct?: number;
+    uptrend_pct?: number;
+    high_volume_pct?: number;
+    avg_buyer_strength?: number;
+}
+
+export function useSectors() {
+    return useQuery({
+        queryKey: ["sectors"],
+        queryFn: async () => {
+            const { data } = await axios.get<{ market: SectorSummary; sectors: SectorSummary[] }>(`${API_URL}/sectors`);
+            return data;
+        },
+        refetchInterval: 15000,
+    });
+}
+
+// Refetches the given queries whenever the server pushes an update for the
+// subscription, instead of waiting for the next poll.
+export function useMarketStream(scope: "all" | "sector" | "watchlist", queryKey: string[], sector?: string) {
+    const queryClient = useQueryClient();
+    const key = JSON.stringify(queryKey);
+
+    useEffect(() => {
+        const params = new URLSearchParams({ scope });
+        if (sector) params.append("sector", sector);
+
+        const source = new EventSource(`${API_URL}/stream?${params}`);
+        const refetch = () => queryClient.invalidateQueries({ queryKey: JSON.parse(key) });
+        source.addEventListener("update", refetch);
+        source.addEventListener("resync", refetch);
+        return () => source.close();
+    }, [scope, sector, key, queryClient]);
+}